@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, BlogPost, Tag, Like, Comment, FailedLoginAttempt
+from .models import User, BlogPost, Tag, Like, Comment, FailedLoginAttempt, ModerationJob
 
 # all the tables registered here are shown and managed in the admin side of website
 # admin site is built-in in django
@@ -13,9 +13,9 @@ class UserAdmin(admin.ModelAdmin):
 
 @admin.register(BlogPost)
 class BlogPostAdmin(admin.ModelAdmin):
-    list_display = ("post_id", "title", "user", "created_at")
+    list_display = ("post_id", "title", "user", "status", "likes_count", "comments_count", "created_at")
     search_fields = ("title", "user__email")
-    list_filter = ("created_at",)
+    list_filter = ("status", "created_at")
     ordering = ("-created_at",)
 
 @admin.register(Tag)
@@ -38,4 +38,10 @@ class CommentAdmin(admin.ModelAdmin):
 class FailedLoginAttemptAdmin(admin.ModelAdmin):
     list_display = ("user", "timestamp")
     search_fields = ("user__email", "timestamp")
-    list_filter = ("timestamp",)
\ No newline at end of file
+    list_filter = ("timestamp",)
+
+@admin.register(ModerationJob)
+class ModerationJobAdmin(admin.ModelAdmin):
+    list_display = ("job_id", "post", "status", "attempts", "run_after", "created_at")
+    list_filter = ("status",)
+    search_fields = ("post__title",)
\ No newline at end of file
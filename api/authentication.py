@@ -0,0 +1,120 @@
+import copy
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+# one JWT check per request
+# TokenMiddleware authenticates with this class and leaves the result on the
+# request; DRF (DEFAULT_AUTHENTICATION_CLASSES) then reuses it instead of
+# decoding the token and loading the user again.
+# Users are served from an in-process cache for USER_CACHE_TTL seconds;
+# saving or deleting a User evicts the entry once the change commits, other
+# processes see the change when their entry expires.
+
+
+class UserCache:
+    """LRU of User rows keyed by the token's user id, entries expire after `ttl` seconds."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        if self.ttl <= 0:
+            return None
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(str(user_id))
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires <= now:
+                del self._entries[str(user_id)]
+                return None
+            self._entries.move_to_end(str(user_id))
+        # each request gets its own instance, views may change and save it
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[str(user_id)] = (copy.copy(user), monotonic() + self.ttl)
+            self._entries.move_to_end(str(user_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+
+
+class SharedJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        # DRF's Request wraps the HttpRequest TokenMiddleware saw
+        http_request = getattr(request, "_request", request)
+        if hasattr(http_request, "jwt_auth"):
+            return http_request.jwt_auth
+        result = super().authenticate(request)
+        http_request.jwt_auth = result
+        return result
+
+    def get_user(self, validated_token):
+        # JWTAuthentication.get_user() with the SELECT behind user_cache
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(user_id, user)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
+
+
+def forget_user(user):
+    """Drop `user` from this process's user cache after the current transaction commits."""
+    user_id = getattr(user, api_settings.USER_ID_FIELD)
+    transaction.on_commit(lambda: user_cache.forget(user_id))
+
+
+# keep the cache from serving the old row (password changes, deactivation,
+# profile edits); queryset update() calls don't evict
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance)
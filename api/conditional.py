@@ -0,0 +1,70 @@
+import hashlib
+
+from django.views.decorators.http import condition
+
+from .listing import InvalidTagFilter
+from .models import BlogPost
+from .pagination import InvalidCursor, paginate_blogs
+
+# ETag / Last-Modified for blog_detail and the blog listings
+# validators are computed from post_id, updated_at and the counters only,
+# so a 304 costs one indexed lookup and never loads post bodies.
+# updated_at is touched by likes and comments too (see views), so it moves
+# whenever anything shown for the post changes.
+
+
+def make_etag(request, parts):
+    raw = "|".join([
+        request.path,
+        repr(sorted((k, v) for k, values in request.GET.lists() for v in values)),
+        # the browsable API and JSON clients get different bodies
+        request.META.get("HTTP_ACCEPT", ""),
+        repr(parts),
+    ])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _post_state(request, post_id):
+    # etag and last_modified are asked separately, look the row up once
+    if not hasattr(request, "_post_state"):
+        request._post_state = (
+            BlogPost.objects.filter(post_id=post_id, status=BlogPost.PUBLISHED)
+            .values_list("updated_at", "likes_count", "comments_count")
+            .first()
+        )
+    return request._post_state
+
+
+def post_etag(request, post_id):
+    state = _post_state(request, post_id)
+    # unpublished posts depend on who is asking, leave them alone
+    if state is None:
+        return None
+    return make_etag(request, state)
+
+
+def post_last_modified(request, post_id):
+    state = _post_state(request, post_id)
+    return state[0] if state else None
+
+
+def listing_etag(blogs):
+    """
+    etag_func for a listing view; `blogs(request, **kwargs)` returns the
+    view's filtered BlogPost queryset. Only the page's keys are loaded.
+
+    There is no Last-Modified here: a post leaving the listing (rejected
+    by moderation) doesn't move the newest updated_at of what remains.
+    """
+    def etag_func(request, *args, **kwargs):
+        try:
+            page_blogs = blogs(request, **kwargs).only("post_id", "created_at", "updated_at")
+            page, next_cursor = paginate_blogs(page_blogs, request)
+        except (InvalidCursor, InvalidTagFilter):
+            # the view answers 400
+            return None
+        return make_etag(request, ([(b.post_id, b.updated_at) for b in page], next_cursor))
+    return etag_func
+
+
+post_conditional = condition(etag_func=post_etag, last_modified_func=post_last_modified)
@@ -0,0 +1,38 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import BlogPost, Comment, Like
+
+# helpers for the denormalized BlogPost.likes_count / comments_count columns
+
+
+def count_subquery(model):
+    """Number of `model` rows pointing at the outer BlogPost, 0 if none."""
+    counts = (
+        model.objects.filter(post=OuterRef("pk"))
+        .order_by()
+        .values("post")
+        .annotate(n=Count("pk"))
+        .values("n")[:1]
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def reconcile_counters(batch_size=1000):
+    """Recount likes/comments for posts whose stored counters drifted. Returns how many were fixed."""
+    drifted = (
+        BlogPost.objects.annotate(
+            real_likes=count_subquery(Like),
+            real_comments=count_subquery(Comment),
+        )
+        .exclude(likes_count=F("real_likes"), comments_count=F("real_comments"))
+        .values_list("pk", flat=True)
+    )
+    drifted_ids = list(drifted)
+
+    for start in range(0, len(drifted_ids), batch_size):
+        BlogPost.objects.filter(pk__in=drifted_ids[start:start + batch_size]).update(
+            likes_count=count_subquery(Like),
+            comments_count=count_subquery(Comment),
+        )
+    return len(drifted_ids)
@@ -0,0 +1,70 @@
+import os
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# image preprocessing for uploads (api/uploads.py)
+# check_image() runs in the request and only reads the header; prepare_image()
+# runs in the upload worker: it downsizes to IMAGE_MAX_WIDTH x IMAGE_MAX_HEIGHT,
+# applies the EXIF orientation and re-encodes without the metadata (EXIF, GPS,
+# comments). JPEGs are decoded at a reduced scale (draft mode), so a large
+# phone photo is never fully decoded in memory.
+
+ALLOWED_FORMATS = ("JPEG", "PNG", "WEBP", "GIF")
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def check_image(file):
+    """Validate an uploaded image from its header; the file is rewound afterwards."""
+    try:
+        with Image.open(file) as image:
+            image_format, (width, height) = image.format, image.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise InvalidImage("The file is not a supported image.")
+    finally:
+        file.seek(0)
+
+    if image_format not in ALLOWED_FORMATS:
+        raise InvalidImage(f"Unsupported image type, use one of: {', '.join(ALLOWED_FORMATS)}.")
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise InvalidImage("The image has too many pixels.")
+    return image_format
+
+
+def prepare_image(path):
+    """
+    Write the resized, re-encoded copy of the image at `path` next to it and
+    return the new path (.jpg, or .png when the image has transparency).
+    """
+    max_size = (settings.IMAGE_MAX_WIDTH, settings.IMAGE_MAX_HEIGHT)
+    with Image.open(path) as source:
+        # JPEG only: let the decoder scale down by 1/2, 1/4 or 1/8 while reading
+        source.draft("RGB", max_size)
+        # rotate now, the orientation tag is dropped with the rest of the EXIF data
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+        icc_profile = source.info.get("icc_profile")
+        transparent = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        if transparent:
+            image = image.convert("RGBA")
+            out_path, params = os.path.splitext(path)[0] + ".prepared.png", {
+                "format": "PNG",
+                "optimize": True,
+            }
+        else:
+            image = image.convert("RGB")
+            out_path, params = os.path.splitext(path)[0] + ".prepared.jpg", {
+                "format": "JPEG",
+                "quality": settings.IMAGE_JPEG_QUALITY,
+                "optimize": True,
+                "progressive": True,
+            }
+        # the colour profile is not metadata about the user, keep it
+        if icc_profile:
+            params["icc_profile"] = icc_profile
+        image.save(out_path, **params)
+    return out_path
@@ -0,0 +1,434 @@
+import bisect
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+
+from .porter import stem
+
+# pure-Python inverted index over post titles/contents
+# used for search when the SQLite build has no FTS5 (see api/search.py).
+#
+# Every time a post is (re)indexed it gets a new document number (docnum);
+# posting lists are array('I') of docnums with a parallel array of packed
+# term frequencies, so they only ever grow at the end. Docnums that are no
+# longer the current one for their post are skipped at query time and
+# dropped by compact(). A saved snapshot is mmapped on load: posting lists
+# stay in the file until a term is written to.
+
+_TOKEN = re.compile(r"\w+")
+
+# WWINDEX1 snapshots hold unstemmed terms
+MAGIC = b"WWINDEX2"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# a prefix query expands to at most this many terms
+MAX_PREFIX_TERMS = 200
+# compact once dead docnums outnumber this share of live ones
+COMPACT_RATIO = 0.25
+
+
+def tokenize(text):
+    """Index terms of `text`, the way blog_post_fts's "porter unicode61" tokenizer makes them."""
+    text = text.lower()
+    if not text.isascii():
+        # fold accents the same way the FTS5 tokenizer does (remove_diacritics)
+        text = "".join(
+            c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c)
+        )
+    return [stem(token) for token in _TOKEN.findall(text)]
+
+
+def signature(*parts):
+    """Stable 64 bit fingerprint of what a post was indexed from."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def pack_tf(title_tf, content_tf):
+    return (min(title_tf, 0xFFFF) << 16) | min(content_tf, 0xFFFF)
+
+
+class InvertedIndex:
+    def __init__(self, title_weight=5.0, content_weight=1.0):
+        self.title_weight = title_weight
+        self.content_weight = content_weight
+
+        # per docnum
+        self.doc_post = array("I")
+        self.doc_title_len = array("I")
+        self.doc_content_len = array("I")
+        self.doc_user = array("I")
+        self.doc_sig = array("q")
+        self.doc_tags = []
+
+        # post_id -> its live docnum
+        self.current = {}
+        self.title_total = 0
+        self.content_total = 0
+
+        # every known term, sorted (for prefix queries)
+        self.terms = []
+        # term -> (docnums, packed tfs) for terms built or changed in memory
+        self.postings = {}
+        # term -> position in the mmapped snapshot, for terms not yet changed
+        self._snap_terms = {}
+        self._snap = None
+
+        self._lock = threading.RLock()
+
+    # writes
+
+    def add(self, post_id, title, content, user_id, tag_ids=(), sig=None):
+        """Index a post, replacing any earlier version. Returns False if `sig` says it is unchanged."""
+        title_tf = Counter(tokenize(title))
+        content_tf = Counter(tokenize(content))
+
+        with self._lock:
+            old = self.current.get(post_id)
+            if old is not None:
+                if sig is not None and self.doc_sig[old] == sig:
+                    return False
+                self._kill(old)
+
+            docnum = len(self.doc_post)
+            title_len = sum(title_tf.values())
+            content_len = sum(content_tf.values())
+            self.doc_post.append(post_id)
+            self.doc_title_len.append(title_len)
+            self.doc_content_len.append(content_len)
+            self.doc_user.append(user_id)
+            self.doc_sig.append(sig or 0)
+            self.doc_tags.append(tuple(tag_ids))
+
+            # the hot loop of a build, kept free of calls where possible
+            postings = self.postings
+            for term, count in content_tf.items():
+                entry = postings.get(term) or self._writable(term)
+                entry[0].append(docnum)
+                if term in title_tf or count > 0xFFFF:
+                    count = pack_tf(title_tf[term], count)
+                entry[1].append(count)
+            for term, count in title_tf.items():
+                if term not in content_tf:
+                    entry = postings.get(term) or self._writable(term)
+                    entry[0].append(docnum)
+                    entry[1].append(pack_tf(count, 0))
+
+            self.current[post_id] = docnum
+            self.title_total += title_len
+            self.content_total += content_len
+        return True
+
+    def remove(self, post_id):
+        with self._lock:
+            docnum = self.current.get(post_id)
+            if docnum is not None:
+                self._kill(docnum)
+
+    def _kill(self, docnum):
+        del self.current[self.doc_post[docnum]]
+        self.title_total -= self.doc_title_len[docnum]
+        self.content_total -= self.doc_content_len[docnum]
+
+    def _writable(self, term):
+        postings = self.postings.get(term)
+        if postings is not None:
+            return postings
+
+        docs, tfs = array("I"), array("I")
+        if term in self._snap_terms:
+            # copy the list out of the snapshot the first time it changes
+            snap_docs, snap_tfs = self._snap_postings(term)
+            docs.frombytes(snap_docs.cast("B"))
+            tfs.frombytes(snap_tfs.cast("B"))
+            del self._snap_terms[term]
+        else:
+            bisect.insort(self.terms, term)
+        self.postings[term] = (docs, tfs)
+        return docs, tfs
+
+    @property
+    def dead(self):
+        return len(self.doc_post) - len(self.current)
+
+    def needs_compaction(self):
+        return self.dead > max(1000, COMPACT_RATIO * len(self.current))
+
+    def compact(self):
+        """Drop dead docnums and renumber the live ones."""
+        with self._lock:
+            renumber = {}
+            for docnum in sorted(self.current.values()):
+                renumber[docnum] = len(renumber)
+
+            def keep(values, typecode):
+                return array(typecode, (values[d] for d in renumber))
+
+            self.doc_post = keep(self.doc_post, "I")
+            self.doc_title_len = keep(self.doc_title_len, "I")
+            self.doc_content_len = keep(self.doc_content_len, "I")
+            self.doc_user = keep(self.doc_user, "I")
+            self.doc_sig = keep(self.doc_sig, "q")
+            self.doc_tags = [self.doc_tags[d] for d in renumber]
+            self.current = {self.doc_post[d]: d for d in range(len(self.doc_post))}
+
+            postings = {}
+            terms = []
+            for term in self.terms:
+                docs, tfs = self._get(term)
+                new_docs, new_tfs = array("I"), array("I")
+                for docnum, tf in zip(docs, tfs):
+                    new = renumber.get(docnum)
+                    if new is not None:
+                        new_docs.append(new)
+                        new_tfs.append(tf)
+                if new_docs:
+                    postings[term] = (new_docs, new_tfs)
+                    terms.append(term)
+
+            self.postings = postings
+            self.terms = terms
+            self._snap_terms = {}
+            self._snap = None
+
+    # reads
+
+    def _get(self, term):
+        postings = self.postings.get(term)
+        if postings is not None:
+            return postings
+        if term in self._snap_terms:
+            return self._snap_postings(term)
+        return None
+
+    def _snap_postings(self, term):
+        offsets, docs, tfs = self._snap
+        i = self._snap_terms[term]
+        start, end = offsets[i], offsets[i + 1]
+        return docs[start:end], tfs[start:end]
+
+    def _prefix_terms(self, prefix):
+        i = bisect.bisect_left(self.terms, prefix)
+        found = []
+        while i < len(self.terms) and self.terms[i].startswith(prefix):
+            found.append(self.terms[i])
+            if len(found) >= MAX_PREFIX_TERMS:
+                break
+            i += 1
+        return found
+
+    def search(self, q, limit, user_id=None, tag_id=None, after=None):
+        """
+        Best `limit` matches for `q` as [(rank, post_id)], rank ascending
+        (like FTS5's bm25(), lower is better). Every word must match, the
+        last one as a prefix. `after` is the (rank, post_id) to continue from.
+        """
+        words = tokenize(q)
+        if not words:
+            return []
+
+        with self._lock:
+            live = len(self.current)
+            if not live:
+                return []
+            avg_title = self.title_total / live or 1.0
+            avg_content = self.content_total / live or 1.0
+
+            # one group of posting lists per query word
+            groups = []
+            for i, word in enumerate(words):
+                expansions = self._prefix_terms(word) if i == len(words) - 1 else [word]
+                lists = [p for p in map(self._get, expansions) if p is not None]
+                if not lists:
+                    return []
+                groups.append(lists)
+            # intersect starting from the rarest word
+            groups.sort(key=lambda lists: sum(len(docs) for docs, _ in lists))
+
+            k1, b = BM25_K1, BM25_B
+            wt, wc = self.title_weight, self.content_weight
+            doc_title_len, doc_content_len = self.doc_title_len, self.doc_content_len
+
+            scores = None
+            for lists in groups:
+                group_scores = {}
+                for docs, tfs in lists:
+                    df = len(docs)
+                    idf = max(math.log(1 + (live - df + 0.5) / (df + 0.5)), 1e-6)
+                    for docnum, tf in zip(docs, tfs):
+                        if scores is not None and docnum not in scores:
+                            continue
+                        content_tf = tf & 0xFFFF
+                        score = 0.0
+                        if content_tf:
+                            norm = k1 * (1 - b + b * doc_content_len[docnum] / avg_content)
+                            score = wc * content_tf * (k1 + 1) / (content_tf + norm)
+                        if tf > 0xFFFF:
+                            title_tf = tf >> 16
+                            norm = k1 * (1 - b + b * doc_title_len[docnum] / avg_title)
+                            score += wt * title_tf * (k1 + 1) / (title_tf + norm)
+                        group_scores[docnum] = group_scores.get(docnum, 0.0) + idf * score
+
+                if scores is None:
+                    scores = group_scores
+                else:
+                    scores = {d: scores[d] + s for d, s in group_scores.items()}
+                if not scores:
+                    return []
+
+            ranked = []
+            for docnum, score in scores.items():
+                post_id = self.doc_post[docnum]
+                if self.current.get(post_id) != docnum:
+                    continue
+                if user_id is not None and self.doc_user[docnum] != user_id:
+                    continue
+                if tag_id is not None and tag_id not in self.doc_tags[docnum]:
+                    continue
+                key = (-score, post_id)
+                if after is not None and key <= after:
+                    continue
+                ranked.append(key)
+
+        return heapq.nsmallest(limit, ranked)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "posts": len(self.current),
+                "dead_docnums": self.dead,
+                "terms": len(self.terms),
+                "postings_in_memory": sum(len(docs) for docs, _ in self.postings.values()),
+                "terms_in_snapshot": len(self._snap_terms),
+            }
+
+    # snapshots
+
+    def save(self, path, meta=None):
+        """Write a compacted snapshot to `path` (atomically, via a temp file)."""
+        with self._lock:
+            self.compact()
+
+            offsets = array("I", [0])
+            docs, tfs = array("I"), array("I")
+            for term in self.terms:
+                term_docs, term_tfs = self.postings[term]
+                docs.extend(term_docs)
+                tfs.extend(term_tfs)
+                offsets.append(len(docs))
+
+            tag_offsets = array("I", [0])
+            tag_ids = array("I")
+            for tags in self.doc_tags:
+                tag_ids.extend(tags)
+                tag_offsets.append(len(tag_ids))
+
+            sections = [
+                ("doc_sig", self.doc_sig),
+                ("doc_post", self.doc_post),
+                ("doc_title_len", self.doc_title_len),
+                ("doc_content_len", self.doc_content_len),
+                ("doc_user", self.doc_user),
+                ("tag_offsets", tag_offsets),
+                ("tag_ids", tag_ids),
+                ("term_offsets", offsets),
+                ("postings_docs", docs),
+                ("postings_tfs", tfs),
+                ("terms", "\n".join(self.terms).encode()),
+            ]
+
+            layout = {}
+            position = 0
+            for name, data in sections:
+                size = len(data) * getattr(data, "itemsize", 1)
+                typecode = getattr(data, "typecode", "B")
+                layout[name] = [position, len(data), typecode]
+                # keep every section 8 byte aligned so it can be cast in place
+                position += size + (-size % 8)
+
+            header = json.dumps({
+                "byteorder": sys.byteorder,
+                "title_weight": self.title_weight,
+                "content_weight": self.content_weight,
+                "sections": layout,
+                "meta": meta or {},
+            }).encode()
+
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(MAGIC)
+                f.write(len(header).to_bytes(4, "little"))
+                f.write(header)
+                f.write(b"\0" * (-f.tell() % 8))
+                for name, data in sections:
+                    raw = data if isinstance(data, bytes) else data.tobytes()
+                    f.write(raw)
+                    f.write(b"\0" * (-len(raw) % 8))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Open a snapshot written by save(). Posting lists are read straight
+        from the mmapped file; returns (index, meta) or None if unusable.
+        """
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if mapped[: len(MAGIC)] != MAGIC:
+            return None
+        header_len = int.from_bytes(mapped[8:12], "little")
+        header = json.loads(mapped[12 : 12 + header_len])
+        if header["byteorder"] != sys.byteorder:
+            return None
+        base = 12 + header_len
+        base += -base % 8
+
+        view = memoryview(mapped)
+
+        def section(name):
+            position, count, typecode = header["sections"][name]
+            start = base + position
+            raw = view[start : start + count * array(typecode).itemsize]
+            return raw.cast(typecode) if typecode != "B" else raw
+
+        def copied(name):
+            position, count, typecode = header["sections"][name]
+            values = array(typecode)
+            values.frombytes(section(name).cast("B"))
+            return values
+
+        index = cls(header["title_weight"], header["content_weight"])
+        index.doc_post = copied("doc_post")
+        index.doc_title_len = copied("doc_title_len")
+        index.doc_content_len = copied("doc_content_len")
+        index.doc_user = copied("doc_user")
+        index.doc_sig = copied("doc_sig")
+
+        tag_offsets, tag_ids = section("tag_offsets"), section("tag_ids")
+        index.doc_tags = [
+            tuple(tag_ids[tag_offsets[d] : tag_offsets[d + 1]])
+            for d in range(len(index.doc_post))
+        ]
+        index.current = {post_id: docnum for docnum, post_id in enumerate(index.doc_post)}
+        index.title_total = sum(index.doc_title_len)
+        index.content_total = sum(index.doc_content_len)
+
+        terms_blob = bytes(section("terms")).decode()
+        index.terms = terms_blob.split("\n") if terms_blob else []
+        index._snap_terms = {term: i for i, term in enumerate(index.terms)}
+        index._snap = (section("term_offsets"), section("postings_docs"), section("postings_tfs"))
+        return index, header["meta"]
@@ -0,0 +1,262 @@
+import heapq
+import threading
+from datetime import timedelta
+from time import monotonic
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import BlogPost, LeaderboardEntry, PostEngagementBucket
+
+# top liked / most commented leaderboards
+# each (metric, window) board keeps its best posts in memory and is updated
+# on every like/unlike/comment/delete, so reading the top K never runs an
+# aggregate; it is rebuilt from the DB only when it can no longer prove its
+# top K is exact, or every LEADERBOARD_REFRESH_INTERVAL seconds so windowed
+# scores age out. Reads never write: `manage.py refresh_leaderboards` saves
+# the boards to leaderboard_entry for cold starts and deletes old buckets.
+
+METRICS = ("likes", "comments")
+
+WINDOWS = {
+    "all": None,
+    "7d": timedelta(days=7),
+    "24h": timedelta(hours=24),
+}
+
+# buckets older than the longest window are never read again
+BUCKET_RETENTION = timedelta(days=7)
+
+
+def bucket_hour(at):
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+class Board:
+    """
+    Up to `capacity` (score, post_id) candidates for one leaderboard.
+
+    `outside` is an upper bound on the key of every post that isn't a
+    candidate; the top K is exact as long as the K-th candidate beats it.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.scores = {}
+        self.outside = None
+        self.built_at = None
+
+    def load(self, rows, complete):
+        """`rows` is [(post_id, score)], best first; `complete` if nothing else scores."""
+        self.scores = dict(rows[: self.capacity])
+        self.outside = None
+        if not complete and rows:
+            post_id, score = rows[-1]
+            self.outside = (score, post_id)
+        self.built_at = monotonic()
+
+    def update(self, post_id, score):
+        key = (score, post_id)
+        if post_id in self.scores or len(self.scores) < self.capacity:
+            self.scores[post_id] = score
+            if score <= 0:
+                del self.scores[post_id]
+            return
+
+        lowest = min((s, p) for p, s in self.scores.items())
+        if key > lowest:
+            del self.scores[lowest[1]]
+            self.scores[post_id] = score
+            self._push_outside(lowest)
+        else:
+            self._push_outside(key)
+
+    def remove(self, post_id):
+        self.scores.pop(post_id, None)
+
+    def _push_outside(self, key):
+        if self.outside is None or key > self.outside:
+            self.outside = key
+
+    def top(self, k):
+        """Best `k` as [(post_id, score)], or None if they can't be proven exact."""
+        best = heapq.nlargest(k, ((s, p) for p, s in self.scores.items()))
+        if self.outside is not None:
+            if len(best) < k or best[-1] < self.outside:
+                return None
+        return [(post_id, score) for score, post_id in best]
+
+
+class Leaderboard:
+    def __init__(self, size, refresh_interval):
+        self.size = size
+        self.capacity = size * 2
+        self.refresh_interval = refresh_interval
+        self._boards = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+
+    # reads
+
+    def top(self, metric, window, limit=None):
+        limit = min(limit or self.size, self.size)
+        with self._lock:
+            board = self._boards.get((metric, window))
+            if board is None:
+                board = self._boards[(metric, window)] = Board(self.capacity)
+                self._load_snapshot(board, metric, window)
+
+            expired = (
+                board.built_at is None
+                or monotonic() - board.built_at >= self.refresh_interval
+            )
+            rows = None if expired else board.top(limit)
+            if rows is None:
+                self._rebuild(board, metric, window)
+                rows = board.top(limit)
+            return rows
+
+    def _load_snapshot(self, board, metric, window):
+        fresh_after = timezone.now() - timedelta(seconds=self.refresh_interval)
+        rows = list(
+            LeaderboardEntry.objects.filter(
+                metric=metric, window=window, computed_at__gte=fresh_after
+            )
+            .order_by("rank")
+            .values_list("post_id", "score", "computed_at")
+        )
+        if not rows:
+            return
+        board.load([(post_id, score) for post_id, score, _ in rows], complete=len(rows) < self.capacity)
+        # age the board by the snapshot's age so it refreshes on schedule
+        age = (timezone.now() - rows[0][2]).total_seconds()
+        board.built_at -= age
+
+    def _query(self, metric, window):
+        """The best capacity + 1 posts as [(post_id, score)], from the DB."""
+        if WINDOWS[window] is None:
+            rows = list(
+                BlogPost.objects.filter(status=BlogPost.PUBLISHED, **{f"{metric}_count__gt": 0})
+                .order_by(f"-{metric}_count", "-post_id")
+                .values_list("post_id", f"{metric}_count")[: self.capacity + 1]
+            )
+        else:
+            rows = list(
+                PostEngagementBucket.objects.filter(
+                    hour__gte=bucket_hour(timezone.now() - WINDOWS[window]),
+                    post__status=BlogPost.PUBLISHED,
+                )
+                .values("post_id")
+                .annotate(score=Sum(metric))
+                .filter(score__gt=0)
+                .order_by("-score", "-post_id")
+                .values_list("post_id", "score")[: self.capacity + 1]
+            )
+        return rows
+
+    def _rebuild(self, board, metric, window):
+        rows = self._query(metric, window)
+        board.load(rows[: self.capacity], complete=len(rows) <= self.capacity)
+
+    def save_snapshots(self):
+        """
+        Rebuild every board from the DB into leaderboard_entry and delete
+        buckets no window reads any more. Returns the number of entries.
+        """
+        PostEngagementBucket.objects.filter(
+            hour__lt=bucket_hour(timezone.now() - BUCKET_RETENTION)
+        ).delete()
+        saved = 0
+        for metric in METRICS:
+            for window in WINDOWS:
+                board = Board(self.capacity)
+                self._rebuild(board, metric, window)
+                saved += self._save_snapshot(board, metric, window)
+        return saved
+
+    def _save_snapshot(self, board, metric, window):
+        now = timezone.now()
+        entries = [
+            LeaderboardEntry(
+                metric=metric, window=window, rank=rank, post_id=post_id, score=score, computed_at=now
+            )
+            for rank, (score, post_id) in enumerate(
+                sorted(((s, p) for p, s in board.scores.items()), reverse=True), start=1
+            )
+        ]
+        with transaction.atomic():
+            LeaderboardEntry.objects.filter(metric=metric, window=window).delete()
+            LeaderboardEntry.objects.bulk_create(entries)
+        return len(entries)
+
+    # writes
+
+    def record(self, post_id, metric, delta, at):
+        """
+        Count a like/comment (+1) or its removal (-1) made at `at`.
+        Call inside the transaction that changed the row; the in-memory
+        boards are updated once it commits.
+        """
+        if at is not None and at >= timezone.now() - BUCKET_RETENTION:
+            self._bump_bucket(post_id, metric, delta, bucket_hour(at), create=delta > 0)
+
+        transaction.on_commit(lambda: self._refresh_post(post_id, metric))
+
+    def status_changed(self, post_id):
+        """
+        Re-score a post that was published or unpublished (moderation,
+        edits) on the loaded boards, once the current transaction commits.
+        """
+        transaction.on_commit(lambda: [self._refresh_post(post_id, metric) for metric in METRICS])
+
+    def _bump_bucket(self, post_id, metric, delta, hour, create):
+        buckets = PostEngagementBucket.objects.filter(post_id=post_id, hour=hour)
+        if buckets.update(**{metric: F(metric) + delta}) or not create:
+            return
+        try:
+            with transaction.atomic():
+                PostEngagementBucket.objects.create(post_id=post_id, hour=hour, **{metric: delta})
+        except IntegrityError:
+            # another request created the bucket first
+            buckets.update(**{metric: F(metric) + delta})
+
+    def _refresh_post(self, post_id, metric):
+        """Recompute one post's scores and feed them to the loaded boards."""
+        with self._lock:
+            loaded = [w for (m, w) in self._boards if m == metric]
+        if not loaded:
+            return
+
+        post = BlogPost.objects.filter(post_id=post_id).values("status", f"{metric}_count").first()
+        if post is None or post["status"] != BlogPost.PUBLISHED:
+            with self._lock:
+                for window in loaded:
+                    self._boards[(metric, window)].remove(post_id)
+            return
+
+        scores = {"all": post[f"{metric}_count"]}
+        windowed = [w for w in loaded if WINDOWS[w] is not None]
+        if windowed:
+            now = timezone.now()
+            sums = PostEngagementBucket.objects.filter(post_id=post_id).aggregate(
+                **{
+                    window: Sum(metric, filter=Q(hour__gte=bucket_hour(now - WINDOWS[window])))
+                    for window in windowed
+                }
+            )
+            scores.update({window: max(sums[window] or 0, 0) for window in windowed})
+
+        with self._lock:
+            for window in loaded:
+                self._boards[(metric, window)].update(post_id, scores[window])
+
+
+leaderboard = Leaderboard(
+    size=settings.LEADERBOARD_SIZE,
+    refresh_interval=settings.LEADERBOARD_REFRESH_INTERVAL,
+)
@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Prefetch
+
+from .models import BlogPost, Tag, TagPairCount
+from .tags import list_field, tag_registry
+
+# shared row builder for the blog listings
+# with_row_relations() loads everything blog_row() reads in two queries per page
+# (posts joined with their author, plus one batched query for all their tags);
+# blog_row() only touches that prefetched data, never the database
+
+
+def with_row_relations(blogs):
+    return blogs.select_related("user").prefetch_related(
+        Prefetch("tags", queryset=Tag.objects.only("tag_id", "name"))
+    )
+
+
+def blog_row(blog):
+    return {
+        "post_id": blog.post_id,
+        "title": blog.title,
+        "content": blog.content,
+        "user": blog.user.email,
+        "username": blog.user.username,
+        # .all() reads the prefetch cache, values_list() would query again
+        "tags": [tag.name for tag in blog.tags.all()],
+        "likes": blog.likes_count,
+        "comments": blog.comments_count,
+        "created_at": blog.created_at,
+        "image_url": blog.image_url,
+    }
+
+
+TAG_MODES = ("any", "all")
+
+
+class InvalidTagFilter(ValueError):
+    def __init__(self, error, **details):
+        super().__init__(error)
+        self.details = details
+
+    def response_data(self):
+        return {"error": str(self), **self.details}
+
+
+def tag_filter(params):
+    """
+    (tag_ids, mode) from ?tags=1,2,3&mode=any|all; ?tag_id= still works as a
+    single tag. Raises InvalidTagFilter for an unknown mode or tag.
+    """
+    mode = params.get("mode") or "any"
+    if mode not in TAG_MODES:
+        raise InvalidTagFilter("mode must be 'any' or 'all'.")
+    values = list_field(params, "tags")
+    if params.get("tag_id"):
+        values.append(params.get("tag_id"))
+    if not values:
+        return [], mode
+    tag_ids, unknown = tag_registry.resolve(values)
+    if unknown:
+        raise InvalidTagFilter("Unknown tags.", unknown_tags=unknown)
+    return tag_ids, mode
+
+
+def tag_post_counts(tag_ids):
+    """{tag_id: published posts carrying it}, from the stored tag counts."""
+    return dict(
+        TagPairCount.objects.filter(tag_id__in=tag_ids, other_id=F("tag_id")).values_list(
+            "tag_id", "post_count"
+        )
+    )
+
+
+def has_tag(tag_ids):
+    through = BlogPost.tags.through
+    return Exists(through.objects.filter(blogpost_id=OuterRef("pk"), tag_id__in=tag_ids))
+
+
+def filter_by_tags(blogs, tag_ids, mode="any"):
+    """
+    Posts carrying any/all of `tag_ids`, each post once (EXISTS / IN, no join).
+
+    When the posts to read from blog_post_tags are few (all posts of the tags
+    for "any", those of the rarest tag for "all") the query starts there and
+    sorts the matches. Otherwise it walks the listing index in order and
+    probes each post, stopping as soon as the page is full.
+    """
+    tag_ids = list(dict.fromkeys(tag_ids))
+    counts = tag_post_counts(tag_ids)
+
+    if mode == "all":
+        rarest = min(tag_ids, key=lambda tag_id: counts.get(tag_id, 0))
+        for tag_id in tag_ids:
+            if tag_id != rarest:
+                blogs = blogs.filter(has_tag([tag_id]))
+        if counts.get(rarest, 0) <= settings.TAG_FILTER_SORT_LIMIT:
+            through = BlogPost.tags.through.objects.filter(tag_id=rarest)
+            return blogs.filter(pk__in=through.values("blogpost_id"))
+        return blogs.filter(has_tag([rarest]))
+
+    if sum(counts.values()) <= settings.TAG_FILTER_SORT_LIMIT:
+        through = BlogPost.tags.through.objects.filter(tag_id__in=tag_ids)
+        return blogs.filter(pk__in=through.values("blogpost_id"))
+    return blogs.filter(has_tag(tag_ids))
@@ -0,0 +1,118 @@
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from api.models import User
+
+WRITES = ("INSERT", "UPDATE", "DELETE")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure POST /login/ throughput with concurrent clients against a throwaway "
+        "file-backed test database (so threads contend for SQLite's write lock like "
+        "worker processes would)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--seconds", type=float, default=10)
+        parser.add_argument(
+            "--fast-hasher",
+            action="store_true",
+            help="Hash passwords with MD5 so the database, not PBKDF2, is the bottleneck.",
+        )
+
+    def login(self, client, email):
+        return client.post(
+            "/login/", {"email": email, "password": "benchmark"}, content_type="application/json"
+        )
+
+    def worker(self, emails, deadline, results):
+        client = Client()
+        timings, errors = [], 0
+        i = 0
+        try:
+            while time.perf_counter() < deadline:
+                email = emails[i % len(emails)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    response = self.login(client, email)
+                    ok = response.status_code == 200
+                except Exception:
+                    ok = False
+                if ok:
+                    timings.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+        finally:
+            connections.close_all()
+        results.append((timings, errors))
+
+    def writes_per_login(self, email):
+        with CaptureQueriesContext(connection) as queries:
+            self.login(Client(), email)
+        return [q["sql"].split()[0] for q in queries if q["sql"].split()[0] in WRITES]
+
+    def benchmark(self, options):
+        emails = [f"user{i}@example.com" for i in range(options["users"])]
+        for email in emails:
+            User.objects.create_user(email=email, username=email.split("@")[0], password="benchmark")
+
+        for attempt in ("first", "next"):
+            writes = self.writes_per_login(emails[0])
+            self.stdout.write(f"writes on the {attempt} login: {len(writes)} {writes}")
+
+        results = []
+        deadline = time.perf_counter() + options["seconds"]
+        threads = [
+            threading.Thread(target=self.worker, args=(emails[n::options["threads"]] or emails, deadline, results))
+            for n in range(options["threads"])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        timings = sorted(t * 1000 for thread_timings, _ in results for t in thread_timings)
+        errors = sum(thread_errors for _, thread_errors in results)
+        if not timings:
+            self.stdout.write(f"no successful logins, {errors} errors")
+            return
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{len(timings) / elapsed:.0f} logins/sec with {options['threads']} threads, "
+            f"p50 {statistics.median(timings):.1f} ms  p95 {p95:.1f} ms  errors {errors}"
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        tmp = tempfile.mkdtemp()
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(tmp, "login_benchmark.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            hashers = settings.PASSWORD_HASHERS
+            if options["fast_hasher"]:
+                hashers = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+            with override_settings(PASSWORD_HASHERS=hashers):
+                self.benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
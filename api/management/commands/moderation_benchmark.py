@@ -0,0 +1,64 @@
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from api import moderation
+from api.moderation import FakeModerationModel, ModerationClient
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare single vs batched moderation throughput against the local "
+        "FakeModerationModel (no network, pre-filter and verdict cache disabled)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=200, help="Texts to moderate.")
+        parser.add_argument("--batch-size", type=int, default=10)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="Simulated seconds per model call.",
+        )
+
+    def run(self, texts, batched, batch_size, latency):
+        model = FakeModerationModel(latency=latency)
+        client = ModerationClient("fake", discovery_interval=0, model=model)
+
+        # measure the model path only: no pre-filter, and every text is a cache miss
+        with override_settings(MODERATION_PREFILTER=False), mock.patch.object(
+            moderation, "moderation_client", client
+        ), mock.patch.object(
+            moderation.verdict_cache, "get", return_value=None
+        ), mock.patch.object(moderation.verdict_cache, "set"):
+            started = time.perf_counter()
+            if batched:
+                verdicts = moderation.check_contents(texts, batch_size=batch_size)
+            else:
+                verdicts = [moderation.check_content(text) for text in texts]
+            elapsed = time.perf_counter() - started
+
+        return verdicts, model.calls, elapsed
+
+    def handle(self, *args, **options):
+        texts = [
+            f"Post {i}: " + ("buy cheap spam now" if i % 7 == 0 else "a perfectly normal paragraph")
+            for i in range(options["items"])
+        ]
+
+        results = {}
+        for label, batched in (("single", False), ("batched", True)):
+            verdicts, calls, elapsed = self.run(
+                texts, batched, options["batch_size"], options["latency"]
+            )
+            results[label] = verdicts
+            self.stdout.write(
+                f"{label:>8}: {len(texts)} texts, {calls} model calls, "
+                f"{elapsed:.3f}s, {len(texts) / elapsed:.1f} texts/sec"
+            )
+
+        if results["single"] != results["batched"]:
+            self.stderr.write("Batched verdicts differ from single verdicts!")
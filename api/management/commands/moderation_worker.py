@@ -0,0 +1,36 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.moderation_queue import requeue_stale, run_pending
+
+
+class Command(BaseCommand):
+    help = "Process queued content moderation jobs (used when MODERATION_ASYNC is on)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the queue once and exit."
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=settings.MODERATION_STALE_AFTER,
+            help="Seconds after which a RUNNING job is considered abandoned and requeued.",
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options["stale_after"])
+        requeued = requeue_stale(stale_after)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} abandoned job(s).")
+
+        while True:
+            processed = run_pending()
+            if processed:
+                self.stdout.write(f"Moderated {processed} post(s).")
+            if options["once"]:
+                break
+            time.sleep(settings.MODERATION_POLL_INTERVAL)
@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.outbox import prune, requeue_stale, run_pending
+
+
+class Command(BaseCommand):
+    help = "Send queued outgoing mail (password resets) in batches over one SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the outbox once and exit."
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=settings.EMAIL_STALE_AFTER,
+            help="Seconds after which a SENDING mail is considered abandoned and requeued.",
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options["stale_after"])
+        requeued = requeue_stale(stale_after)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} abandoned mail(s).")
+        pruned = prune(timedelta(seconds=settings.EMAIL_RETENTION))
+        if pruned:
+            self.stdout.write(f"Deleted {pruned} old sent/failed mail(s).")
+
+        while True:
+            processed = run_pending()
+            if processed:
+                self.stdout.write(f"Processed {processed} mail(s).")
+            if options["once"]:
+                break
+            time.sleep(settings.EMAIL_POLL_INTERVAL)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the search index from blog_post: the blog_post_fts table, or with the "
+        "in-process backend the snapshot at SEARCH_INDEX_PATH that web processes load at startup."
+    )
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index()
+        self.stdout.write(f"Indexed {indexed} post(s).")
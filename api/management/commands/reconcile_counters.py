@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import reconcile_counters
+from api.tag_counts import rebuild_tag_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute BlogPost.likes_count / comments_count where they drifted from the "
+        "real rows, and rebuild the tag counts."
+    )
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counters()
+        self.stdout.write(f"Fixed counters on {fixed} post(s).")
+        pairs = rebuild_tag_counts()
+        self.stdout.write(f"Rebuilt {pairs} tag count row(s).")
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.leaderboard import leaderboard
+
+
+class Command(BaseCommand):
+    help = (
+        "Save the top liked / most commented leaderboards to leaderboard_entry "
+        "(read by the web processes on a cold start) and delete old engagement buckets."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Save the leaderboards once and exit."
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            saved = leaderboard.save_snapshots()
+            self.stdout.write(f"Saved {saved} leaderboard entries.")
+            if options["once"]:
+                break
+            time.sleep(settings.LEADERBOARD_REFRESH_INTERVAL)
@@ -0,0 +1,114 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from api.inverted_index import InvertedIndex
+from api.search import CONTENT_WEIGHT, TITLE_WEIGHT
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the in-process search index (api/inverted_index.py) on a synthetic "
+        "corpus: build time, memory, snapshot save/load and query latency. No DB needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100000)
+        parser.add_argument("--words", type=int, default=200, help="Words per post body.")
+        parser.add_argument("--vocabulary", type=int, default=30000)
+        parser.add_argument("--queries", type=int, default=200, help="Queries per kind.")
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument(
+            "--skip-memory",
+            action="store_true",
+            help="Don't rebuild under tracemalloc to measure memory (halves the run time).",
+        )
+
+    def corpus(self, options):
+        rng = random.Random(options["seed"])
+        vocabulary = [f"w{i:x}" for i in range(options["vocabulary"])]
+        # Zipf-like word frequencies, like real text
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+        cumulative = []
+        total = 0.0
+        for weight in weights:
+            total += weight
+            cumulative.append(total)
+
+        posts = []
+        for post_id in range(1, options["posts"] + 1):
+            title = " ".join(rng.choices(vocabulary, cum_weights=cumulative, k=8))
+            content = " ".join(rng.choices(vocabulary, cum_weights=cumulative, k=options["words"]))
+            posts.append((post_id, title, content, rng.randint(1, 1000), (rng.randint(1, 20),)))
+        return rng, vocabulary, posts
+
+    def build(self, posts):
+        index = InvertedIndex(TITLE_WEIGHT, CONTENT_WEIGHT)
+        for post_id, title, content, user_id, tags in posts:
+            index.add(post_id, title, content, user_id, tags)
+        return index
+
+    def latency(self, index, queries):
+        timings = []
+        for q in queries:
+            started = time.perf_counter()
+            index.search(q, 21)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        return f"p50 {statistics.median(timings):7.2f} ms  p95 {p95:7.2f} ms  max {timings[-1]:7.2f} ms"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Generating {options['posts']} posts...")
+        rng, vocabulary, posts = self.corpus(options)
+
+        started = time.perf_counter()
+        index = self.build(posts)
+        build_time = time.perf_counter() - started
+        self.stdout.write(f"build:      {build_time:.2f}s ({len(posts) / build_time:.0f} posts/sec)")
+        self.stdout.write(f"index:      {index.stats()}")
+
+        if not options["skip_memory"]:
+            del index
+            tracemalloc.start()
+            index = self.build(posts)
+            used, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(f"memory:     {used / 2**20:.1f} MiB after build, {peak / 2**20:.1f} MiB peak")
+
+        n = options["queries"]
+        frequent, rare = vocabulary[:50], vocabulary[-5000:]
+        queries = {
+            "frequent word": [rng.choice(frequent) for _ in range(n)],
+            "rare word": [rng.choice(rare) for _ in range(n)],
+            "two words": [f"{rng.choice(frequent)} {rng.choice(vocabulary[:2000])}" for _ in range(n)],
+            "prefix": [rng.choice(vocabulary[:2000])[:3] for _ in range(n)],
+        }
+        for kind, qs in queries.items():
+            self.stdout.write(f"{kind:>14}: {self.latency(index, qs)}")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "search_index.bin")
+            started = time.perf_counter()
+            index.save(path)
+            save_time = time.perf_counter() - started
+            size = os.path.getsize(path)
+            del index
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            loaded, _ = InvertedIndex.load(path)
+            load_time = time.perf_counter() - started
+            used, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f"snapshot:   {size / 2**20:.1f} MiB, saved in {save_time:.2f}s, "
+                f"mmapped in {load_time:.2f}s using {used / 2**20:.1f} MiB of heap"
+            )
+            for kind, qs in queries.items():
+                self.stdout.write(f"{kind:>14}: {self.latency(loaded, qs)} (from snapshot)")
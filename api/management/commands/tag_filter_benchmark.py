@@ -0,0 +1,154 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Exists, OuterRef
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.listing import filter_by_tags
+from api.models import BlogPost, Tag, User
+from api.pagination import BLOG_ORDERING
+from api.tag_counts import rebuild_tag_counts
+
+
+def exists_plan(blogs, tag_ids, mode):
+    through = BlogPost.tags.through
+    if mode == "all":
+        for tag_id in tag_ids:
+            blogs = blogs.filter(
+                Exists(through.objects.filter(blogpost_id=OuterRef("pk"), tag_id=tag_id))
+            )
+        return blogs
+    return blogs.filter(
+        Exists(through.objects.filter(blogpost_id=OuterRef("pk"), tag_id__in=tag_ids))
+    )
+
+
+def join_plan(blogs, tag_ids, mode):
+    if mode == "all":
+        for tag_id in tag_ids:
+            blogs = blogs.filter(tags__tag_id=tag_id)
+        return blogs
+    return blogs.filter(tags__tag_id__in=tag_ids).distinct()
+
+
+def in_subquery_plan(blogs, tag_ids, mode):
+    matches = BlogPost.tags.through.objects.filter(tag_id__in=tag_ids).values("blogpost_id")
+    if mode == "all":
+        matches = matches.annotate(n=Count("tag_id")).filter(n=len(set(tag_ids)))
+    return blogs.filter(pk__in=matches.values("blogpost_id"))
+
+
+PLANS = {
+    "chosen": filter_by_tags,
+    "exists": exists_plan,
+    "join": join_plan,
+    "in_subquery": in_subquery_plan,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark ?tags=&mode=any|all query plans for blog_list in a throwaway test "
+        "database (posts are generated, nothing touches the real DB)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=200000)
+        parser.add_argument("--tags", type=int, default=50)
+        parser.add_argument("--pages", type=int, default=10, help="Cursor pages walked per query.")
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def populate(self, options):
+        rng = random.Random(options["seed"])
+        user = User.objects.create_user(email="bench@example.com", username="bench")
+        tags = Tag.objects.bulk_create(
+            [Tag(name=f"tag{i}") for i in range(options["tags"])]
+        )
+        # a few tags are very common, most are rare
+        weights = [1 / (rank + 1) for rank in range(len(tags))]
+
+        through = BlogPost.tags.through
+        batch = 5000
+        for start in range(0, options["posts"], batch):
+            posts = BlogPost.objects.bulk_create(
+                [
+                    BlogPost(user=user, title=f"post {i}", content="x")
+                    for i in range(start, min(start + batch, options["posts"]))
+                ]
+            )
+            links = []
+            for post in posts:
+                chosen = set(rng.choices(tags, weights=weights, k=rng.randint(1, 4)))
+                links += [through(blogpost_id=post.post_id, tag_id=tag.tag_id) for tag in chosen]
+            through.objects.bulk_create(links)
+
+        rebuild_tag_counts()
+        with connection.cursor() as c:
+            c.execute("ANALYZE")
+        return tags
+
+    def walk(self, plan, tag_ids, mode, options):
+        """Time reading `pages` consecutive cursor pages; returns (ms, rows seen)."""
+        blogs = plan(BlogPost.objects.filter(status=BlogPost.PUBLISHED), tag_ids, mode)
+        blogs = blogs.order_by(*BLOG_ORDERING).values_list("post_id", "created_at")
+        size = options["page_size"]
+
+        started = time.perf_counter()
+        seen = []
+        cursor = None
+        for _ in range(options["pages"]):
+            page_qs = blogs
+            if cursor:
+                created_at, post_id = cursor
+                page_qs = page_qs.filter(created_at__lte=created_at).exclude(
+                    created_at=created_at, post_id__gte=post_id
+                )
+            page = list(page_qs[: size + 1])
+            seen += [post_id for post_id, _ in page[:size]]
+            if len(page) <= size:
+                break
+            cursor = page[size - 1][1], page[size - 1][0]
+        return (time.perf_counter() - started) * 1000, seen
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.stdout.write(f"Generating {options['posts']} posts with {options['tags']} tags...")
+            started = time.perf_counter()
+            tags = self.populate(options)
+            self.stdout.write(f"generated in {time.perf_counter() - started:.1f}s")
+
+            ids = [tag.tag_id for tag in tags]
+            cases = [
+                ("any of 2 common", ids[:2], "any"),
+                ("any of 3 rare", ids[-3:], "any"),
+                ("all of 2 common", ids[:2], "all"),
+                ("all of common+rare", [ids[0], ids[-1]], "all"),
+                ("all of 3 rare", ids[-3:], "all"),
+            ]
+            for label, tag_ids, mode in cases:
+                results = {}
+                for name, plan in PLANS.items():
+                    timings = []
+                    for _ in range(options["repeat"]):
+                        elapsed, seen = self.walk(plan, tag_ids, mode, options)
+                        timings.append(elapsed)
+                    results[name] = seen
+                    self.stdout.write(
+                        f"{label:>20} {name:>12}: {statistics.median(timings):8.1f} ms "
+                        f"for {len(seen)} rows ({options['pages']} pages)"
+                    )
+                if len({tuple(seen) for seen in results.values()}) != 1:
+                    self.stderr.write(f"{label}: plans returned different rows!")
+                for seen in results.values():
+                    if len(seen) != len(set(seen)):
+                        self.stderr.write(f"{label}: duplicated rows!")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
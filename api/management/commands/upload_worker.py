@@ -0,0 +1,36 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.uploads import requeue_stale, run_pending
+
+
+class Command(BaseCommand):
+    help = "Upload spooled images (blog images, profile pictures) queued by the write endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the queue once and exit."
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=settings.UPLOAD_STALE_AFTER,
+            help="Seconds after which a RUNNING job is considered abandoned and requeued.",
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options["stale_after"])
+        requeued = requeue_stale(stale_after)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} abandoned job(s).")
+
+        while True:
+            processed = run_pending()
+            if processed:
+                self.stdout.write(f"Uploaded {processed} image(s).")
+            if options["once"]:
+                break
+            time.sleep(settings.UPLOAD_POLL_INTERVAL)
@@ -1,45 +1,43 @@
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.exceptions import InvalidToken
-from django.http import HttpResponse
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from django.http import HttpResponse, JsonResponse
+
+from .authentication import SharedJWTAuthentication
+from .rate_limit import client_ip, compile_rules, counter_key, rate_limiter, submitted_email
+from .route_policy import AUTHENTICATED, PUBLIC, compile_policies
 
 
 class TokenMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        # DRF reuses what this stores on the request, see api/authentication.py
+        self.authenticator = SharedJWTAuthentication()
+        # {route: policy}, built from the URLconf once
+        self.policies = compile_policies()
 
     def __call__(self, request):
-        token = request.headers.get("Authorization")
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # runs after URL resolution; routes declare their policy in urls.py
+        if self.policies.get(request.resolver_match.route, AUTHENTICATED) == PUBLIC:
+            return None
 
-        admin_paths = [
-            "/admin",
-            "/login/",
-            "/signup/",
-            "/blogs-list",
-            "/list-tags/",
-            "/token/",
-            "/password-reset/",
-            "/password-reset-confirm/",
-            "/"
-        ]
-        if any(request.path.startswith(path) for path in admin_paths):
-            return self.get_response(request)
+        token = request.headers.get("Authorization")
         if token:
             if not token.startswith("Bearer "):
                 return self.invalid_token_response(request)
 
-            token = token.split("Bearer ")[1].strip()
-
             try:
-                JWT_authenticator = JWTAuthentication()
-                response = JWT_authenticator.authenticate(request)
+                response = self.authenticator.authenticate(request)
                 if response:
                     UserData, token = response
                     request.UserData = UserData
                     request.token = token
-                    return self.get_response(request)
+                    return None
                 else:
                     return self.invalid_token_response(request)
-            except InvalidToken:
+            except AuthenticationFailed:
+                # InvalidToken, unknown or inactive user
                 return self.invalid_token_response(request)
         else:
             return self.unauthorized_response(request)
@@ -54,4 +52,38 @@ class TokenMiddleware:
             status=401,
             content="Unauthorized: Token is missing",
             content_type="text/plain",
-        )
\ No newline at end of file
+        )
+
+
+class RateLimitMiddleware:
+    """Answers 429 on rate_limited() routes before the view hashes a password or queues mail."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # {route: (scope, rules)}, built from the URLconf once
+        self.rules = compile_rules()
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        limited = self.rules.get(request.resolver_match.route)
+        if limited is None or request.method != "POST":
+            return None
+
+        scope, rules = limited
+        retry_after = 0
+        if "ip" in rules:
+            retry_after = rate_limiter.hit(counter_key(scope, "ip", client_ip(request)), *rules["ip"])
+        if not retry_after and "account" in rules:
+            email = submitted_email(request)
+            if email:
+                retry_after = rate_limiter.hit(counter_key(scope, "account", email), *rules["account"])
+        if not retry_after:
+            return None
+
+        return JsonResponse(
+            {"error": "Too many requests, try again later."},
+            status=429,
+            headers={"Retry-After": str(retry_after)},
+        )
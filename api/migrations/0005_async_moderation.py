@@ -0,0 +1,42 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_moderationverdict'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='moderation_reason',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='status',
+            field=models.CharField(choices=[('pending_review', 'Pending review'), ('published', 'Published'), ('rejected', 'Rejected')], db_index=True, default='published', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ModerationJob',
+            fields=[
+                ('job_id', models.AutoField(primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('superseded', 'Superseded')], default='queued', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='moderation_jobs', to='api.blogpost')),
+            ],
+            options={
+                'db_table': 'moderation_job',
+                'indexes': [models.Index(fields=['status', 'run_after'], name='moderation_job_ready_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    # self-contained: later changes to api.counters must not change this migration
+    BlogPost = apps.get_model("api", "BlogPost")
+
+    def count(model_name):
+        rows = (
+            apps.get_model("api", model_name).objects.filter(post=OuterRef("pk"))
+            .order_by()
+            .values("post")
+            .annotate(n=Count("pk"))
+            .values("n")[:1]
+        )
+        return Coalesce(Subquery(rows), 0)
+
+    BlogPost.objects.update(likes_count=count("Like"), comments_count=count("Comment"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_async_moderation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='comments_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='likes_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['-likes_count', '-post_id'], name='blog_post_likes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['-comments_count', '-post_id'], name='blog_post_comments_idx'),
+        ),
+    ]
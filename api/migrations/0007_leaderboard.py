@@ -0,0 +1,84 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+
+
+def backfill_comment_buckets(apps, schema_editor):
+    # comments carry a timestamp, so the week before the deploy can be bucketed
+    Comment = apps.get_model("api", "Comment")
+    PostEngagementBucket = apps.get_model("api", "PostEngagementBucket")
+
+    since = django.utils.timezone.now() - timedelta(days=7)
+    rows = (
+        Comment.objects.filter(created_at__gte=since)
+        .annotate(hour=TruncHour("created_at"))
+        .values("post_id", "hour")
+        .annotate(n=Count("pk"))
+        .order_by()
+    )
+    PostEngagementBucket.objects.bulk_create(
+        [
+            PostEngagementBucket(post_id=row["post_id"], hour=row["hour"], comments=row["n"])
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_blogpost_counters'),
+    ]
+
+    operations = [
+        # existing likes keep a NULL timestamp, only new ones get the default
+        migrations.AddField(
+            model_name='like',
+            name='created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='created_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=20)),
+                ('window', models.CharField(max_length=10)),
+                ('rank', models.IntegerField()),
+                ('score', models.IntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.blogpost')),
+            ],
+            options={
+                'db_table': 'leaderboard_entry',
+                'unique_together': {('metric', 'window', 'rank')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PostEngagementBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('likes', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='engagement_buckets', to='api.blogpost')),
+            ],
+            options={
+                'db_table': 'post_engagement_bucket',
+                'indexes': [models.Index(fields=['hour'], name='engagement_bucket_hour_idx')],
+                'unique_together': {('post', 'hour')},
+            },
+        ),
+        migrations.RunPython(backfill_comment_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+from django.db import DatabaseError, migrations
+
+# FTS5 index over blog_post.title / content (external content table, so the
+# text isn't stored twice); triggers keep it in step with every write.
+# Skipped on SQLite builds without FTS5, search then uses the in-process
+# index (api/inverted_index.py)
+
+
+def fts5_available(schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return False
+    try:
+        with schema_editor.connection.cursor() as c:
+            c.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+            c.execute("DROP TABLE temp.fts5_probe")
+    except DatabaseError:
+        return False
+    return True
+
+
+FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE blog_post_fts USING fts5(
+        title, content,
+        content='blog_post', content_rowid='post_id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER blog_post_fts_insert AFTER INSERT ON blog_post BEGIN
+        INSERT INTO blog_post_fts(rowid, title, content)
+        VALUES (new.post_id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER blog_post_fts_delete AFTER DELETE ON blog_post BEGIN
+        INSERT INTO blog_post_fts(blog_post_fts, rowid, title, content)
+        VALUES ('delete', old.post_id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER blog_post_fts_update AFTER UPDATE OF title, content ON blog_post BEGIN
+        INSERT INTO blog_post_fts(blog_post_fts, rowid, title, content)
+        VALUES ('delete', old.post_id, old.title, old.content);
+        INSERT INTO blog_post_fts(rowid, title, content)
+        VALUES (new.post_id, new.title, new.content);
+    END
+    """,
+    # index the posts that already exist
+    "INSERT INTO blog_post_fts(blog_post_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS blog_post_fts_update",
+    "DROP TRIGGER IF EXISTS blog_post_fts_delete",
+    "DROP TRIGGER IF EXISTS blog_post_fts_insert",
+    "DROP TABLE IF EXISTS blog_post_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    if fts5_available(schema_editor):
+        for statement in FTS_SQL:
+            schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for statement in DROP_SQL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_leaderboard"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:54
+
+from collections import Counter
+from itertools import product
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_tag_counts(apps, schema_editor):
+    # self-contained: later changes to api.tag_counts must not change this migration
+    BlogPost = apps.get_model("api", "BlogPost")
+    TagPairCount = apps.get_model("api", "TagPairCount")
+
+    tags_by_post = {}
+    rows = BlogPost.tags.through.objects.filter(blogpost__status="published").values_list(
+        "blogpost_id", "tag_id"
+    )
+    for post_id, tag_id in rows.iterator():
+        tags_by_post.setdefault(post_id, set()).add(tag_id)
+
+    counts = Counter()
+    for tag_ids in tags_by_post.values():
+        counts.update(product(tag_ids, repeat=2))
+
+    TagPairCount.objects.bulk_create(
+        [
+            TagPairCount(tag_id=tag_id, other_id=other_id, post_count=count)
+            for (tag_id, other_id), count in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_blog_post_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagPairCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post_count', models.IntegerField(default=0)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.tag')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.tag')),
+            ],
+            options={
+                'db_table': 'blog_tag_pair_count',
+                'unique_together': {('tag', 'other')},
+            },
+        ),
+        migrations.RunPython(backfill_tag_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_tag_pair_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['status', '-created_at', '-post_id'], name='blog_post_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_blogpost_status_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('job_id', models.AutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('post_image', 'Post image'), ('profile_picture', 'Profile picture')], max_length=20)),
+                ('target_id', models.IntegerField()),
+                ('path', models.CharField(max_length=500)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('superseded', 'Superseded')], default='queued', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('url', models.URLField(blank=True, max_length=500, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'upload_job',
+                'indexes': [models.Index(fields=['status', 'run_after'], name='upload_job_ready_idx'), models.Index(fields=['kind', 'target_id'], name='upload_job_target_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_outgoing_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('counter_key', models.CharField(max_length=255)),
+                ('window_index', models.BigIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('expires_at', models.FloatField()),
+            ],
+            options={
+                'db_table': 'rate_limit_counter',
+                'indexes': [models.Index(fields=['expires_at'], name='rate_limit_counter_expiry_idx')],
+                'constraints': [models.UniqueConstraint(fields=('counter_key', 'window_index'), name='rate_limit_counter_window_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_rate_limit_counter'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='outgoingemail',
+            name='body',
+        ),
+        migrations.AddField(
+            model_name='outgoingemail',
+            name='context',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='outgoingemail',
+            name='kind',
+            field=models.CharField(choices=[('password_reset', 'Password reset')], default='password_reset', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='outgoingemail',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,9 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
-import cloudinary
-import cloudinary.uploader
 from django.conf import settings
+from django.utils import timezone
 
 #########################   DATABASE OF DJANGO ####################
 
@@ -73,19 +72,35 @@ class User(AbstractUser):
         managed = True
 
     def upload_profile_picture(self, file):
-        result = cloudinary.uploader.upload(file)
-        self.profile_picture = result["secure_url"]
-        self.save()
+        # stored in the background like signup's picture, returns the UploadJob
+        from .uploads import enqueue_upload
+        return enqueue_upload(self, UploadJob.PROFILE_PICTURE, self.user_id, file)
 
 
 # post model where all the articles/blog are saved
 class BlogPost(models.Model):
+    # moderation states, only published posts are listed
+    PENDING_REVIEW = "pending_review"
+    PUBLISHED = "published"
+    REJECTED = "rejected"
+    STATUS_CHOICES = [
+        (PENDING_REVIEW, "Pending review"),
+        (PUBLISHED, "Published"),
+        (REJECTED, "Rejected"),
+    ]
+
     post_id = models.AutoField(primary_key=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="blog_posts")
     title = models.CharField(max_length=255)
     content = models.TextField()
     image_url = models.URLField(null=True, blank=True)
     tags = models.ManyToManyField("Tag", blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PUBLISHED, db_index=True)
+    moderation_reason = models.TextField(blank=True, default="")
+    # kept in step by like_post / comment_post / delete_comment,
+    # `manage.py reconcile_counters` repairs any drift
+    likes_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -93,12 +108,21 @@ class BlogPost(models.Model):
         return self.title
     
     def upload_profile_picture(self, file):
-        result = cloudinary.uploader.upload(file)
-        self.image_url = result["secure_url"]
-        self.save()
+        # sets image_url in the background like blog create, returns the UploadJob
+        from .uploads import enqueue_upload
+        return enqueue_upload(self.user, UploadJob.POST_IMAGE, self.post_id, file)
 
     class Meta:
         db_table = "blog_post"
+        # backs the (created_at, post_id) cursor used by the blog listings
+        indexes = [
+            models.Index(fields=["-created_at", "-post_id"], name="blog_post_created_idx"),
+            # listings filter on status=published, keep that an index range too
+            models.Index(fields=["status", "-created_at", "-post_id"], name="blog_post_status_created_idx"),
+            models.Index(fields=["user", "-created_at", "-post_id"], name="blog_post_user_created_idx"),
+            models.Index(fields=["-likes_count", "-post_id"], name="blog_post_likes_idx"),
+            models.Index(fields=["-comments_count", "-post_id"], name="blog_post_comments_idx"),
+        ]
 
 
 # to save all tags like fantasy tag, science fiction tag, etc
@@ -118,6 +142,8 @@ class Like(models.Model):
     like_id = models.AutoField(primary_key=True)  # Added like_id
     post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name="likes")
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # null for likes made before this column existed
+    created_at = models.DateTimeField(null=True, blank=True, default=timezone.now)
 
     def __str__(self):
         return f"{self.user.email} liked {self.post.title}"
@@ -149,3 +175,221 @@ class FailedLoginAttempt(models.Model):
     class Meta:
         db_table = "failed_login_attempt"
         managed = True
+
+
+# cached verdicts from the content moderation model, keyed by a hash of the text
+class ModerationVerdict(models.Model):
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    is_appropriate = models.BooleanField()
+    reason = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = "moderation_verdict"
+
+
+# queue of posts waiting for the moderation model when MODERATION_ASYNC is on
+# (see api/moderation_queue.py, no external broker needed)
+class ModerationJob(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    SUPERSEDED = "superseded"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (SUPERSEDED, "Superseded"),
+    ]
+
+    job_id = models.AutoField(primary_key=True)
+    post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name="moderation_jobs")
+    text = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"moderation of {self.post_id} ({self.status})"
+
+    class Meta:
+        db_table = "moderation_job"
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="moderation_job_ready_idx"),
+        ]
+
+
+# likes/comments a post received per hour, used for the 24h / 7d leaderboards
+class PostEngagementBucket(models.Model):
+    post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name="engagement_buckets")
+    hour = models.DateTimeField()
+    likes = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "post_engagement_bucket"
+        unique_together = ("post", "hour")
+        indexes = [
+            models.Index(fields=["hour"], name="engagement_bucket_hour_idx"),
+        ]
+
+
+# last computed top-K per leaderboard (see api/leaderboard.py), read on cold start
+class LeaderboardEntry(models.Model):
+    metric = models.CharField(max_length=20)
+    window = models.CharField(max_length=10)
+    rank = models.IntegerField()
+    post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name="+")
+    score = models.IntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "leaderboard_entry"
+        unique_together = ("metric", "window", "rank")
+
+
+# published posts carrying both `tag` and `other` (see api/tag_counts.py);
+# the tag == other row is the tag's own post count
+class TagPairCount(models.Model):
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name="+")
+    post_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "blog_tag_pair_count"
+        unique_together = ("tag", "other")
+
+
+# an image waiting in the local spool for the background uploader (see api/uploads.py);
+# once uploaded its URL is written to BlogPost.image_url or User.profile_picture
+class UploadJob(models.Model):
+    POST_IMAGE = "post_image"
+    PROFILE_PICTURE = "profile_picture"
+    KIND_CHOICES = [
+        (POST_IMAGE, "Post image"),
+        (PROFILE_PICTURE, "Profile picture"),
+    ]
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    SUPERSEDED = "superseded"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+        (SUPERSEDED, "Superseded"),
+    ]
+
+    job_id = models.AutoField(primary_key=True)
+    # who uploaded it, the only user who may see the job
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="upload_jobs")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # post_id or user_id the URL is written to
+    target_id = models.IntegerField()
+    path = models.CharField(max_length=500)
+    # sha256 of the file as uploaded, see MediaAsset
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+    # `path` is the resized, re-encoded copy (api/images.py)
+    prepared = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    url = models.URLField(max_length=500, null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} upload for {self.target_id} ({self.status})"
+
+    class Meta:
+        db_table = "upload_job"
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="upload_job_ready_idx"),
+            models.Index(fields=["kind", "target_id"], name="upload_job_target_idx"),
+        ]
+
+
+# URL an uploaded image ended up at, keyed by the sha256 of the file as uploaded;
+# uploading the same file again reuses the URL instead of uploading it again
+class MediaAsset(models.Model):
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    url = models.URLField(max_length=500)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "media_asset"
+
+
+# mail waiting to be sent by the outbox workers (see api/outbox.py)
+# only what is needed to write the mail is stored: the body, and any reset
+# token in it, is rendered when the mail is sent
+class OutgoingEmail(models.Model):
+    PASSWORD_RESET = "password_reset"
+    KIND_CHOICES = [
+        (PASSWORD_RESET, "Password reset"),
+    ]
+
+    QUEUED = "queued"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (SENDING, "Sending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    email_id = models.AutoField(primary_key=True)
+    # mails with the same key are sent at most once per dedup window,
+    # e.g. "password_reset:<user_id>"
+    dedup_key = models.CharField(max_length=255)
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES, default=PASSWORD_RESET)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    # non secret template values, e.g. the site domain
+    context = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.subject} to {self.to_email} ({self.status})"
+
+    class Meta:
+        db_table = "outgoing_email"
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="outgoing_email_ready_idx"),
+            models.Index(fields=["dedup_key", "-created_at"], name="outgoing_email_dedup_idx"),
+        ]
+
+
+# request counters for RATE_LIMIT_BACKEND="database" (see api/rate_limit.py)
+class RateLimitCounter(models.Model):
+    counter_key = models.CharField(max_length=255)
+    window_index = models.BigIntegerField()
+    count = models.IntegerField(default=0)
+    # unix time after which the row can be deleted
+    expires_at = models.FloatField()
+
+    class Meta:
+        db_table = "rate_limit_counter"
+        constraints = [
+            models.UniqueConstraint(fields=["counter_key", "window_index"], name="rate_limit_counter_window_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="rate_limit_counter_expiry_idx"),
+        ]
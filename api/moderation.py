@@ -0,0 +1,442 @@
+import hashlib
+import re
+import secrets
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+from time import monotonic
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.utils import timezone
+
+from .prefilter import prefilter_verdict
+
+# content moderation helpers
+# text first goes through the local pre-filter (api/prefilter.py),
+# the Gemini client is created once per process and reused by every write,
+# verdicts from the remote model are cached by a hash of the moderated text,
+# first in process memory (LRU + TTL) and then in the moderation_verdict table,
+# so re-saving an unchanged post or resubmitting the same spam costs no model call
+
+# bump this whenever MODERATION_PROMPT changes so old verdicts stop matching
+MODERATION_PROMPT_VERSION = "1"
+
+MODERATION_PROMPT = """
+        Analyze the following content for a blog platform and determine if it's appropriate.
+        Respond with either "APPROPRIATE" or "INAPPROPRIATE" followed by a brief reason.
+        Only respond with "INAPPROPRIATE" if the content contains:
+        - Hate speech or discriminatory content
+        - Explicit sexual content
+        - Promotion of violence or illegal activities
+        - Personal attacks or harassment
+        - Spam or deceptive content
+
+        Content to analyze:
+        {text}
+        """
+
+# several texts in one model call, each item gets its own verdict line
+BATCH_MODERATION_PROMPT = """
+        Analyze each of the following {count} items for a blog platform and determine if it's appropriate.
+        Every item starts with a line "=== ITEM <n> {nonce} ===".
+        Respond with exactly one line per item, in order:
+        <n>: APPROPRIATE
+        or
+        <n>: INAPPROPRIATE <brief reason>
+        Only mark an item "INAPPROPRIATE" if it contains:
+        - Hate speech or discriminatory content
+        - Explicit sexual content
+        - Promotion of violence or illegal activities
+        - Personal attacks or harassment
+        - Spam or deceptive content
+
+        Items to analyze:
+{items}
+        """
+
+_WHITESPACE = re.compile(r"\s+")
+_BATCH_VERDICT = re.compile(r"^\s*(\d+)\s*[:.)-]\s*(INAPPROPRIATE|APPROPRIATE)\b(.*)$", re.MULTILINE)
+_BATCH_ITEM = re.compile(r"^=== ITEM (\d+) (\w+) ===$", re.MULTILINE)
+
+
+def build_batch_prompt(texts):
+    # random marker so an item can't fake the start of the next one
+    nonce = secrets.token_hex(4)
+    items = "\n".join(
+        f"=== ITEM {n} {nonce} ===\n{text}" for n, text in enumerate(texts, start=1)
+    )
+    return BATCH_MODERATION_PROMPT.format(count=len(texts), nonce=nonce, items=items)
+
+
+def parse_verdict(response_text):
+    if response_text.startswith("INAPPROPRIATE"):
+        reason = response_text.replace("INAPPROPRIATE", "").strip()
+        return False, reason
+    return True, ""
+
+
+def parse_batch_response(response_text, count):
+    """
+    Turn "<n>: APPROPRIATE / INAPPROPRIATE reason" lines into a list of verdicts.
+    Raises ValueError unless every item 1..count got exactly one verdict.
+    """
+    verdicts = {}
+    for match in _BATCH_VERDICT.finditer(response_text):
+        n = int(match.group(1))
+        if n in verdicts or not 1 <= n <= count:
+            raise ValueError(f"Unexpected verdict for item {n}")
+        verdicts[n] = parse_verdict(f"{match.group(2)} {match.group(3)}".strip())
+
+    if len(verdicts) != count:
+        raise ValueError(f"Expected {count} verdicts, got {len(verdicts)}")
+    return [verdicts[n] for n in range(1, count + 1)]
+
+
+class FakeModerationModel:
+    """
+    Local stand-in for the Gemini model (tests, benchmarks, offline runs).
+    Flags text containing any of `blocked_words`, answers both single and
+    batch prompts, and sleeps `latency` seconds per call to mimic the network.
+    """
+
+    def __init__(self, blocked_words=("spam", "scam"), latency=0.0):
+        self.blocked_words = tuple(word.lower() for word in blocked_words)
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _judge(self, text):
+        lowered = text.lower()
+        for word in self.blocked_words:
+            if word in lowered:
+                return f"INAPPROPRIATE contains {word}"
+        return "APPROPRIATE"
+
+    def generate_content(self, prompt):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        parts = _BATCH_ITEM.split(prompt)
+        if len(parts) > 1:
+            # split gives [preamble, n, nonce, text, n, nonce, text, ...]
+            lines = [
+                f"{parts[i]}: {self._judge(parts[i + 2])}"
+                for i in range(1, len(parts), 3)
+            ]
+            return SimpleNamespace(text="\n".join(lines))
+
+        text = prompt.split("Content to analyze:", 1)[-1]
+        return SimpleNamespace(text=self._judge(text))
+
+
+class ModerationClient:
+    """
+    Process wide handle on the Gemini model used for moderation.
+    The API is configured and the model built on first use only, and the
+    list of available models is fetched at most once per `discovery_interval` seconds.
+    """
+
+    def __init__(self, model_name, discovery_interval, model=None):
+        self.model_name = model_name
+        self.discovery_interval = discovery_interval
+        self._lock = threading.Lock()
+        self._configured = False
+        # a pre-built model (e.g. FakeModerationModel) skips the Gemini API entirely
+        self._model = model
+        self._offline = model is not None
+        self._available_models = []
+        self._discovered_at = None
+
+    def _configure(self):
+        import google.generativeai as genai
+
+        if not self._configured:
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+            self._configured = True
+        return genai
+
+    def list_models(self):
+        """Names of the models the API key can use, refreshed once per interval."""
+        with self._lock:
+            now = monotonic()
+            if (
+                self._discovered_at is not None
+                and now - self._discovered_at < self.discovery_interval
+            ):
+                return self._available_models
+
+            # set before the call so a failing API isn't retried on every request
+            self._discovered_at = now
+            try:
+                genai = self._configure()
+                self._available_models = [model.name for model in genai.list_models()]
+            except Exception as e:
+                print(f"Error listing models: {str(e)}")
+                return self._available_models
+
+            available = self._available_models
+            if available and f"models/{self.model_name}" not in available and self.model_name not in available:
+                print(f"Moderation model {self.model_name} is not in the available models")
+            return available
+
+    def get_model(self):
+        if self._offline:
+            return self._model
+        if self.discovery_interval > 0:
+            self.list_models()
+
+        with self._lock:
+            if self._model is None:
+                genai = self._configure()
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def generate(self, prompt):
+        """Send the prompt and return the stripped response text."""
+        response = self.get_model().generate_content(prompt)
+        return response.text.strip()
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def verdict_key(text, model_name):
+    raw = f"{MODERATION_PROMPT_VERSION}\x00{model_name}\x00{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    Two tier cache of (is_appropriate, reason) verdicts.
+    Memory tier is an LRU capped at `max_entries`, the DB tier is the
+    ModerationVerdict table capped at `db_max_entries`; both expire after `ttl` seconds.
+    """
+
+    # prune the DB tier once every this many writes
+    PRUNE_EVERY = 100
+
+    def __init__(self, max_entries, db_max_entries, ttl):
+        self.max_entries = max_entries
+        self.db_max_entries = db_max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                verdict, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return verdict
+                del self._entries[key]
+
+        verdict = self._db_get(key)
+        with self._lock:
+            if verdict is None:
+                self.misses += 1
+            else:
+                self.db_hits += 1
+        if verdict is not None:
+            self._remember(key, verdict)
+        return verdict
+
+    def set(self, key, verdict):
+        self._remember(key, verdict)
+        self._db_set(key, verdict)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            hits = self.memory_hits + self.db_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._entries),
+            }
+
+    def _remember(self, key, verdict):
+        with self._lock:
+            self._entries[key] = (verdict, monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _db_get(self, key):
+        from .models import ModerationVerdict
+
+        try:
+            row = ModerationVerdict.objects.filter(
+                content_hash=key, expires_at__gt=timezone.now()
+            ).first()
+            if row is None:
+                return None
+            ModerationVerdict.objects.filter(content_hash=key).update(
+                last_used_at=timezone.now()
+            )
+            return row.is_appropriate, row.reason
+        except Exception as e:
+            # the DB tier is best effort, a failure just means a model call
+            print(f"Moderation cache read error: {str(e)}")
+            return None
+
+    def _db_set(self, key, verdict):
+        from .models import ModerationVerdict
+
+        is_appropriate, reason = verdict
+        now = timezone.now()
+        try:
+            ModerationVerdict.objects.update_or_create(
+                content_hash=key,
+                defaults={
+                    "is_appropriate": is_appropriate,
+                    "reason": reason,
+                    "last_used_at": now,
+                    "expires_at": now + timedelta(seconds=self.ttl),
+                },
+            )
+            with self._lock:
+                self._writes += 1
+                prune = self._writes % self.PRUNE_EVERY == 0
+            if prune:
+                self.prune()
+        except Exception as e:
+            print(f"Moderation cache write error: {str(e)}")
+
+    def prune(self):
+        """Drop expired rows and the least recently used ones over the cap."""
+        from .models import ModerationVerdict
+
+        ModerationVerdict.objects.filter(expires_at__lte=timezone.now()).delete()
+        stale = (
+            ModerationVerdict.objects.order_by("-last_used_at")
+            .values_list("last_used_at", flat=True)[self.db_max_entries:self.db_max_entries + 1]
+        )
+        cutoff = next(iter(stale), None)
+        if cutoff is not None:
+            ModerationVerdict.objects.filter(last_used_at__lte=cutoff).delete()
+
+
+verdict_cache = VerdictCache(
+    max_entries=settings.MODERATION_CACHE_SIZE,
+    db_max_entries=settings.MODERATION_CACHE_DB_MAX_ENTRIES,
+    ttl=settings.MODERATION_CACHE_TTL,
+)
+
+moderation_client = ModerationClient(
+    model_name=settings.GEMINI_MODEL,
+    discovery_interval=settings.GEMINI_MODEL_DISCOVERY_INTERVAL,
+    # GEMINI_MODEL=fake runs moderation fully offline
+    model=FakeModerationModel() if settings.GEMINI_MODEL == "fake" else None,
+)
+
+
+def ask_model(text, cache_key):
+    """One model call for `text`; the verdict is stored under `cache_key`."""
+    response_text = moderation_client.generate(MODERATION_PROMPT.format(text=text))
+    verdict = parse_verdict(response_text)
+
+    verdict_cache.set(cache_key, verdict)
+    return verdict
+
+
+def check_content(text):
+    """
+    Ask the moderation model about `text`, going through the pre-filter and
+    the verdict cache. Returns (is_appropriate, reason); raises if the model call fails.
+    """
+    # Obvious spam and plainly harmless text never reach the model
+    verdict = prefilter_verdict(text)
+    if verdict is not None:
+        return verdict
+
+    # Identical text (after normalization) was already judged, reuse the verdict
+    cache_key = verdict_key(text, moderation_client.model_name)
+    verdict = verdict_cache.get(cache_key)
+    if verdict is not None:
+        return verdict
+
+    return ask_model(text, cache_key)
+
+
+def check_contents(texts, batch_size=None, prefiltered=False):
+    """
+    Batched check_content: verdicts for `texts`, in order.
+    Cache misses are sent `batch_size` at a time in one prompt; a batch whose
+    response can't be parsed is retried one text per call. Raises if the model fails.
+    `prefiltered` texts were already escalated by the pre-filter and skip it.
+    """
+    batch_size = batch_size or settings.MODERATION_BATCH_SIZE
+    keys = [verdict_key(text, moderation_client.model_name) for text in texts]
+
+    known = {}
+    missing = []
+    for key, text in zip(keys, texts):
+        if key in known:
+            continue
+        verdict = None if prefiltered else prefilter_verdict(text)
+        if verdict is None:
+            verdict = verdict_cache.get(key)
+        if verdict is None:
+            # identical texts in one batch are only asked once
+            known[key] = None
+            missing.append(key)
+        else:
+            known[key] = verdict
+
+    text_for = dict(zip(keys, texts))
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start + batch_size]
+        if len(chunk) == 1:
+            known[chunk[0]] = ask_model(text_for[chunk[0]], chunk[0])
+            continue
+
+        chunk_texts = [text_for[key] for key in chunk]
+        response_text = moderation_client.generate(build_batch_prompt(chunk_texts))
+        try:
+            verdicts = parse_batch_response(response_text, len(chunk))
+        except ValueError as e:
+            print(f"Batch moderation parse error, falling back to single calls: {str(e)}")
+            verdicts = [ask_model(text_for[key], key) for key in chunk]
+        else:
+            for key, verdict in zip(chunk, verdicts):
+                verdict_cache.set(key, verdict)
+
+        for key, verdict in zip(chunk, verdicts):
+            known[key] = verdict
+
+    return [known[key] for key in keys]
+
+
+def moderate_content(text):
+    """
+    Use Gemini to check content for appropriateness.
+    Returns (is_appropriate, reason) tuple.
+    """
+    try:
+        return check_content(text)
+    except Exception as e:
+        # Log the error but allow content through if moderation fails
+        # (not cached, so the text is checked again next time)
+        print(f"Content moderation error: {str(e)}")
+        return True, ""
@@ -0,0 +1,158 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .leaderboard import leaderboard
+from .models import BlogPost, ModerationJob
+from .moderation import check_contents
+from .response_cache import bump
+from .search import post_changed
+from .tag_counts import post_status_changed
+from .workers import WorkerPool
+
+# asynchronous moderation
+# with MODERATION_ASYNC on, writes save the post as pending_review and drop a
+# ModerationJob row here; worker threads (or the moderation_worker command)
+# pick jobs up in batches, ask the model and flip the post to published or rejected
+
+
+def supersede_moderation(post):
+    """Drop the queued and running jobs of `post`, its text changed since."""
+    ModerationJob.objects.filter(
+        post=post, status__in=[ModerationJob.QUEUED, ModerationJob.RUNNING]
+    ).update(status=ModerationJob.SUPERSEDED)
+
+
+def enqueue_moderation(post, text):
+    with transaction.atomic():
+        # an older queued job for the same post is out of date now
+        supersede_moderation(post)
+        job = ModerationJob.objects.create(post=post, text=text)
+
+    if settings.MODERATION_WORKERS > 0:
+        worker_pool.start()
+        transaction.on_commit(worker_pool.wake)
+    return job
+
+
+def claim_jobs(limit):
+    """Atomically take up to `limit` ready jobs (possibly none)."""
+    now = timezone.now()
+    candidates = (
+        ModerationJob.objects.filter(status=ModerationJob.QUEUED, run_after__lte=now)
+        .order_by("run_after", "job_id")
+        .values_list("job_id", flat=True)[:limit]
+    )
+    claimed_ids = []
+    for job_id in candidates:
+        # the conditional update only succeeds for one worker
+        claimed = ModerationJob.objects.filter(
+            job_id=job_id, status=ModerationJob.QUEUED
+        ).update(
+            status=ModerationJob.RUNNING,
+            attempts=F("attempts") + 1,
+            updated_at=now,
+        )
+        if claimed:
+            claimed_ids.append(job_id)
+
+    if not claimed_ids:
+        return []
+    return list(ModerationJob.objects.filter(job_id__in=claimed_ids).order_by("job_id"))
+
+
+def apply_verdict(job, is_appropriate, reason):
+    with transaction.atomic():
+        # the post was edited since (a newer job, or judged in the request),
+        # this verdict is stale
+        newer = (
+            ModerationJob.objects.filter(post_id=job.post_id, job_id__gt=job.job_id).exists()
+            or ModerationJob.objects.filter(job_id=job.job_id, status=ModerationJob.SUPERSEDED).exists()
+        )
+        if not newer:
+            old_status = (
+                BlogPost.objects.filter(post_id=job.post_id).values_list("status", flat=True).first()
+            )
+            BlogPost.objects.filter(post_id=job.post_id).update(
+                status=BlogPost.PUBLISHED if is_appropriate else BlogPost.REJECTED,
+                moderation_reason=reason,
+                updated_at=timezone.now(),
+            )
+            post_status_changed(
+                job.post_id, old_status == BlogPost.PUBLISHED, bool(is_appropriate)
+            )
+            if (old_status == BlogPost.PUBLISHED) != bool(is_appropriate):
+                leaderboard.status_changed(job.post_id)
+            bump("blogs", f"post:{job.post_id}")
+            post_changed(job.post_id)
+        ModerationJob.objects.filter(job_id=job.job_id).update(
+            status=ModerationJob.DONE if not newer else ModerationJob.SUPERSEDED,
+        )
+
+
+def retry_or_give_up(job):
+    if job.attempts >= settings.MODERATION_MAX_ATTEMPTS:
+        # same policy as synchronous moderation: let content through if moderation fails
+        apply_verdict(job, True, "")
+        return
+
+    backoff = timedelta(seconds=2 ** job.attempts)
+    # a superseded job stays dropped
+    ModerationJob.objects.filter(job_id=job.job_id, status=ModerationJob.RUNNING).update(
+        status=ModerationJob.QUEUED,
+        run_after=timezone.now() + backoff,
+        updated_at=timezone.now(),
+    )
+
+
+def process_jobs(jobs):
+    """Moderate a batch of claimed jobs with as few model calls as possible."""
+    try:
+        # only text the pre-filter escalated in the request is queued
+        verdicts = check_contents([job.text for job in jobs], prefiltered=True)
+    except Exception as e:
+        print(f"Content moderation error: {str(e)}")
+        for job in jobs:
+            retry_or_give_up(job)
+        return
+
+    for job, (is_appropriate, reason) in zip(jobs, verdicts):
+        apply_verdict(job, is_appropriate, reason)
+
+
+def run_pending(limit=None):
+    """Process ready jobs until the queue is empty (or `limit` jobs). Returns the count."""
+    done = 0
+    while limit is None or done < limit:
+        batch_size = settings.MODERATION_BATCH_SIZE
+        if limit is not None:
+            batch_size = min(batch_size, limit - done)
+        jobs = claim_jobs(batch_size)
+        if not jobs:
+            break
+        process_jobs(jobs)
+        done += len(jobs)
+    return done
+
+
+def requeue_stale(older_than):
+    """Put jobs left RUNNING by a crashed worker back in the queue."""
+    cutoff = timezone.now() - older_than
+    return ModerationJob.objects.filter(
+        status=ModerationJob.RUNNING, updated_at__lt=cutoff
+    ).update(status=ModerationJob.QUEUED)
+
+
+worker_pool = WorkerPool(
+    "moderation",
+    size=settings.MODERATION_WORKERS,
+    poll_interval=settings.MODERATION_POLL_INTERVAL,
+    run_pending=lambda: run_pending(limit=settings.MODERATION_BATCH_SIZE),
+    recover_stale=lambda: requeue_stale(timedelta(seconds=settings.MODERATION_STALE_AFTER)),
+    # after a wake up, give a burst time to fill a batch (one model call)
+    batch_size=settings.MODERATION_BATCH_SIZE,
+    batch_max_wait=settings.MODERATION_BATCH_MAX_WAIT,
+)
@@ -0,0 +1,208 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .models import OutgoingEmail
+from .workers import WorkerPool
+
+# outgoing mail
+# requests only add an OutgoingEmail row; worker threads (or the
+# outbox_worker command) send queued mail in batches over one SMTP
+# connection, retrying failures with backoff. A mail whose dedup_key was
+# queued or sent within EMAIL_DEDUP_WINDOW seconds is not queued again,
+# so repeating a request doesn't repeat the mail.
+#
+# Rows hold the kind of mail and its recipient, not the body: the body (and
+# a password reset token) is rendered when the mail is sent, so the table
+# never holds a usable token. Sent and failed rows are deleted after
+# EMAIL_RETENTION seconds.
+
+
+def password_reset_body(email):
+    user = email.user
+    return render_to_string(
+        "password_reset_email.html",
+        {
+            "user": user,
+            "domain": email.context["domain"],
+            "uid": urlsafe_base64_encode(force_bytes(user.pk)),
+            "token": default_token_generator.make_token(user),
+        },
+    )
+
+
+# OutgoingEmail.kind -> function rendering the body
+RENDERERS = {
+    OutgoingEmail.PASSWORD_RESET: password_reset_body,
+}
+
+
+def queue_email(kind, dedup_key, user, to_email, subject, context):
+    """Queue a mail; returns the new OutgoingEmail, or None if a recent one has the same key."""
+    since = timezone.now() - timedelta(seconds=settings.EMAIL_DEDUP_WINDOW)
+    with transaction.atomic():
+        # the transaction holds SQLite's write lock (IMMEDIATE), so two
+        # requests can't both miss the other's row
+        recent = OutgoingEmail.objects.filter(dedup_key=dedup_key).filter(
+            Q(status__in=[OutgoingEmail.QUEUED, OutgoingEmail.SENDING]) | Q(created_at__gte=since)
+        ).exclude(status=OutgoingEmail.FAILED)
+        if recent.exists():
+            return None
+        email = OutgoingEmail.objects.create(
+            kind=kind, dedup_key=dedup_key, user=user, to_email=to_email, subject=subject, context=context
+        )
+
+    if settings.EMAIL_WORKERS > 0:
+        outbox_pool.start()
+        transaction.on_commit(outbox_pool.wake)
+    return email
+
+
+def claim_emails(limit):
+    """Atomically take up to `limit` mails that are due."""
+    now = timezone.now()
+    candidates = (
+        OutgoingEmail.objects.filter(status=OutgoingEmail.QUEUED, run_after__lte=now)
+        .order_by("run_after", "email_id")
+        .values_list("email_id", flat=True)[:limit]
+    )
+    claimed_ids = []
+    for email_id in candidates:
+        # the conditional update only succeeds for one worker
+        claimed = OutgoingEmail.objects.filter(
+            email_id=email_id, status=OutgoingEmail.QUEUED
+        ).update(status=OutgoingEmail.SENDING, attempts=F("attempts") + 1, updated_at=now)
+        if claimed:
+            claimed_ids.append(email_id)
+
+    if not claimed_ids:
+        return []
+    return list(
+        OutgoingEmail.objects.filter(email_id__in=claimed_ids).select_related("user").order_by("email_id")
+    )
+
+
+def retry_or_give_up(email, error):
+    if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+        OutgoingEmail.objects.filter(email_id=email.email_id).update(
+            status=OutgoingEmail.FAILED, last_error=error, updated_at=timezone.now()
+        )
+        return
+
+    backoff = timedelta(seconds=2 ** email.attempts)
+    OutgoingEmail.objects.filter(email_id=email.email_id).update(
+        status=OutgoingEmail.QUEUED,
+        run_after=timezone.now() + backoff,
+        last_error=error,
+        updated_at=timezone.now(),
+    )
+
+
+def send_batch(emails):
+    """Send claimed mails over one connection; each is marked sent or retried on its own."""
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        print(f"Email connection error: {str(e)}")
+        for email in emails:
+            retry_or_give_up(email, str(e))
+        return
+
+    try:
+        for email in emails:
+            try:
+                body = RENDERERS[email.kind](email)
+            except Exception as e:
+                print(f"Email render error: {str(e)}")
+                retry_or_give_up(email, str(e))
+                continue
+            message = EmailMessage(email.subject, body, to=[email.to_email], connection=connection)
+            try:
+                # an open connection stays open across send_messages() calls
+                message.send()
+            except Exception as e:
+                print(f"Email send error: {str(e)}")
+                retry_or_give_up(email, str(e))
+                continue
+            OutgoingEmail.objects.filter(email_id=email.email_id).update(
+                status=OutgoingEmail.SENT,
+                sent_at=timezone.now(),
+                last_error="",
+                updated_at=timezone.now(),
+            )
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def run_pending(limit=None):
+    """Send due mail until none is left (or `limit` mails). Returns the count."""
+    done = 0
+    while limit is None or done < limit:
+        batch_size = settings.EMAIL_BATCH_SIZE
+        if limit is not None:
+            batch_size = min(batch_size, limit - done)
+        emails = claim_emails(batch_size)
+        if not emails:
+            break
+        send_batch(emails)
+        done += len(emails)
+    return done
+
+
+def requeue_stale(older_than):
+    """Put mail left SENDING by a crashed worker back in the queue."""
+    cutoff = timezone.now() - older_than
+    return OutgoingEmail.objects.filter(
+        status=OutgoingEmail.SENDING, updated_at__lt=cutoff
+    ).update(status=OutgoingEmail.QUEUED)
+
+
+def prune(older_than):
+    """Delete sent and failed mails last touched more than `older_than` ago."""
+    cutoff = timezone.now() - older_than
+    deleted, _ = OutgoingEmail.objects.filter(
+        status__in=[OutgoingEmail.SENT, OutgoingEmail.FAILED], updated_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+# the idle workers prune at most once per PRUNE_EVERY seconds
+PRUNE_EVERY = 3600
+_pruned_at = None
+_prune_lock = threading.Lock()
+
+
+def recover(stale_after, retention):
+    """Requeue abandoned mail, and now and then prune old rows."""
+    global _pruned_at
+    requeue_stale(stale_after)
+    with _prune_lock:
+        if _pruned_at is not None and time.monotonic() - _pruned_at < PRUNE_EVERY:
+            return
+        _pruned_at = time.monotonic()
+    prune(retention)
+
+
+outbox_pool = WorkerPool(
+    "outbox",
+    size=settings.EMAIL_WORKERS,
+    poll_interval=settings.EMAIL_POLL_INTERVAL,
+    run_pending=lambda: run_pending(limit=settings.EMAIL_BATCH_SIZE),
+    recover_stale=lambda: recover(
+        timedelta(seconds=settings.EMAIL_STALE_AFTER), timedelta(seconds=settings.EMAIL_RETENTION)
+    ),
+)
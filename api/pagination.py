@@ -0,0 +1,86 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# keyset (cursor) pagination for the blog listings
+# posts are ordered newest first on (created_at, post_id) so a page is always
+# an index range scan, no matter how deep the client has paged
+
+BLOG_ORDERING = ("-created_at", "-post_id")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_payload(payload):
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_payload(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor.")
+    if not isinstance(payload, dict):
+        raise InvalidCursor("Invalid cursor.")
+    return payload
+
+
+def encode_cursor(created_at, pk):
+    return encode_payload({"c": created_at.isoformat(), "p": pk})
+
+
+def decode_cursor(cursor):
+    payload = decode_payload(cursor)
+    try:
+        created_at = parse_datetime(payload["c"])
+        post_id = int(payload["p"])
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Invalid cursor.")
+
+    if created_at is None:
+        raise InvalidCursor("Invalid cursor.")
+    return created_at, post_id
+
+
+def get_page_size(request, param="page_size", default=None):
+    default = default or settings.BLOG_PAGE_SIZE
+    try:
+        page_size = int(request.GET.get(param, default))
+    except (TypeError, ValueError):
+        page_size = default
+
+    return max(1, min(page_size, settings.BLOG_MAX_PAGE_SIZE))
+
+
+def paginate_blogs(blogs, request):
+    """
+    Return (page, next_cursor) for a BlogPost queryset.
+    Raises InvalidCursor if ?cursor= can't be decoded.
+    """
+    blogs = blogs.order_by(*BLOG_ORDERING)
+
+    cursor = request.GET.get("cursor")
+    if cursor:
+        created_at, post_id = decode_cursor(cursor)
+        blogs = blogs.filter(
+            Q(created_at__lt=created_at)
+            | Q(created_at=created_at, post_id__lt=post_id)
+        )
+
+    page_size = get_page_size(request)
+
+    # fetch one extra row to know whether another page exists
+    page = list(blogs[: page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = encode_cursor(page[-1].created_at, page[-1].post_id)
+
+    return page, next_cursor
@@ -0,0 +1,142 @@
+from functools import lru_cache
+
+# Porter stemmer, the variant SQLite's FTS5 "porter" tokenizer uses
+# (Martin Porter's reference implementation: "bli" -> "ble", "logi" -> "log"),
+# so the in-process search index (api/inverted_index.py) reduces words to the
+# same terms as the blog_post_fts table: "running", "runs" and "run" all match.
+# Like FTS5 it leaves tokens shorter than 3 or longer than 64 bytes alone.
+
+MIN_LENGTH = 3
+MAX_LENGTH = 64
+
+STEP2 = [
+    ("ational", "ate"), ("tional", "tion"), ("enci", "ence"), ("anci", "ance"),
+    ("izer", "ize"), ("logi", "log"), ("bli", "ble"), ("alli", "al"),
+    ("entli", "ent"), ("eli", "e"), ("ousli", "ous"), ("ization", "ize"),
+    ("ation", "ate"), ("ator", "ate"), ("alism", "al"), ("iveness", "ive"),
+    ("fulness", "ful"), ("ousness", "ous"), ("aliti", "al"), ("iviti", "ive"),
+    ("biliti", "ble"),
+]
+STEP3 = [
+    ("icate", "ic"), ("ative", ""), ("alize", "al"), ("iciti", "ic"),
+    ("ical", "ic"), ("ful", ""), ("ness", ""),
+]
+# longest first where one suffix ends another ("ement", "ment", "ent")
+STEP4 = [
+    "al", "ance", "ence", "er", "ic", "able", "ible", "ant", "ement", "ment",
+    "ent", "ion", "ou", "ism", "ate", "iti", "ous", "ive", "ize",
+]
+
+
+def _consonant(word, i):
+    c = word[i]
+    if c in "aeiou":
+        return False
+    if c == "y":
+        # "y" after a consonant is a vowel
+        return i == 0 or not _consonant(word, i - 1)
+    return True
+
+
+def _measure(stem):
+    """m in [C](VC)^m[V]."""
+    m, after_vowel = 0, False
+    for i in range(len(stem)):
+        vowel = not _consonant(stem, i)
+        if after_vowel and not vowel:
+            m += 1
+        after_vowel = vowel
+    return m
+
+
+def _has_vowel(stem):
+    return any(not _consonant(stem, i) for i in range(len(stem)))
+
+
+def _double_consonant(word):
+    return len(word) >= 2 and word[-1] == word[-2] and _consonant(word, len(word) - 1)
+
+
+def _cvc(word):
+    """Ends consonant-vowel-consonant, the last one not w, x or y."""
+    n = len(word)
+    return (
+        n >= 3
+        and _consonant(word, n - 3)
+        and not _consonant(word, n - 2)
+        and _consonant(word, n - 1)
+        and word[-1] not in "wxy"
+    )
+
+
+def _ends(word, suffix):
+    # as in FTS5, a suffix only counts if something is left before it
+    return len(word) > len(suffix) and word.endswith(suffix)
+
+
+def _step1(word):
+    if _ends(word, "sses") or _ends(word, "ies"):
+        word = word[:-2]
+    elif _ends(word, "s") and not word.endswith("ss"):
+        word = word[:-1]
+
+    if _ends(word, "eed"):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+    else:
+        for suffix in ("ed", "ing"):
+            if _ends(word, suffix) and _has_vowel(word[: -len(suffix)]):
+                word = word[: -len(suffix)]
+                if word.endswith(("at", "bl", "iz")):
+                    word += "e"
+                elif _double_consonant(word) and word[-1] not in "lsz":
+                    word = word[:-1]
+                elif _measure(word) == 1 and _cvc(word):
+                    word += "e"
+                break
+
+    if _ends(word, "y") and _has_vowel(word[:-1]):
+        word = word[:-1] + "i"
+    return word
+
+
+def _replace_suffix(word, rules, min_measure):
+    # only the first suffix that matches is tried
+    for suffix, replacement in rules:
+        if _ends(word, suffix):
+            stem = word[: -len(suffix)]
+            return stem + replacement if _measure(stem) > min_measure else word
+    return word
+
+
+def _step4(word):
+    for suffix in STEP4:
+        if _ends(word, suffix):
+            stem = word[: -len(suffix)]
+            if suffix == "ion" and not stem.endswith(("s", "t")):
+                continue
+            return stem if _measure(stem) > 1 else word
+    return word
+
+
+def _step5(word):
+    if _ends(word, "e"):
+        stem = word[:-1]
+        m = _measure(stem)
+        if m > 1 or (m == 1 and not _cvc(stem)):
+            word = stem
+    if word.endswith("ll") and _measure(word) > 1:
+        word = word[:-1]
+    return word
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    """The Porter stem of a lowercase token."""
+    if not MIN_LENGTH <= len(word.encode()) <= MAX_LENGTH:
+        return word
+    word = _step1(word)
+    word = _replace_suffix(word, STEP2, 0)
+    word = _replace_suffix(word, STEP3, 0)
+    word = _step4(word)
+    return _step5(word)
@@ -0,0 +1,154 @@
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+# local first pass before the remote moderation model
+# obvious spam/scams are rejected and plainly harmless text is accepted here;
+# anything touching a sensitive topic or looking half spammy is escalated to Gemini
+
+# phrases that are spam or scams on their own
+BLOCKED_TERMS = [
+    "viagra",
+    "cialis",
+    "casino bonus",
+    "payday loan",
+    "buy followers",
+    "double your bitcoin",
+    "crypto giveaway",
+    "click here to claim",
+    "claim your prize",
+    "you have won",
+    "work from home and earn",
+    "make money fast",
+    "limited time offer",
+    "100% free money",
+]
+
+# topics a keyword list can't judge, always left to the model
+# (common suffixes are matched too, so "kill" also covers "killing")
+SENSITIVE_TERMS = [
+    "kill", "murder", "die", "death", "dead", "suicide", "hurt", "attack",
+    "shoot", "gun", "weapon", "bomb", "terror", "terrorist", "violence", "violent", "abuse", "rape",
+    "sex", "porn", "nude", "naked", "nsfw", "xxx",
+    "drug", "cocaine", "heroin", "meth", "weed",
+    "hate", "racist", "racism", "nazi", "slur", "stupid", "idiot", "moron", "loser",
+    "scam", "fraud", "hack", "steal", "illegal",
+    "free", "win", "offer", "discount", "promo", "crypto", "bitcoin", "invest",
+]
+
+_LINK = re.compile(r"(?:https?://|www\.)\S+", re.IGNORECASE)
+_WORD = re.compile(r"\w+")
+_CHAR_RUN = re.compile(r"(.)\1{9,}")
+
+
+def compile_terms(terms, suffixes=False):
+    """One alternation regex for the whole list, longest terms first."""
+    escaped = sorted((re.escape(term.lower()) for term in terms), key=len, reverse=True)
+    suffix = r"(?:s|es|d|ed|ing|er|ers)?\b" if suffixes else r"\b"
+    return re.compile(r"\b(?:" + "|".join(escaped) + r")" + suffix)
+
+
+class LocalPrefilter:
+    """
+    Cheap local classifier. classify() returns (is_appropriate, reason) when
+    it is confident, or None to escalate the text to the remote model.
+
+    A spam score in [0, 1] is built from link density, word repetition,
+    long character runs and shouting; at or above `reject_score` the text is
+    rejected, at or below `accept_score` (and with no sensitive term) it is accepted.
+    """
+
+    def __init__(self, reject_score, accept_score, max_link_density, blocked_terms, sensitive_terms):
+        self.reject_score = reject_score
+        self.accept_score = accept_score
+        self.max_link_density = max_link_density
+        self._blocked = compile_terms(blocked_terms)
+        self._sensitive = compile_terms(sensitive_terms, suffixes=True)
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.escalated = 0
+
+    def spam_score(self, text):
+        words = _WORD.findall(text)
+        if not words:
+            return 0.0
+
+        score = 0.0
+
+        # links per word, saturating at max_link_density
+        links = len(_LINK.findall(text))
+        if links:
+            tokens = len(text.split())
+            score += 0.6 * min(1.0, (links / tokens) / self.max_link_density)
+
+        # the same few words over and over
+        if len(words) >= 20:
+            distinct_ratio = len(set(w.lower() for w in words)) / len(words)
+            top_share = Counter(w.lower() for w in words).most_common(1)[0][1] / len(words)
+            score += 0.6 * max(0.0, (0.3 - distinct_ratio) / 0.3)
+            score += 0.4 * max(0.0, (top_share - 0.25) / 0.75)
+
+        if _CHAR_RUN.search(text):
+            score += 0.2
+
+        letters = [c for c in text if c.isalpha()]
+        if len(letters) >= 20 and sum(c.isupper() for c in letters) / len(letters) > 0.7:
+            score += 0.2
+
+        return min(score, 1.0)
+
+    def classify(self, text):
+        lowered = text.lower()
+        verdict = None
+
+        blocked = self._blocked.search(lowered)
+        if blocked:
+            verdict = (False, f"Spam or deceptive content ({blocked.group(0)}).")
+        else:
+            score = self.spam_score(text)
+            if score >= self.reject_score:
+                verdict = (False, "Spam or deceptive content.")
+            elif score <= self.accept_score and not self._sensitive.search(lowered):
+                verdict = (True, "")
+
+        with self._lock:
+            if verdict is None:
+                self.escalated += 1
+            elif verdict[0]:
+                self.accepted += 1
+            else:
+                self.rejected += 1
+        return verdict
+
+    def stats(self):
+        with self._lock:
+            total = self.accepted + self.rejected + self.escalated
+            return {
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "escalated": self.escalated,
+                "escalation_rate": round(self.escalated / total, 4) if total else 0.0,
+            }
+
+
+def _extra_terms(value):
+    return [term.strip() for term in value.split(",") if term.strip()]
+
+
+prefilter = LocalPrefilter(
+    reject_score=settings.MODERATION_PREFILTER_REJECT_SCORE,
+    accept_score=settings.MODERATION_PREFILTER_ACCEPT_SCORE,
+    max_link_density=settings.MODERATION_PREFILTER_MAX_LINK_DENSITY,
+    blocked_terms=BLOCKED_TERMS + _extra_terms(settings.MODERATION_PREFILTER_EXTRA_BLOCKED),
+    sensitive_terms=SENSITIVE_TERMS + _extra_terms(settings.MODERATION_PREFILTER_EXTRA_SENSITIVE),
+)
+
+
+def prefilter_verdict(text):
+    """Local verdict for `text`, or None if it needs the remote model."""
+    if not settings.MODERATION_PREFILTER:
+        return None
+    return prefilter.classify(text)
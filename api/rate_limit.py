@@ -0,0 +1,240 @@
+import hashlib
+import json
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.urls import URLResolver, get_resolver
+
+from .route_policy import join_route
+
+# request rate limits for the endpoints that hash passwords or send mail
+# routes opt in next to their definition: rate_limited("login", path(...));
+# RateLimitMiddleware (api/middleware.py) checks RATE_LIMITS[scope] before
+# the view runs, per client IP and per submitted email, and answers 429.
+#
+# Counting is a sliding window counter: a fixed window per `period` plus the
+# previous window weighted by how much of it still overlaps the last
+# `period` seconds. Two integers per key, updated with one atomic add:
+#   memory    a dict in this process (default)
+#   database  the rate_limit_counter table, an upsert per add (shared by
+#             every process using the SQLite file)
+#   cache     the RATE_LIMIT_CACHE alias, cache.incr() (shared through Redis)
+
+
+def parse_rate(rate):
+    """ "count/seconds" -> (count, seconds), None for an empty string."""
+    if not rate:
+        return None
+    try:
+        count, period = rate.split("/")
+        count, period = int(count), int(period)
+    except ValueError:
+        raise ImproperlyConfigured(f"Invalid rate {rate!r}, use \"count/seconds\".")
+    if count < 1 or period < 1:
+        raise ImproperlyConfigured(f"Invalid rate {rate!r}, use \"count/seconds\".")
+    return count, period
+
+
+def counter_key(scope, kind, value):
+    # fixed length, and no emails in the counter store
+    digest = hashlib.sha256(str(value).strip().lower().encode()).hexdigest()[:32]
+    return f"{scope}:{kind}:{digest}"
+
+
+class MemoryCounters:
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        # key -> [window, count in window, count in window - 1]
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, window, period, amount):
+        """Add `amount` to the key's count in `window`; returns (current, previous)."""
+        with self._lock:
+            entry = self._windows.pop(key, None)
+            if entry is None or entry[0] < window - 1:
+                entry = [window, 0, 0]
+            elif entry[0] == window - 1:
+                entry = [window, 0, entry[1]]
+            entry[1] += amount
+            # re-inserted last: the dict stays ordered by last use
+            self._windows[key] = entry
+            if len(self._windows) > self.max_keys:
+                self._windows.pop(next(iter(self._windows)))
+            return entry[1], entry[2]
+
+    def reset(self, key, period):
+        with self._lock:
+            self._windows.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+
+
+class DatabaseCounters:
+    # old windows are deleted every PRUNE_EVERY adds of a process
+    PRUNE_EVERY = 1000
+
+    def __init__(self):
+        self._adds = 0
+
+    def add(self, key, window, period, amount):
+        with connection.cursor() as c:
+            c.execute(
+                "INSERT INTO rate_limit_counter (counter_key, window_index, count, expires_at) "
+                "VALUES (%s, %s, %s, %s) "
+                "ON CONFLICT (counter_key, window_index) DO UPDATE SET count = count + excluded.count "
+                "RETURNING count",
+                [key, window, amount, (window + 2) * period],
+            )
+            current = c.fetchone()[0]
+            c.execute(
+                "SELECT count FROM rate_limit_counter WHERE counter_key = %s AND window_index = %s",
+                [key, window - 1],
+            )
+            row = c.fetchone()
+
+            self._adds += 1
+            if self._adds % self.PRUNE_EVERY == 0:
+                c.execute("DELETE FROM rate_limit_counter WHERE expires_at < %s", [time.time()])
+        return current, row[0] if row else 0
+
+    def reset(self, key, period):
+        with connection.cursor() as c:
+            c.execute("DELETE FROM rate_limit_counter WHERE counter_key = %s", [key])
+
+    def clear(self):
+        with connection.cursor() as c:
+            c.execute("DELETE FROM rate_limit_counter")
+
+
+class CacheCounters:
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def add(self, key, window, period, amount):
+        cache_key = f"ratelimit:{key}:{window}"
+        # add() is a no-op when the key exists, incr() is atomic in Redis
+        self.cache.add(cache_key, 0, timeout=2 * period)
+        try:
+            current = self.cache.incr(cache_key, amount)
+        except ValueError:
+            # expired between add() and incr()
+            self.cache.set(cache_key, amount, timeout=2 * period)
+            current = amount
+        return current, self.cache.get(f"ratelimit:{key}:{window - 1}", 0)
+
+    def reset(self, key, period):
+        window = int(time.time() // period)
+        self.cache.delete_many([f"ratelimit:{key}:{w}" for w in range(window - 1, window + 1)])
+
+    def clear(self):
+        self.cache.clear()
+
+
+class RateLimiter:
+    def __init__(self, counters):
+        self.counters = counters
+
+    def record(self, key, period):
+        """Count one event for `key`; returns the events in the last `period` seconds."""
+        window, elapsed = divmod(time.time(), period)
+        current, previous = self.counters.add(key, int(window), period, 1)
+        return current + previous * (1 - elapsed / period)
+
+    def hit(self, key, limit, period):
+        """
+        Count a request against `key`. Returns 0 when it is within `limit`
+        per `period` seconds, else the seconds to wait; refused requests
+        are not counted.
+        """
+        window, elapsed = divmod(time.time(), period)
+        current, previous = self.counters.add(key, int(window), period, 1)
+        if current + previous * (1 - elapsed / period) <= limit:
+            return 0
+        self.counters.add(key, int(window), period, -1)
+        # at most: the rest of this window, then enough decay for one more
+        return math.ceil(period - elapsed + period / limit)
+
+    def reset(self, key, period):
+        """Forget the events counted for `key`."""
+        self.counters.reset(key, period)
+
+    def clear(self):
+        self.counters.clear()
+
+
+def get_counters():
+    if settings.RATE_LIMIT_BACKEND == "database":
+        return DatabaseCounters()
+    if settings.RATE_LIMIT_BACKEND == "cache":
+        # DatabaseCache and FileBasedCache don't increment atomically, use Redis
+        return CacheCounters(settings.RATE_LIMIT_CACHE)
+    return MemoryCounters(settings.RATE_LIMIT_MAX_KEYS)
+
+
+rate_limiter = RateLimiter(get_counters())
+
+
+# which routes are limited
+
+def rate_limited(scope, pattern):
+    pattern.rate_limit_scope = scope
+    return pattern
+
+
+def compile_rules(patterns=None, prefix=""):
+    """
+    {route: (scope, {"ip": (count, seconds), "account": ...})} for every
+    rate_limited() route. Raises ImproperlyConfigured for a scope missing from RATE_LIMITS.
+    """
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+
+    table = {}
+    for pattern in patterns:
+        route = join_route(prefix, str(pattern.pattern))
+        if isinstance(pattern, URLResolver):
+            table.update(compile_rules(pattern.url_patterns, route))
+            continue
+        scope = getattr(pattern, "rate_limit_scope", None)
+        if scope is None:
+            continue
+        if scope not in settings.RATE_LIMITS:
+            raise ImproperlyConfigured(f"URL pattern {route!r} uses rate limit {scope!r}, add it to RATE_LIMITS.")
+        rules = {kind: parse_rate(rate) for kind, rate in settings.RATE_LIMITS[scope].items()}
+        table[route] = (scope, {kind: rule for kind, rule in rules.items() if rule})
+    return table
+
+
+def client_ip(request):
+    # behind RATE_LIMIT_TRUSTED_PROXIES proxies, the address the first one saw
+    proxies = settings.RATE_LIMIT_TRUSTED_PROXIES
+    if proxies:
+        forwarded = [ip.strip() for ip in request.headers.get("X-Forwarded-For", "").split(",") if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def submitted_email(request):
+    """The "email" field of a JSON or form body, None if there isn't one."""
+    try:
+        if request.content_type == "application/json":
+            # read once here, DRF parses the cached body again
+            value = json.loads(request.body or b"{}").get("email")
+        else:
+            value = request.POST.get("email")
+    except Exception:
+        return None
+    return value if isinstance(value, str) and value.strip() else None
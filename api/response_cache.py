@@ -0,0 +1,181 @@
+import hashlib
+import threading
+import time
+import weakref
+from functools import wraps
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+# response cache for the public read endpoints
+# a cached body is keyed by path + query string + the current version of every
+# scope the view reads ("blogs", "tags", "users", "post:<id>"); writes bump the
+# versions they touch, so old entries are never read again and simply expire.
+# Only anonymous GETs are cached, a hit is served without touching the ORM.
+# The ETag / Last-Modified a view sent are stored with the body, so a
+# conditional GET that hits the cache is answered (304 or 200) from it too.
+
+_VERSION_PREFIX = "rc:v:"
+# entries are (status, content type, body, validators)
+_ENTRY_PREFIX = "rc:e2:"
+_LOCK_PREFIX = "rc:l:"
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _new_version():
+    # start from the clock, so a version evicted from the cache can't come back
+    # with a number older entries were stored under
+    return time.time_ns()
+
+
+def get_versions(scopes):
+    cache = _cache()
+    keys = [_VERSION_PREFIX + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    """Invalidate everything cached for `scopes` once the current transaction commits."""
+    def _bump():
+        # a fresh version rather than incr(): the file backend's incr() is a
+        # read-modify-write, two processes could both write the same number
+        _cache().set_many({_VERSION_PREFIX + scope: _new_version() for scope in scopes}, None)
+
+    transaction.on_commit(_bump)
+
+
+def cache_key(request, scopes):
+    params = sorted((k, v) for k, values in request.GET.lists() for v in values)
+    raw = "|".join([
+        request.path,
+        repr(params),
+        # the browsable API and JSON clients get different bodies
+        request.META.get("HTTP_ACCEPT", ""),
+        repr(get_versions(scopes)),
+    ])
+    return _ENTRY_PREFIX + hashlib.sha1(raw.encode()).hexdigest()
+
+
+class SingleFlight:
+    """
+    Stampede guard: concurrent misses on one key compute it once.
+
+    Threads of this process wait on a per-key lock; other processes see a lock
+    entry in the shared cache and poll for the result for up to `wait` seconds
+    before giving up and computing it themselves.
+    """
+
+    def __init__(self, wait, poll=0.05):
+        self.wait = wait
+        self.poll = poll
+        self._locks = weakref.WeakValueDictionary()
+        self._guard = threading.Lock()
+
+    def _local_lock(self, key):
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def get_or_compute(self, key, compute, timeout):
+        """Return (entry, response); `response` is None when served from the cache."""
+        cache = _cache()
+        entry = cache.get(key)
+        if entry is not None:
+            return entry, None
+
+        with self._local_lock(key):
+            entry = cache.get(key)
+            if entry is not None:
+                return entry, None
+
+            lock_key = _LOCK_PREFIX + key
+            acquired = cache.add(lock_key, 1, self.wait)
+            if not acquired:
+                deadline = monotonic() + self.wait
+                while monotonic() < deadline:
+                    time.sleep(self.poll)
+                    entry = cache.get(key)
+                    if entry is not None:
+                        return entry, None
+            try:
+                entry, response = compute()
+                if entry is not None:
+                    cache.set(key, entry, timeout)
+                return entry, response
+            finally:
+                if acquired:
+                    cache.delete(lock_key)
+
+
+single_flight = SingleFlight(wait=settings.RESPONSE_CACHE_LOCK_TIMEOUT)
+
+
+def cached_response(*scopes):
+    """
+    Cache anonymous GET responses of a view.
+    `scopes` may use the view's URL kwargs, e.g. "post:{post_id}".
+    Put it above @api_view and @condition so a hit skips DRF, the ORM and
+    the validator queries entirely.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if (
+                not settings.RESPONSE_CACHE
+                or request.method != "GET"
+                or "HTTP_AUTHORIZATION" in request.META
+            ):
+                return view_func(request, *args, **kwargs)
+
+            def compute():
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return None, response
+                if hasattr(response, "render"):
+                    response.render()
+                validators = {
+                    header: response[header]
+                    for header in ("ETag", "Last-Modified")
+                    if response.has_header(header)
+                }
+                entry = (response.status_code, response["Content-Type"], response.content, validators)
+                return entry, response
+
+            key = cache_key(request, [scope.format(**kwargs) for scope in scopes])
+            entry, response = single_flight.get_or_compute(
+                key, compute, settings.RESPONSE_CACHE_TIMEOUT
+            )
+            if response is not None:
+                return response
+
+            status_code, content_type, content, validators = entry
+            response = HttpResponse(content, status=status_code, content_type=content_type)
+            for header, value in validators.items():
+                response[header] = value
+            if not validators:
+                return response
+            # same rules as @condition, against the validators stored with the body
+            return get_conditional_response(
+                request,
+                etag=validators.get("ETag"),
+                last_modified=parse_http_date_safe(validators.get("Last-Modified", "")),
+                response=response,
+            )
+
+        return wrapper
+    return decorator
@@ -0,0 +1,53 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import URLResolver, get_resolver
+
+# who may call a route, declared next to it in the urls.py files:
+#   public(path(...))         no token needed (views may still read one)
+#   authenticated(path(...))  TokenMiddleware answers 401 without a valid token
+# A policy on an include() covers every route under it.
+# compile_policies() turns the URLconf into {route: policy} once at startup;
+# TokenMiddleware looks up request.resolver_match.route, so the per-request
+# check is a dict lookup on the route Django already matched.
+
+PUBLIC = "public"
+AUTHENTICATED = "authenticated"
+
+
+def public(pattern):
+    pattern.auth_policy = PUBLIC
+    return pattern
+
+
+def authenticated(pattern):
+    pattern.auth_policy = AUTHENTICATED
+    return pattern
+
+
+def join_route(prefix, route):
+    # the way URLResolver.resolve() builds ResolverMatch.route
+    if not prefix:
+        return route
+    return prefix + route.removeprefix("^")
+
+
+def compile_policies(patterns=None, prefix="", inherited=None):
+    """
+    {route: policy} for every URL pattern. Raises ImproperlyConfigured for a
+    pattern with no policy of its own or from an enclosing include().
+    """
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+
+    table = {}
+    for pattern in patterns:
+        policy = getattr(pattern, "auth_policy", inherited)
+        route = join_route(prefix, str(pattern.pattern))
+        if isinstance(pattern, URLResolver):
+            table.update(compile_policies(pattern.url_patterns, route, policy))
+        elif policy is None:
+            raise ImproperlyConfigured(
+                f"URL pattern {route!r} has no auth policy, wrap it in public() or authenticated()."
+            )
+        else:
+            table[route] = policy
+    return table
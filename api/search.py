@@ -0,0 +1,383 @@
+import re
+import threading
+from time import monotonic
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+from django.utils.html import escape
+
+from .inverted_index import InvertedIndex, signature, tokenize
+from .models import BlogPost
+from .pagination import InvalidCursor, decode_payload, encode_payload
+
+# full text search over published posts, ranked with BM25;
+# title matches weigh more than content matches.
+# Backed by the blog_post_fts FTS5 table (migration 0008) or, when the SQLite
+# build has no FTS5, by an in-process InvertedIndex (api/inverted_index.py)
+
+FTS_TABLE = "blog_post_fts"
+TITLE_WEIGHT = 5.0
+CONTENT_WEIGHT = 1.0
+HIGHLIGHT = ("<mark>", "</mark>")
+# FTS5 marks matches with these; post text is user input, so it is
+# HTML-escaped before they become <mark> tags
+MATCH_MARKERS = ("\ue000", "\ue001")
+SNIPPET_TOKENS = 16
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def match_query(q):
+    """
+    Turn free text into a safe FTS5 query: every word must match, the last
+    one as a prefix so results show up while the user is still typing.
+    Returns None if `q` has no searchable words.
+    """
+    terms = _TERM.findall(q)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def encode_rank_cursor(rank, post_id):
+    return encode_payload({"r": rank, "p": post_id})
+
+
+def decode_rank_cursor(cursor):
+    payload = decode_payload(cursor)
+    try:
+        return float(payload["r"]), int(payload["p"])
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Invalid cursor.")
+
+
+_backend = None
+
+
+def search_backend():
+    """ "fts5" or "memory", per SEARCH_BACKEND ("auto" picks fts5 when the table exists)."""
+    global _backend
+    if settings.SEARCH_BACKEND != "auto":
+        return settings.SEARCH_BACKEND
+    if _backend is None:
+        _backend = "fts5" if FTS_TABLE in connection.introspection.table_names() else "memory"
+    return _backend
+
+
+def search_posts(q, limit, tag_id=None, user_id=None, cursor=None):
+    """
+    Return (hits, next_cursor) for published posts matching `q`, best first.
+    Each hit is a dict with post_id, rank, title (highlighted) and snippet.
+    Raises InvalidCursor if `cursor` can't be decoded, SearchIndexNotReady
+    while the in-process index is still being built.
+    """
+    after = decode_rank_cursor(cursor) if cursor else None
+    if search_backend() == "memory":
+        hits = memory_search(q, limit + 1, tag_id, user_id, after)
+    else:
+        hits = fts_search(q, limit + 1, tag_id, user_id, after)
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_rank_cursor(hits[-1]["rank"], hits[-1]["post_id"])
+    return hits, next_cursor
+
+
+def fts_search(q, limit, tag_id, user_id, after):
+    query = match_query(q)
+    if query is None:
+        return []
+
+    filters = ["p.status = %s"]
+    params = [query, BlogPost.PUBLISHED]
+    if user_id is not None:
+        filters.append("p.user_id = %s")
+        params.append(user_id)
+    if tag_id is not None:
+        filters.append(
+            "EXISTS (SELECT 1 FROM blog_post_tags t WHERE t.blogpost_id = p.post_id AND t.tag_id = %s)"
+        )
+        params.append(tag_id)
+
+    # bm25() is lower for better matches, ties go to the lower post_id
+    after_sql = ""
+    if after is not None:
+        rank, post_id = after
+        after_sql = "WHERE rank > %s OR (rank = %s AND post_id > %s)"
+        params += [rank, rank, post_id]
+
+    sql = f"""
+        SELECT post_id, rank, title, snippet FROM (
+            SELECT
+                f.rowid AS post_id,
+                bm25({FTS_TABLE}, {TITLE_WEIGHT}, {CONTENT_WEIGHT}) AS rank,
+                highlight({FTS_TABLE}, 0, %s, %s) AS title,
+                snippet({FTS_TABLE}, 1, %s, %s, '…', {SNIPPET_TOKENS}) AS snippet
+            FROM {FTS_TABLE} f
+            JOIN blog_post p ON p.post_id = f.rowid
+            WHERE {FTS_TABLE} MATCH %s AND {" AND ".join(filters)}
+        )
+        {after_sql}
+        ORDER BY rank, post_id
+        LIMIT %s
+    """
+    params = [*MATCH_MARKERS, *MATCH_MARKERS] + params + [limit]
+
+    with connection.cursor() as c:
+        c.execute(sql, params)
+        rows = c.fetchall()
+
+    return [
+        {"post_id": post_id, "rank": rank, "title": marked_html(title), "snippet": marked_html(snippet)}
+        for post_id, rank, title, snippet in rows
+    ]
+
+
+def marked_html(text):
+    """FTS5 highlight()/snippet() output as escaped HTML with <mark> tags."""
+    escaped = escape(text or "")
+    return escaped.replace(MATCH_MARKERS[0], HIGHLIGHT[0]).replace(MATCH_MARKERS[1], HIGHLIGHT[1])
+
+
+# in-process fallback
+
+
+class TermMatcher:
+    """
+    Finds the words of a text that match a query the way the index does:
+    same stem, the stem of the last query word as a prefix.
+    """
+
+    def __init__(self, terms):
+        self.exact = set(terms[:-1])
+        self.prefix = terms[-1]
+
+    def _matches(self, word):
+        return any(term in self.exact or term.startswith(self.prefix) for term in tokenize(word))
+
+    def finditer(self, text):
+        return (match for match in _TERM.finditer(text) if self._matches(match.group(0)))
+
+    def search(self, text):
+        return next(self.finditer(text), None)
+
+
+def highlight_pattern(q):
+    """TermMatcher for `q`, None if it has no searchable words."""
+    terms = tokenize(q)
+    return TermMatcher(terms) if terms else None
+
+
+def highlight(text, pattern):
+    """`text` HTML-escaped, with the matches of `pattern` in <mark> tags."""
+    parts, end = [], 0
+    for match in pattern.finditer(text):
+        parts += [escape(text[end:match.start()]), HIGHLIGHT[0], escape(match.group(0)), HIGHLIGHT[1]]
+        end = match.end()
+    parts.append(escape(text[end:]))
+    return "".join(parts)
+
+
+def snippet(text, pattern):
+    """Up to SNIPPET_TOKENS words of `text` around its first match, like FTS5's snippet()."""
+    words = text.split()
+    first = next((i for i, word in enumerate(words) if pattern.search(word)), 0)
+    start = max(0, min(first - SNIPPET_TOKENS // 4, len(words) - SNIPPET_TOKENS))
+    window = words[start : start + SNIPPET_TOKENS]
+    result = highlight(" ".join(window), pattern)
+    if start > 0:
+        result = "…" + result
+    if start + SNIPPET_TOKENS < len(words):
+        result += "…"
+    return result
+
+
+class SearchIndexNotReady(Exception):
+    pass
+
+
+class PostIndex:
+    """
+    Keeps an InvertedIndex of published posts for this process.
+
+    Loaded from the snapshot at `path` (the rebuild_search_index command
+    writes one) or, without a snapshot, built from the DB in a background
+    thread and saved there; searches meanwhile raise SearchIndexNotReady.
+    Kept current by refresh_post() for writes made here and, every
+    `sync_interval` seconds, by re-indexing posts whose updated_at moved
+    past the last one seen (writes from other processes).
+    """
+
+    def __init__(self, path, sync_interval):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.index = None
+        self.watermark = None
+        self._synced_at = 0.0
+        self._building = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self.index is None and not self._load():
+                self._start_build()
+                raise SearchIndexNotReady("The search index is being built, try again shortly.")
+            if monotonic() - self._synced_at >= self.sync_interval:
+                self._sync()
+            return self.index
+
+    def _start_build(self):
+        if self._building:
+            return
+        self._building = True
+        threading.Thread(target=self._build_in_background, name="search-index-build", daemon=True).start()
+
+    def _build_in_background(self):
+        try:
+            index, watermark = self._build()
+            with self._lock:
+                self.index, self.watermark = index, watermark
+                self._synced_at = monotonic()
+                self.save()
+        except Exception as e:
+            print(f"Search index build error: {str(e)}")
+        finally:
+            self._building = False
+            connection.close()
+
+    def _load(self):
+        loaded = InvertedIndex.load(self.path)
+        if loaded is None:
+            return False
+        self.index, meta = loaded
+        self.watermark = parse_datetime(meta["watermark"]) if meta.get("watermark") else None
+        # catch up with whatever changed since the snapshot was taken
+        self._synced_at = 0.0
+        return True
+
+    def _build(self):
+        index = InvertedIndex(TITLE_WEIGHT, CONTENT_WEIGHT)
+        # taken first: posts changed while the rows are read are synced again later
+        watermark = BlogPost.objects.aggregate(latest=Max("updated_at"))["latest"]
+        self._index_rows(index, BlogPost.objects.filter(status=BlogPost.PUBLISHED))
+        return index, watermark
+
+    def _rebuild(self):
+        self.index, self.watermark = self._build()
+        self._synced_at = monotonic()
+        self.save()
+
+    def _index_rows(self, index, posts):
+        tags = {}
+        through = BlogPost.tags.through.objects.filter(blogpost__in=posts)
+        for post_id, tag_id in through.values_list("blogpost_id", "tag_id").iterator():
+            tags.setdefault(post_id, []).append(tag_id)
+
+        rows = posts.values_list("post_id", "title", "content", "user_id", "status")
+        for post_id, title, content, user_id, post_status in rows.iterator(chunk_size=2000):
+            if post_status != BlogPost.PUBLISHED:
+                index.remove(post_id)
+                continue
+            post_tags = sorted(tags.get(post_id, ()))
+            index.add(
+                post_id, title, content, user_id, post_tags,
+                sig=signature(title, content, user_id, post_tags),
+            )
+
+    def _sync(self):
+        changed = BlogPost.objects.all()
+        if self.watermark is not None:
+            changed = changed.filter(updated_at__gt=self.watermark)
+        latest = changed.aggregate(latest=Max("updated_at"))["latest"]
+        if latest is not None:
+            self._index_rows(self.index, changed.filter(updated_at__lte=latest))
+            self.watermark = latest
+        if self.index.needs_compaction():
+            # save() compacts, and the next start loads a fresher snapshot
+            self.save()
+        self._synced_at = monotonic()
+
+    def refresh_post(self, post_id):
+        with self._lock:
+            if self.index is not None:
+                self._index_rows(self.index, BlogPost.objects.filter(post_id=post_id))
+
+    def save(self):
+        if self.path:
+            watermark = self.watermark.isoformat() if self.watermark else None
+            self.index.save(self.path, meta={"watermark": watermark})
+
+    def rebuild(self):
+        with self._lock:
+            self._rebuild()
+            return len(self.index.current)
+
+
+post_index = PostIndex(
+    path=settings.SEARCH_INDEX_PATH,
+    sync_interval=settings.SEARCH_INDEX_SYNC_INTERVAL,
+)
+
+
+def warm_up():
+    """Load or build the in-process index at startup, off the request path."""
+    def run():
+        try:
+            if search_backend() == "memory":
+                post_index.get()
+        except SearchIndexNotReady:
+            # the build it started goes on in its own thread
+            pass
+        except Exception as e:
+            print(f"Search index warm up error: {str(e)}")
+        finally:
+            connection.close()
+
+    threading.Thread(target=run, name="search-index-warm-up", daemon=True).start()
+
+
+def memory_search(q, limit, tag_id, user_id, after):
+    pattern = highlight_pattern(q)
+    if pattern is None:
+        return []
+
+    ranked = post_index.get().search(q, limit, user_id=user_id, tag_id=tag_id, after=after)
+    texts = {
+        post_id: (title, content)
+        for post_id, title, content in BlogPost.objects.filter(
+            post_id__in=[post_id for _, post_id in ranked]
+        ).values_list("post_id", "title", "content")
+    }
+    return [
+        {
+            "post_id": post_id,
+            "rank": rank,
+            "title": highlight(texts[post_id][0], pattern),
+            "snippet": snippet(texts[post_id][1], pattern),
+        }
+        for rank, post_id in ranked
+        if post_id in texts
+    ]
+
+
+def post_changed(post_id):
+    """Call in the transaction that changed a post's text, tags or status."""
+    # the FTS5 table follows blog_post through triggers
+    if search_backend() == "memory":
+        transaction.on_commit(lambda: post_index.refresh_post(post_id))
+
+
+def rebuild_index():
+    """Re-index every post (after bulk loads or if the index is suspect); returns the count."""
+    if search_backend() == "memory":
+        return post_index.rebuild()
+
+    with connection.cursor() as c:
+        c.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        c.execute(f"SELECT count(*) FROM {FTS_TABLE}_docsize")
+        return c.fetchone()[0]
@@ -0,0 +1,171 @@
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import uuid
+
+import cloudinary.uploader
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+
+# where uploaded images end up, per MEDIA_STORAGE:
+#   cloudinary  Cloudinary, as before (needs the CLOUDINARY_* settings)
+#   local       content addressed files under MEDIA_ROOT, served by the
+#               media_file view (GET MEDIA_URL<name>, with Range support)
+#   fake        stores nothing, returns a stable made-up URL (tests)
+# save(path) takes a finished file from the upload spool (api/uploads.py)
+# and returns its public URL; the caller removes the spool file afterwards.
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def link_or_copy(source, destination):
+    """Hard link when both are on one filesystem, else a kernel side copy."""
+    try:
+        os.link(source, destination)
+    except FileExistsError:
+        pass
+    except OSError:
+        # shutil.copyfile() uses sendfile()/copy_file_range() on Linux
+        temporary = f"{destination}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, destination)
+
+
+class CloudinaryStorage:
+    def save(self, path):
+        return cloudinary.uploader.upload(path)["secure_url"]
+
+
+class LocalStorage:
+    """Files named by the sha256 of their content, so a file is never stored twice."""
+
+    NAME = re.compile(r"[0-9a-f]{2}/[0-9a-f]{64}\.(?:jpg|png|webp|gif)")
+
+    def __init__(self, root, base_url):
+        self.root = str(root)
+        self.base_url = base_url
+
+    def save(self, path):
+        digest = file_sha256(path)
+        name = f"{digest[:2]}/{digest}{os.path.splitext(path)[1].lower()}"
+        destination = os.path.join(self.root, name)
+        if not os.path.exists(destination):
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            link_or_copy(path, destination)
+        return self.base_url + name
+
+    def path(self, name):
+        """Filesystem path for a stored `name`, None if it isn't one."""
+        if not self.NAME.fullmatch(name):
+            return None
+        path = os.path.join(self.root, name)
+        return path if os.path.isfile(path) else None
+
+
+class FakeStorage:
+    """Offline stand-in: a stable URL derived from the file contents."""
+
+    def save(self, path):
+        return f"https://uploads.invalid/{file_sha256(path)}{os.path.splitext(path)[1]}"
+
+
+def get_storage():
+    if settings.MEDIA_STORAGE == "local":
+        return LocalStorage(settings.MEDIA_ROOT, settings.MEDIA_URL)
+    if settings.MEDIA_STORAGE == "fake":
+        return FakeStorage()
+    return CloudinaryStorage()
+
+
+# serving local files
+
+RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeFile:
+    """
+    `length` bytes of an open file, in chunks. The response calls close()
+    when it's done, also for HEAD requests and clients that hang up early.
+    """
+
+    def __init__(self, f, length):
+        self.f = f
+        self.length = length
+
+    def __iter__(self):
+        while self.length > 0:
+            chunk = self.f.read(min(CHUNK_SIZE, self.length))
+            if not chunk:
+                break
+            self.length -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self.f.close()
+
+
+def byte_range(header, size):
+    """
+    (start, end) for a single "bytes=" range, None to send the whole file
+    (no header, several ranges or an invalid one, which RFC 9110 says to
+    ignore), or "invalid" when the range can't be satisfied.
+    """
+    match = RANGE.fullmatch(header.strip()) if header else None
+    if match is None or not (match[1] or match[2]):
+        return None
+    if match[1]:
+        start = int(match[1])
+        # "bytes=5-3" is malformed, not unsatisfiable
+        if match[2] and int(match[2]) < start:
+            return None
+        end = min(int(match[2]), size - 1) if match[2] else size - 1
+    else:
+        # "bytes=-N": the last N bytes
+        start, end = max(0, size - int(match[2])), size - 1
+    if start >= size or start > end:
+        return "invalid"
+    return start, end
+
+
+def media_response(request, path):
+    """
+    The file at `path` with Range support. Names are content hashes, so the
+    file behind a URL never changes: a strong ETag and a long max-age.
+    """
+    size = os.path.getsize(path)
+    etag = '"%s"' % os.path.basename(path).split(".")[0]
+    if request.headers.get("If-None-Match") == etag:
+        return HttpResponseNotModified(headers={"ETag": etag})
+
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    requested = None
+    # If-Range: only send a part of the version the client already has
+    if request.headers.get("If-Range", etag) == etag:
+        requested = byte_range(request.headers.get("Range"), size)
+
+    if requested == "invalid":
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    elif requested is None:
+        # whole file: the WSGI server can sendfile() it
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    else:
+        start, end = requested
+        f = open(path, "rb")
+        f.seek(start)
+        response = StreamingHttpResponse(
+            RangeFile(f, end - start + 1), status=206, content_type=content_type
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
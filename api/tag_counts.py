@@ -0,0 +1,114 @@
+from collections import Counter
+from itertools import product
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import BlogPost, TagPairCount
+
+# per-tag and tag co-occurrence counts of published posts
+# kept in step by set_post_tags() / post_status_changed() on every write, so
+# list_tags?counts=1 and the tag facets read stored rows instead of grouping
+# blog_post_tags per request. `manage.py reconcile_counters` rebuilds them.
+
+
+def pair_deltas(old_tag_ids, new_tag_ids):
+    """{(tag, other): change} when a counted post goes from old to new tags."""
+    deltas = Counter()
+    for pair in product(set(old_tag_ids), repeat=2):
+        deltas[pair] -= 1
+    for pair in product(set(new_tag_ids), repeat=2):
+        deltas[pair] += 1
+    return {pair: delta for pair, delta in deltas.items() if delta}
+
+
+def apply_deltas(deltas):
+    for (tag_id, other_id), delta in deltas.items():
+        pairs = TagPairCount.objects.filter(tag_id=tag_id, other_id=other_id)
+        if pairs.update(post_count=F("post_count") + delta) or delta < 0:
+            continue
+        try:
+            with transaction.atomic():
+                TagPairCount.objects.create(tag_id=tag_id, other_id=other_id, post_count=delta)
+        except IntegrityError:
+            # another request created the row first
+            pairs.update(post_count=F("post_count") + delta)
+
+
+def set_post_tags(blog, tag_ids, counted):
+    """
+    blog.tags.set(tag_ids), keeping the counts right.
+    `counted` is whether the post is currently published in the DB.
+    """
+    with transaction.atomic():
+        old_tag_ids = list(blog.tags.values_list("tag_id", flat=True)) if counted else []
+        blog.tags.set(tag_ids)
+        if counted:
+            apply_deltas(pair_deltas(old_tag_ids, tag_ids))
+
+
+def post_status_changed(post_id, was_published, is_published):
+    if was_published == is_published:
+        return
+    tag_ids = list(
+        BlogPost.tags.through.objects.filter(blogpost_id=post_id).values_list("tag_id", flat=True)
+    )
+    if is_published:
+        apply_deltas(pair_deltas([], tag_ids))
+    else:
+        apply_deltas(pair_deltas(tag_ids, []))
+
+
+def tag_counts(tag_id=None):
+    """
+    {tag_id: published posts} for every tag with posts, or, with `tag_id`,
+    the same restricted to posts that also carry `tag_id`.
+    """
+    rows = TagPairCount.objects.filter(post_count__gt=0)
+    if tag_id is None:
+        rows = rows.filter(tag_id=F("other_id"))
+        return dict(rows.values_list("tag_id", "post_count"))
+    return dict(rows.filter(tag_id=tag_id).values_list("other_id", "post_count"))
+
+
+def matching_tag_counts(posts, max_posts):
+    """
+    (total, {tag_id: posts}) for a queryset of posts, grouped from
+    blog_post_tags: the stored counts only cover one tag at a time.
+    None when more than `max_posts` posts match, the query reads at most
+    max_posts + 1 of them.
+    """
+    matching = posts.order_by().values("pk")[: max_posts + 1]
+    total = matching.count()
+    if total > max_posts:
+        return None
+    rows = (
+        BlogPost.tags.through.objects.filter(blogpost_id__in=matching)
+        .values("tag_id")
+        .annotate(posts=Count("blogpost_id"))
+    )
+    return total, {row["tag_id"]: row["posts"] for row in rows}
+
+
+def rebuild_tag_counts():
+    """Recompute every count from blog_post_tags. Returns the number of pair rows."""
+    through = BlogPost.tags.through
+    tags_by_post = {}
+    rows = through.objects.filter(blogpost__status=BlogPost.PUBLISHED).values_list("blogpost_id", "tag_id")
+    for post_id, tag_id in rows.iterator():
+        tags_by_post.setdefault(post_id, []).append(tag_id)
+
+    counts = Counter()
+    for tag_ids in tags_by_post.values():
+        counts.update(product(set(tag_ids), repeat=2))
+
+    with transaction.atomic():
+        TagPairCount.objects.all().delete()
+        TagPairCount.objects.bulk_create(
+            [
+                TagPairCount(tag_id=tag_id, other_id=other_id, post_count=count)
+                for (tag_id, other_id), count in counts.items()
+            ],
+            batch_size=1000,
+        )
+    return len(counts)
@@ -0,0 +1,93 @@
+import threading
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Tag
+from .response_cache import bump, get_versions
+
+# process-wide tag vocabulary
+# loaded once and reloaded only when the "tags" version stamp moves (every Tag
+# save/delete bumps it, admin and shell included), so listing tags and checking
+# tag IDs/names on writes needs no query.
+# A lookup that misses reloads once before calling a tag unknown, in case the
+# tag was added by another process.
+
+
+class TagRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_id = {}
+        self._by_name = {}
+        self._sorted = []
+
+    def _reload(self, version):
+        tags = list(Tag.objects.order_by("name").values_list("tag_id", "name"))
+        self._by_id = dict(tags)
+        self._by_name = {name.casefold(): tag_id for tag_id, name in tags}
+        self._sorted = [{"tag_id": tag_id, "name": name} for tag_id, name in tags]
+        self._version = version
+
+    def _fresh(self, force=False):
+        version = get_versions(["tags"])[0]
+        with self._lock:
+            if force or version != self._version:
+                self._reload(version)
+
+    def all(self):
+        """Every tag as {"tag_id", "name"}, sorted by name."""
+        self._fresh()
+        return self._sorted
+
+    def resolve(self, tag_ids=(), names=()):
+        """
+        Map tag IDs and/or names to tag IDs.
+        Returns (tag_ids, unknown) where `unknown` lists the inputs that
+        don't name a tag, in the order given.
+        """
+        self._fresh()
+        resolved, unknown = self._lookup(tag_ids, names)
+        if unknown:
+            self._fresh(force=True)
+            resolved, unknown = self._lookup(tag_ids, names)
+        return resolved, unknown
+
+    def _lookup(self, tag_ids, names):
+        resolved, unknown = [], []
+        for value in tag_ids:
+            try:
+                tag_id = int(value)
+            except (TypeError, ValueError):
+                tag_id = None
+            if tag_id in self._by_id:
+                resolved.append(tag_id)
+            else:
+                unknown.append(value)
+        for name in names:
+            tag_id = self._by_name.get(str(name).strip().casefold())
+            if tag_id is not None:
+                resolved.append(tag_id)
+            else:
+                unknown.append(name)
+        return list(dict.fromkeys(resolved)), unknown
+
+
+tag_registry = TagRegistry()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump("tags")
+
+
+def list_field(data, name):
+    """A list from JSON or from a form where the field may be repeated."""
+    if hasattr(data, "getlist"):
+        values = data.getlist(name)
+        # a form can also carry the list as one comma separated value
+        if len(values) == 1 and isinstance(values[0], str) and "," in values[0]:
+            values = values[0].split(",")
+        return [v.strip() if isinstance(v, str) else v for v in values if v != ""]
+    values = data.get(name) or []
+    return values if isinstance(values, list) else [values]
@@ -1,3 +1,1197 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import F
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from itertools import product
+from time import monotonic
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import moderation, moderation_queue, outbox, search, uploads
+from .authentication import user_cache
+from .inverted_index import InvertedIndex
+from .leaderboard import Leaderboard, bucket_hour, leaderboard
+from .models import (
+    BlogPost, Comment, LeaderboardEntry, Like, ModerationJob, ModerationVerdict, OutgoingEmail,
+    PostEngagementBucket, Tag, TagPairCount, UploadJob, User,
+)
+from .pagination import encode_payload
+from .prefilter import prefilter
+from .rate_limit import DatabaseCounters, RateLimiter, rate_limiter
+from .response_cache import bump
+from .route_policy import AUTHENTICATED, PUBLIC, compile_policies
+from .storage import media_response
+from .tag_counts import rebuild_tag_counts, set_post_tags
+
+
+def image_file(name="photo.jpg", size=(64, 48), image_format="JPEG", **params):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 80, 40)).save(buffer, image_format, **params)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+def temp_dir(test):
+    """A fresh directory, removed at the end of the test."""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+def create_post(author, title="Post", likes=0, comments=0, tags=()):
+    blog = BlogPost.objects.create(user=author, title=title, content="content")
+    blog.tags.set(tags)
+    for i in range(max(likes, comments)):
+        fan = User.objects.create_user(email=f"{title}-{i}@example.com", username=f"fan{i}")
+        if i < likes:
+            Like.objects.create(post=blog, user=fan)
+        if i < comments:
+            Comment.objects.create(post=blog, user=fan, text=f"comment {i}")
+    BlogPost.objects.filter(post_id=blog.post_id).update(likes_count=likes, comments_count=comments)
+    return blog
+
+
+class BlogDetailQueryCountTests(TestCase):
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.client = APIClient()
+        self.author = User.objects.create_user(email="author@example.com", username="author")
+        self.tags = [Tag.objects.create(name="fantasy"), Tag.objects.create(name="sci-fi")]
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_query_count_does_not_grow_with_engagement(self):
+        quiet = create_post(self.author, "quiet", tags=self.tags)
+        popular = create_post(self.author, "popular", likes=25, comments=25, tags=self.tags)
+
+        quiet_queries, _ = self.count_queries(f"/blogs-list/{quiet.post_id}/")
+        popular_queries, data = self.count_queries(f"/blogs-list/{popular.post_id}/")
+
+        self.assertEqual(quiet_queries, popular_queries)
+        self.assertEqual(len(data["likes"]), 25)
+        self.assertEqual(len(data["comments"]), 25)
+        self.assertEqual(data["likeCount"], 25)
+        self.assertEqual(data["commentCount"], 25)
+
+    def test_embedded_likes_and_comments_are_paged(self):
+        popular = create_post(self.author, "popular", likes=5, comments=5)
+        url = f"/blogs-list/{popular.post_id}/"
+
+        queries, data = self.count_queries(f"{url}?likes_limit=2&comments_limit=2")
+        self.assertEqual(len(data["likes"]), 2)
+        self.assertEqual([c["text"] for c in data["comments"]], ["comment 0", "comment 1"])
+
+        seen = [c["text"] for c in data["comments"]]
+        while data["comments_next"]:
+            next_queries, data = self.count_queries(
+                f"{url}?comments_limit=2&comments_cursor={data['comments_next']}"
+            )
+            self.assertEqual(next_queries, queries)
+            seen += [c["text"] for c in data["comments"]]
+        self.assertEqual(seen, [f"comment {i}" for i in range(5)])
+
+
+class BlogListQueryCountTests(TestCase):
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.client = APIClient()
+        self.author = User.objects.create_user(email="author@example.com", username="author")
+        tags = [Tag.objects.create(name=f"tag{i}") for i in range(3)]
+        for i in range(12):
+            create_post(self.author, f"post{i}", likes=i % 3, comments=i % 2, tags=tags[: i % 4])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def assert_independent_of_page_size(self, url):
+        small, small_data = self.count_queries(f"{url}?page_size=2")
+        large, large_data = self.count_queries(f"{url}?page_size=10")
+        self.assertEqual(small, large)
+        self.assertEqual(len(small_data["results"]), 2)
+        self.assertEqual(len(large_data["results"]), 10)
+
+    def test_blog_list(self):
+        self.assert_independent_of_page_size("/blogs-list/")
+
+    def test_blogs_by_user(self):
+        self.assert_independent_of_page_size(f"/blogs-list/{self.author.user_id}/user-posts/")
+
+    def test_leaderboards(self):
+        for url in ("/blogs-list/top-liked-posts/", "/blogs-list/most-commented-posts/"):
+            self.client.get(url)  # first read builds the board
+            small, _ = self.count_queries(f"{url}?limit=1")
+            large, data = self.count_queries(f"{url}?limit=5")
+            self.assertEqual(small, large)
+            self.assertEqual(len(data), 5)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        author = User.objects.create_user(email="author@example.com", username="author")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag = Tag.objects.create(name="walks")
+        # three posts per timestamp, so pages split rows with equal created_at
+        stamps = [timezone.now() - timedelta(hours=hours) for hours in (1, 1, 1, 2, 2, 2, 3)]
+        self.posts = []
+        for i, stamp in enumerate(stamps):
+            post = create_post(author, f"post{i}", tags=[self.tag] if i % 2 else [])
+            BlogPost.objects.filter(post_id=post.post_id).update(created_at=stamp)
+            self.posts.append(post)
+
+    def walk(self, query):
+        seen, cursor = [], None
+        while True:
+            url = f"/blogs-list/?page_size=2&{query}" + (f"&cursor={cursor}" if cursor else "")
+            response = APIClient().get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data["results"]), 2)
+            seen += [row["post_id"] for row in data["results"]]
+            cursor = data["next"]
+            if cursor is None:
+                return seen
+
+    def expected(self, posts):
+        return list(
+            BlogPost.objects.filter(post_id__in=[post.post_id for post in posts])
+            .order_by("-created_at", "-post_id")
+            .values_list("post_id", flat=True)
+        )
+
+    def test_cursors_walk_every_post_once(self):
+        self.assertEqual(self.walk(""), self.expected(self.posts))
+
+    def test_cursors_compose_with_the_tag_filter(self):
+        tagged = [post for i, post in enumerate(self.posts) if i % 2]
+        self.assertEqual(self.walk(f"tag_id={self.tag.tag_id}"), self.expected(tagged))
+
+    def test_malformed_cursors_are_refused(self):
+        for cursor in ("not-a-cursor", encode_payload([1, 2]), encode_payload({"c": "yesterday", "p": 1})):
+            response = APIClient().get(f"/blogs-list/?cursor={cursor}")
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {"error": "Invalid cursor."})
+
+
+class ConditionalCacheTests(TestCase):
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.client = APIClient()
+        author = User.objects.create_user(email="author@example.com", username="author")
+        self.post = create_post(author, "post", likes=2, comments=1)
+
+    def get(self, url, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **headers)
+        return response, len(queries)
+
+    def test_cached_hits_answer_conditional_gets_without_queries(self):
+        for url in ("/blogs-list/", f"/blogs-list/{self.post.post_id}/"):
+            first, _ = self.get(url)
+            self.assertEqual(first.status_code, 200)
+            etag = first["ETag"]
+
+            hit, queries = self.get(url)
+            self.assertEqual((hit.status_code, queries), (200, 0))
+            self.assertEqual(hit["ETag"], etag)
+            self.assertEqual(hit.content, first.content)
+
+            not_modified, queries = self.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual((not_modified.status_code, queries), (304, 0))
+
+            other, queries = self.get(url, HTTP_IF_NONE_MATCH='"something-else"')
+            self.assertEqual((other.status_code, queries), (200, 0))
+
+    def test_a_write_invalidates_the_stored_validators(self):
+        url = f"/blogs-list/{self.post.post_id}/"
+        etag = self.get(url)[0]["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BlogPost.objects.filter(post_id=self.post.post_id).update(
+                title="edited", updated_at=timezone.now()
+            )
+            bump("blogs", f"post:{self.post.post_id}")
+
+        response, _ = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["title"], "edited")
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.author = User.objects.create_user(email="author@example.com", username="author")
+
+    def test_highlights_escape_the_post_text(self):
+        create_post(self.author, '<img src=x onerror="alert(1)"> gardening notes')
+        BlogPost.objects.update(content="<script>steal()</script> more gardening tips")
+
+        hit = APIClient().get("/blogs-search/?q=gardening").json()["results"][0]
+        self.assertEqual(
+            hit["title_highlight"],
+            "&lt;img src=x onerror=&quot;alert(1)&quot;&gt; <mark>gardening</mark> notes",
+        )
+        self.assertNotIn("<script>", hit["snippet"])
+        self.assertIn("&lt;script&gt;", hit["snippet"])
+        self.assertIn("<mark>gardening</mark>", hit["snippet"])
+
+        pattern = search.highlight_pattern("gardening")
+        self.assertEqual(hit["title_highlight"], search.highlight(hit["title"], pattern))
+        self.assertEqual(
+            search.snippet("<b>bold</b> gardening", pattern),
+            "&lt;b&gt;bold&lt;/b&gt; <mark>gardening</mark>",
+        )
+
+
+class InvertedIndexTests(TestCase):
+    POSTS = [
+        ("Running shoes", "A review of shoes for runners."),
+        ("Morning run", "I run every morning before work."),
+        ("Gardening notes", "The gardens are full of roses."),
+        ("Relational databases", "Normalization and relations explained."),
+    ]
+    QUERIES = ["running", "run", "runs", "garden", "gardening", "gard", "relation", "shoe review"]
+
+    def setUp(self):
+        self.author = User.objects.create_user(email="author@example.com", username="author")
+        self.posts = [create_post(self.author, title) for title, _ in self.POSTS]
+        for post, (_, content) in zip(self.posts, self.POSTS):
+            BlogPost.objects.filter(post_id=post.post_id).update(content=content)
+        self.path = os.path.join(temp_dir(self), "search_index.bin")
+
+    def memory_ids(self, index, q):
+        return {post_id for _, post_id in index.search(q, 50)}
+
+    def test_memory_backend_stems_like_fts5(self):
+        post_index = search.PostIndex(self.path, sync_interval=3600)
+        post_index.rebuild()
+        for q in self.QUERIES:
+            fts_ids = {hit["post_id"] for hit in search.fts_search(q, 50, None, None, None)}
+            self.assertEqual(self.memory_ids(post_index.index, q), fts_ids, q)
+        self.assertEqual(len(self.memory_ids(post_index.index, "running")), 2)
+
+    def test_snapshot_round_trip_with_updates_and_deletes(self):
+        built = search.PostIndex(self.path, sync_interval=3600)
+        built.rebuild()
+
+        loaded = search.PostIndex(self.path, sync_interval=3600)
+        index = loaded.get()
+        self.assertIsNotNone(index._snap)
+        for q in self.QUERIES:
+            self.assertEqual(index.search(q, 50), built.index.search(q, 50), q)
+
+        first, second = self.posts[0].post_id, self.posts[1].post_id
+        # re-index a post with new text: terms copied out of the mmapped snapshot
+        index.add(first, "Cycling shoes", "Clipless pedals.", self.author.user_id)
+        index.remove(second)
+        self.assertEqual(self.memory_ids(index, "running"), set())
+        self.assertEqual(self.memory_ids(index, "shoes"), {first})
+        self.assertEqual(self.memory_ids(index, "cycle"), {first})
+
+        index.save(self.path)
+        reloaded, _ = InvertedIndex.load(self.path)
+        self.assertEqual(reloaded.stats()["dead_docnums"], 0)
+        for q in self.QUERIES + ["cycling", "pedal"]:
+            self.assertEqual(reloaded.search(q, 50), index.search(q, 50), q)
+
+    def test_missing_snapshot_is_built_off_the_request(self):
+        post_index = search.PostIndex(self.path, sync_interval=3600)
+        with mock.patch.object(search.PostIndex, "_start_build") as start_build:
+            with self.assertRaises(search.SearchIndexNotReady):
+                post_index.get()
+        start_build.assert_called_once()
+
+
+class RoutePolicyTests(TestCase):
+    # every route in the URLconf, with who may call it
+    API_ROUTES = {
+        "signup/": PUBLIC,
+        "login/": PUBLIC,
+        "password-reset/": PUBLIC,
+        "password-reset-confirm/<uidb64>/<token>/": PUBLIC,
+        "me/": AUTHENTICATED,
+        "change-password/": AUTHENTICATED,
+        "blogs-create/": AUTHENTICATED,
+        "blogs-update/<int:blog_id>/": AUTHENTICATED,
+        "blogs-list/": PUBLIC,
+        "blogs-search/": PUBLIC,
+        "blogs-list/tag-facets/": PUBLIC,
+        "blogs-list/get-all-user/": PUBLIC,
+        "blogs-list/users/<int:user_id>/": PUBLIC,
+        "blogs-list/<int:user_id>/user-posts/": PUBLIC,
+        "blogs-list/top-liked-posts/": PUBLIC,
+        "blogs-list/most-commented-posts/": PUBLIC,
+        "blogs-list/<int:post_id>/": PUBLIC,
+        "blogs/<int:post_id>/like/": AUTHENTICATED,
+        "blogs/<int:post_id>/comment/": AUTHENTICATED,
+        "comments/<int:comment_id>/update/": AUTHENTICATED,
+        "comments/<int:comment_id>/delete/": AUTHENTICATED,
+        "tags/add/": AUTHENTICATED,
+        "list-tags/": PUBLIC,
+        "moderation/stats/": AUTHENTICATED,
+        "uploads/<int:job_id>/": AUTHENTICATED,
+        "media/<path:name>": PUBLIC,
+    }
+
+    def test_every_route_has_the_expected_policy(self):
+        policies = compile_policies()
+        admin = {route: policy for route, policy in policies.items() if route.startswith("admin/")}
+        self.assertTrue(admin)
+        self.assertEqual(set(admin.values()), {PUBLIC})
+        api = {route: policy for route, policy in policies.items() if route not in admin}
+        self.assertEqual(api, self.API_ROUTES)
+
+    def test_middleware_enforces_the_policy(self):
+        client = APIClient()
+        response = client.get("/me/")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.content, b"Unauthorized: Token is missing")
+        self.assertEqual(client.get("/blogs-list/").status_code, 200)
+
+        user = User.objects.create_user(email="reader@example.com", username="reader")
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        self.assertEqual(client.get("/me/").status_code, 200)
+
+        client.credentials(HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(client.get("/me/").status_code, 401)
+
+
+class TagRegistryTests(TestCase):
+    def setUp(self):
+        # the registry reloads when the cached "tags" version changes
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.author = User.objects.create_user(email="author@example.com", username="author")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.author).access_token}")
+
+    def test_tags_changed_outside_add_tag_reach_the_registry(self):
+        self.assertEqual(self.client.get("/list-tags/").json(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(name="gardening")
+        self.assertEqual(
+            self.client.get("/list-tags/").json(), [{"tag_id": tag.tag_id, "name": "gardening"}]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.delete()
+        response = self.client.post(
+            "/blogs-create/", {"title": "A quiet walk", "content": "Morning light.", "tags": [tag.tag_id]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["unknown_tags"], [tag.tag_id])
+        self.assertFalse(BlogPost.objects.exists())
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        author = User.objects.create_user(email="author@example.com", username="author")
+        self.post = create_post(author)
+        self.clients = []
+        for name in ("reader", "writer"):
+            user = User.objects.create_user(email=f"{name}@example.com", username=name)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+            self.clients.append(client)
+
+    def counters(self):
+        self.post.refresh_from_db()
+        return self.post.likes_count, self.post.comments_count
+
+    def test_likes_and_comments_update_the_counters(self):
+        reader, writer = self.clients
+        like = f"/blogs/{self.post.post_id}/like/"
+        comment = f"/blogs/{self.post.post_id}/comment/"
+        reader.post(like)
+        writer.post(like)
+        self.assertEqual(self.counters(), (2, 0))
+        # liking again takes the like back
+        self.assertEqual(reader.post(like).json(), {"message": "Like removed!"})
+        self.assertEqual(self.counters(), (1, 0))
+
+        first = reader.post(comment, {"text": "Nice"}, format="json").json()["comment_id"]
+        writer.post(comment, {"text": "Agreed"}, format="json")
+        self.assertEqual(self.counters(), (1, 2))
+        # only the author can delete a comment
+        self.assertEqual(writer.delete(f"/comments/{first}/delete/").status_code, 403)
+        self.assertEqual(reader.delete(f"/comments/{first}/delete/").status_code, 200)
+        self.assertEqual(self.counters(), (1, 1))
+        self.assertEqual(self.counters(), (Like.objects.count(), Comment.objects.count()))
+
+    def test_reconcile_counters_repairs_drift(self):
+        reader, writer = self.clients
+        reader.post(f"/blogs/{self.post.post_id}/like/")
+        writer.post(f"/blogs/{self.post.post_id}/comment/", {"text": "Nice"}, format="json")
+        BlogPost.objects.filter(post_id=self.post.post_id).update(likes_count=7, comments_count=0)
+
+        out = io.StringIO()
+        call_command("reconcile_counters", stdout=out)
+        self.assertIn("Fixed counters on 1 post(s).", out.getvalue())
+        self.assertEqual(self.counters(), (1, 1))
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="Secret@123"
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+
+    def test_an_old_token_is_refused_once_the_user_is_deactivated(self):
+        self.assertEqual(self.client.get("/me/").status_code, 200)
+        # served from the cache now
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/me/").status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get("/me/").status_code, 401)
+
+    def test_a_deleted_user_is_forgotten(self):
+        self.assertEqual(self.client.get("/me/").status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.client.get("/me/").status_code, 401)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.author = User.objects.create_user(email="author@example.com", username="author")
+        self.board = Leaderboard(size=2, refresh_interval=300)
+
+    def set_likes(self, post, likes):
+        BlogPost.objects.filter(post_id=post.post_id).update(likes_count=likes)
+
+    def like(self, post, delta):
+        BlogPost.objects.filter(post_id=post.post_id).update(likes_count=F("likes_count") + delta)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.board.record(post.post_id, "likes", delta, timezone.now())
+
+    def exact_top(self):
+        return list(
+            BlogPost.objects.filter(likes_count__gt=0)
+            .order_by("-likes_count", "-post_id")
+            .values_list("post_id", "likes_count")[:2]
+        )
+
+    def test_top_k_stays_exact_as_likes_change(self):
+        posts = [create_post(self.author, title=f"post {i}") for i in range(6)]
+        for post, likes in zip(posts, [6, 5, 4, 3, 2, 1]):
+            self.set_likes(post, likes)
+        self.assertEqual(self.board.top("likes", "all"), self.exact_top())
+
+        # posts enter and leave the candidates, some from outside them
+        for index, delta in [(5, 6), (0, -5), (4, 3), (1, -5), (3, 4), (2, -4), (5, -7)]:
+            self.like(posts[index], delta)
+            self.assertEqual(self.board.top("likes", "all"), self.exact_top())
+
+        with self.assertNumQueries(0):
+            self.board.top("likes", "all")
+
+    def test_windowed_scores_expire(self):
+        old, recent = create_post(self.author, title="old"), create_post(self.author, title="recent")
+        now = timezone.now()
+        PostEngagementBucket.objects.create(post=old, hour=bucket_hour(now - timedelta(days=2)), likes=5)
+        PostEngagementBucket.objects.create(post=old, hour=bucket_hour(now - timedelta(days=8)), likes=9)
+        PostEngagementBucket.objects.create(post=recent, hour=bucket_hour(now), likes=1)
+        self.assertEqual(self.board.top("likes", "24h"), [(recent.post_id, 1)])
+        self.assertEqual(self.board.top("likes", "7d"), [(old.post_id, 5), (recent.post_id, 1)])
+
+        # the like ages out of the 24h window: dropped on the next refresh
+        PostEngagementBucket.objects.filter(post=recent).update(hour=bucket_hour(now - timedelta(days=2)))
+        self.assertEqual(self.board.top("likes", "24h"), [(recent.post_id, 1)])
+        with mock.patch("api.leaderboard.monotonic", return_value=monotonic() + 301):
+            self.assertEqual(self.board.top("likes", "24h"), [])
+
+    def test_reads_dont_write_and_the_command_saves_snapshots(self):
+        post = create_post(self.author)
+        self.set_likes(post, 3)
+        old_hour = bucket_hour(timezone.now() - timedelta(days=8))
+        PostEngagementBucket.objects.create(post=post, hour=old_hour, likes=3)
+
+        with CaptureQueriesContext(connection) as queries:
+            for window in ("all", "7d", "24h"):
+                response = APIClient().get(f"/blogs-list/top-liked-posts/?window={window}")
+                self.assertEqual(response.status_code, 200)
+        writes = [q for q in queries.captured_queries if not q["sql"].startswith("SELECT")]
+        self.assertEqual(writes, [])
+
+        call_command("refresh_leaderboards", "--once", stdout=io.StringIO())
+        self.assertFalse(PostEngagementBucket.objects.exists())
+        self.assertEqual(
+            list(LeaderboardEntry.objects.filter(window="all", metric="likes").values_list("post_id", "score")),
+            [(post.post_id, 3)],
+        )
+
+        # a new process starts from the snapshot
+        with self.assertNumQueries(1):
+            self.assertEqual(Leaderboard(size=2, refresh_interval=300).top("likes", "all"), [(post.post_id, 3)])
+
+
+class TagCountTests(TestCase):
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.author = User.objects.create_user(email="author@example.com", username="author")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.author).access_token}")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a, self.b, self.c = [Tag.objects.create(name=name) for name in ("a", "b", "c")]
+        use_fake_model(self, moderation.FakeModerationModel())
+
+    def stored(self):
+        rows = TagPairCount.objects.filter(post_count__gt=0).select_related("tag", "other")
+        return {(row.tag.name, row.other.name): row.post_count for row in rows}
+
+    def assertCounts(self, expected):
+        # the stored counts are what a rebuild from blog_post_tags gives
+        stored = self.stored()
+        self.assertEqual(stored, expected)
+        rebuild_tag_counts()
+        self.assertEqual(self.stored(), stored)
+
+    def pairs(self, *tag_sets):
+        counts = {}
+        for names in tag_sets:
+            for pair in product(names, repeat=2):
+                counts[pair] = counts.get(pair, 0) + 1
+        return counts
+
+    def create(self, tags, content="Morning light."):
+        response = self.client.post(
+            "/blogs-create/",
+            {"title": "A quiet walk", "content": content, "tags": [tag.tag_id for tag in tags]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()["post_id"]
+
+    def update(self, post_id, **data):
+        response = self.client.put(f"/blogs-update/{post_id}/", data, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_counts_follow_tag_edits(self):
+        first = self.create([self.a, self.b])
+        self.create([self.a])
+        self.assertCounts(self.pairs("ab", "a"))
+
+        self.update(first, tags=[self.b.tag_id, self.c.tag_id])
+        self.assertCounts(self.pairs("bc", "a"))
+
+    @override_settings(MODERATION_ASYNC=True, MODERATION_WORKERS=0)
+    def test_counts_follow_moderation(self):
+        post_id = self.create([self.a, self.b])
+        self.create([self.b, self.c])
+        self.assertCounts(self.pairs("ab", "bc"))
+
+        # an edit waiting for review leaves the counts
+        self.update(post_id, content="How to win at chess")
+        self.assertCounts(self.pairs("bc"))
+        moderation_queue.run_pending()
+        self.assertCounts(self.pairs("ab", "bc"))
+
+        self.update(post_id, content="A crypto scam for you")
+        moderation_queue.run_pending()
+        self.assertEqual(BlogPost.objects.get(post_id=post_id).status, BlogPost.REJECTED)
+        self.assertCounts(self.pairs("bc"))
+
+        # tags edited while rejected are counted once it is published again
+        self.update(post_id, content="How to win at chess", tags=[self.a.tag_id, self.c.tag_id])
+        self.assertCounts(self.pairs("bc"))
+        moderation_queue.run_pending()
+        self.assertCounts(self.pairs("ac", "bc"))
+
+
+class TagFacetTests(TestCase):
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        author = User.objects.create_user(email="author@example.com", username="author")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a, self.b, self.c = [Tag.objects.create(name=name) for name in ("a", "b", "c")]
+        for tags in ([self.a, self.b], [self.a, self.c], [self.b, self.c], [self.a, self.b, self.c]):
+            set_post_tags(create_post(author), [tag.tag_id for tag in tags], counted=True)
+
+    def facets(self, query):
+        response = APIClient().get(f"/blogs-list/tag-facets/?{query}")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data["total"], {facet["name"]: facet["count"] for facet in data["facets"]}
+
+    def test_facets_follow_the_listing_filter(self):
+        self.assertEqual(self.facets(""), (4, {"a": 3, "b": 3, "c": 3}))
+        self.assertEqual(self.facets(f"tag_id={self.a.tag_id}"), (3, {"b": 2, "c": 2}))
+        tags = f"tags={self.a.tag_id},{self.b.tag_id}"
+        self.assertEqual(self.facets(f"{tags}&mode=all"), (2, {"c": 1}))
+        self.assertEqual(self.facets(f"{tags}&mode=any"), (4, {"c": 3}))
+
+        # the totals are what the listing shows
+        listed = APIClient().get(f"/blogs-list/?{tags}&mode=all").json()["results"]
+        self.assertEqual(len(listed), 2)
+
+    def test_multi_tag_facets_are_bounded(self):
+        tags = f"tags={self.a.tag_id},{self.b.tag_id}"
+        with override_settings(TAG_FACETS_MAX_POSTS=2):
+            self.assertEqual(self.facets(f"{tags}&mode=all"), (2, {"c": 1}))
+            response = APIClient().get(f"/blogs-list/tag-facets/?{tags}&mode=any")
+            self.assertEqual(response.status_code, 400)
+            # a single tag reads the stored counts, whatever its size
+            self.assertEqual(self.facets(f"tag_id={self.a.tag_id}"), (3, {"b": 2, "c": 2}))
+
+    def test_invalid_filters_are_refused(self):
+        self.assertEqual(APIClient().get("/blogs-list/tag-facets/?mode=some").status_code, 400)
+        response = APIClient().get("/blogs-list/tag-facets/?tags=missing")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["unknown_tags"], ["missing"])
+
+
+def use_fake_model(test, model):
+    """Moderate with `model` for the rest of the test, with an empty memory cache."""
+    patcher = mock.patch.object(
+        moderation, "moderation_client", moderation.ModerationClient("fake", 0, model=model)
+    )
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    moderation.verdict_cache.clear()
+    return model
+
+
+class ScriptedBatchModel(moderation.FakeModerationModel):
+    """The fake model, with batch replies rewritten by `reply`."""
+
+    def __init__(self, reply):
+        super().__init__()
+        self.reply = reply
+
+    def generate_content(self, prompt):
+        response = super().generate_content(prompt)
+        if "=== ITEM 1 " in prompt:
+            response.text = self.reply(response.text)
+        return response
+
+
+class ModerationTests(TestCase):
+    texts = ["A walk in the park", "Cheap spam here", "Notes on gardening"]
+    verdicts = [(True, ""), (False, "contains spam"), (True, "")]
+
+    def test_a_batch_is_one_model_call_and_is_cached(self):
+        model = use_fake_model(self, moderation.FakeModerationModel())
+        self.assertEqual(moderation.check_contents(self.texts, prefiltered=True), self.verdicts)
+        self.assertEqual(model.calls, 1)
+
+        # every verdict is cached, identical texts are asked once
+        self.assertEqual(moderation.check_contents(self.texts[:2], prefiltered=True), self.verdicts[:2])
+        self.assertEqual(model.calls, 1)
+        texts = ["Fresh text", "fresh  TEXT", "More spam"]
+        self.assertEqual(
+            moderation.check_contents(texts, prefiltered=True),
+            [(True, ""), (True, ""), (False, "contains spam")],
+        )
+        self.assertEqual(model.calls, 2)
+
+    def test_a_single_miss_uses_the_single_prompt(self):
+        model = use_fake_model(self, ScriptedBatchModel(lambda text: "garbage"))
+        self.assertEqual(moderation.check_contents(["Only spam"], prefiltered=True), [(False, "contains spam")])
+        self.assertEqual(model.calls, 1)
+
+    def test_unusable_batch_replies_fall_back_to_single_calls(self):
+        replies = [
+            lambda text: "Sorry, I can't help with that.",
+            lambda text: text.splitlines()[0],
+            lambda text: text + "\n2: APPROPRIATE",
+            lambda text: text.replace("1:", "7:"),
+        ]
+        for reply in replies:
+            model = use_fake_model(self, ScriptedBatchModel(reply))
+            self.assertEqual(moderation.check_contents(self.texts, prefiltered=True), self.verdicts)
+            self.assertEqual(model.calls, 1 + len(self.texts))
+            ModerationVerdict.objects.all().delete()
+
+    def test_model_errors_are_raised_and_nothing_is_cached(self):
+        model = use_fake_model(self, moderation.FakeModerationModel())
+        with mock.patch.object(model, "generate_content", side_effect=ConnectionError("down")):
+            with self.assertRaises(ConnectionError):
+                moderation.check_contents(self.texts, prefiltered=True)
+        self.assertFalse(ModerationVerdict.objects.exists())
+
+    def test_verdict_cache_counts_hits_and_evicts(self):
+        cache = moderation.VerdictCache(max_entries=2, db_max_entries=2, ttl=60)
+        cache.set("a", (True, ""))
+        cache.set("b", (False, "spam"))
+        self.assertEqual(cache.get("a"), (True, ""))
+        # least recently used: "b" leaves memory, the table still has it
+        cache.set("c", (True, ""))
+        self.assertEqual(cache.get("b"), (False, "spam"))
+        self.assertIsNone(cache.get("d"))
+        stats = cache.stats()
+        self.assertEqual((stats["memory_hits"], stats["db_hits"], stats["misses"]), (1, 1, 1))
+        self.assertEqual(stats["memory_entries"], 2)
+
+        # both tiers expire after the TTL
+        later = moderation.monotonic() + 61
+        ModerationVerdict.objects.update(expires_at=timezone.now())
+        with mock.patch.object(moderation, "monotonic", return_value=later):
+            self.assertIsNone(cache.get("c"))
+        self.assertEqual(cache.stats()["misses"], 2)
+
+        # the table keeps the db_max_entries most recently used rows
+        ModerationVerdict.objects.update(expires_at=timezone.now() + timedelta(hours=1))
+        for age, key in enumerate(["c", "b", "a"]):
+            ModerationVerdict.objects.filter(content_hash=key).update(
+                last_used_at=timezone.now() - timedelta(minutes=age)
+            )
+        cache.prune()
+        self.assertEqual(set(ModerationVerdict.objects.values_list("content_hash", flat=True)), {"b", "c"})
+
+
+@override_settings(MODERATION_ASYNC=True, MODERATION_WORKERS=0)
+class ModerationQueueTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(email="author@example.com", username="author")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.author).access_token}")
+        self.model = use_fake_model(self, moderation.FakeModerationModel())
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+
+    def create(self, content):
+        response = self.client.post("/blogs-create/", {"title": "Notes", "content": content}, format="json")
+        self.assertEqual(response.status_code, 201)
+        return BlogPost.objects.get(post_id=response.json()["post_id"])
+
+    def test_the_prefilter_runs_once_per_queued_post(self):
+        escalated = prefilter.escalated
+        post = self.create("How to win at chess")
+        self.assertEqual(post.status, BlogPost.PENDING_REVIEW)
+
+        self.assertEqual(moderation_queue.run_pending(), 1)
+        post.refresh_from_db()
+        self.assertEqual(post.status, BlogPost.PUBLISHED)
+        self.assertEqual(self.model.calls, 1)
+        self.assertEqual(prefilter.escalated, escalated + 1)
+
+    def test_queued_posts_are_published_or_rejected(self):
+        good = self.create("How to win at chess")
+        bad = self.create("A crypto scam for you")
+        self.assertEqual(APIClient().get("/blogs-list/").json()["results"], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(moderation_queue.run_pending(), 2)
+        good.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual(good.status, BlogPost.PUBLISHED)
+        self.assertEqual((bad.status, bad.moderation_reason), (BlogPost.REJECTED, "contains scam"))
+        self.assertEqual(list(ModerationJob.objects.values_list("status", flat=True)), [ModerationJob.DONE] * 2)
+        listed = APIClient().get("/blogs-list/").json()["results"]
+        self.assertEqual([row["post_id"] for row in listed], [good.post_id])
+
+    def test_an_edit_supersedes_the_queued_job(self):
+        post = self.create("How to win at chess")
+        response = self.client.put(
+            f"/blogs-update/{post.post_id}/", {"content": "Now with a scam"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(ModerationJob.objects.order_by("job_id").values_list("status", flat=True)),
+            [ModerationJob.SUPERSEDED, ModerationJob.QUEUED],
+        )
+
+        self.assertEqual(moderation_queue.run_pending(), 1)
+        post.refresh_from_db()
+        self.assertEqual(post.status, BlogPost.REJECTED)
+        self.assertEqual(self.model.calls, 1)
+
+    def test_an_edit_accepted_in_the_request_publishes_the_post(self):
+        rejected = self.create("A crypto scam for you")
+        moderation_queue.run_pending()
+        pending = self.create("Another crypto scam for you")
+        clean = {"content": "A lovely walk in the park with my family"}
+
+        for post in (rejected, pending):
+            response = self.client.put(f"/blogs-update/{post.post_id}/", clean, format="json")
+            self.assertEqual(response.status_code, 200)
+        # the pending post's job judged the old text
+        self.assertEqual(moderation_queue.run_pending(), 0)
+        self.assertEqual(
+            list(ModerationJob.objects.order_by("job_id").values_list("status", flat=True)),
+            [ModerationJob.DONE, ModerationJob.SUPERSEDED],
+        )
+        for post in (rejected, pending):
+            post.refresh_from_db()
+            self.assertEqual((post.status, post.moderation_reason), (BlogPost.PUBLISHED, ""))
+
+    def test_a_running_job_doesnt_override_a_later_edit(self):
+        post = self.create("How to win at chess")
+        job = moderation_queue.claim_jobs(1)[0]
+        self.client.put(
+            f"/blogs-update/{post.post_id}/", {"content": "A lovely walk in the park"}, format="json"
+        )
+        with mock.patch.object(self.model, "generate_content", side_effect=ConnectionError("down")):
+            moderation_queue.process_jobs([job])
+        job.refresh_from_db()
+        self.assertEqual(job.status, ModerationJob.SUPERSEDED)
+
+        moderation_queue.apply_verdict(job, False, "contains scam")
+        post.refresh_from_db()
+        self.assertEqual(post.status, BlogPost.PUBLISHED)
+
+    def test_unpublished_posts_leave_the_leaderboard(self):
+        def ranked():
+            response = APIClient().get("/blogs-list/top-liked-posts/")
+            return [row["post_id"] for row in response.json()]
+
+        leaderboard.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            post_id = self.create("A lovely walk in the park").post_id
+            self.client.post(f"/blogs/{post_id}/like/")
+        self.assertEqual(ranked(), [post_id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f"/blogs-update/{post_id}/", {"content": "How to win at chess"}, format="json")
+        self.assertEqual(ranked(), [])
+        self.assertEqual(leaderboard.top("likes", "all"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moderation_queue.run_pending()
+        self.assertEqual(ranked(), [post_id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f"/blogs-update/{post_id}/", {"content": "A crypto scam for you"}, format="json")
+            moderation_queue.run_pending()
+        self.assertEqual(BlogPost.objects.get(post_id=post_id).status, BlogPost.REJECTED)
+        self.assertEqual(ranked(), [])
+        self.assertEqual(leaderboard.top("likes", "all"), [])
+
+    @override_settings(MODERATION_MAX_ATTEMPTS=2)
+    def test_failing_moderation_retries_then_publishes(self):
+        post = self.create("How to win at chess")
+        job = ModerationJob.objects.get()
+        with mock.patch.object(self.model, "generate_content", side_effect=ConnectionError("down")):
+            for attempt in range(1, 3):
+                ModerationJob.objects.filter(job_id=job.job_id).update(run_after=job.created_at)
+                self.assertEqual(moderation_queue.run_pending(), 1)
+                job.refresh_from_db()
+                self.assertEqual(job.attempts, attempt)
+                post.refresh_from_db()
+                self.assertEqual(post.status, BlogPost.PENDING_REVIEW if attempt < 2 else BlogPost.PUBLISHED)
+        self.assertEqual(job.status, ModerationJob.DONE)
+
+    def test_abandoned_jobs_are_requeued(self):
+        self.create("How to win at chess")
+        job = ModerationJob.objects.get()
+        ModerationJob.objects.filter(job_id=job.job_id).update(
+            status=ModerationJob.RUNNING, updated_at=timezone.now() - timedelta(minutes=10)
+        )
+        self.assertEqual(moderation_queue.requeue_stale(timedelta(minutes=15)), 0)
+        self.assertEqual(moderation_queue.requeue_stale(timedelta(minutes=5)), 1)
+        self.assertEqual(moderation_queue.run_pending(), 1)
+        self.assertEqual(BlogPost.objects.get().status, BlogPost.PUBLISHED)
+
+    def test_unpublished_posts_cant_be_liked_or_commented(self):
+        post = self.create("How to win at chess")
+        like = f"/blogs/{post.post_id}/like/"
+        comment = f"/blogs/{post.post_id}/comment/"
+        self.assertEqual(self.client.post(like).status_code, 404)
+        self.assertEqual(self.client.post(comment, {"text": "Nice"}, format="json").status_code, 404)
+
+        moderation_queue.run_pending()
+        self.assertEqual(self.client.post(like).status_code, 200)
+        self.assertEqual(self.client.post(comment, {"text": "Nice"}, format="json").status_code, 201)
+
+
+@override_settings(MEDIA_STORAGE="fake", UPLOAD_WORKERS=0)
+class BackgroundUploadTests(TestCase):
+    def setUp(self):
+        rate_limiter.clear()
+        spool = self.settings(MEDIA_SPOOL_DIR=temp_dir(self))
+        spool.enable()
+        self.addCleanup(spool.disable)
+
+    def signup(self, picture, email="painter@example.com"):
+        return APIClient().post(
+            "/signup/",
+            {
+                "username": "painter",
+                "email": email,
+                "password": "Secret@123",
+                "profile_picture": picture,
+            },
+            format="multipart",
+        )
+
+    def test_signup_returns_before_the_upload_and_the_worker_sets_the_url(self):
+        response = self.signup(image_file())
+        self.assertEqual(response.status_code, 201)
+        upload = response.json()["profile_picture_upload"]
+        self.assertEqual(upload["status"], UploadJob.QUEUED)
+
+        user = User.objects.get(email="painter@example.com")
+        self.assertIsNone(user.profile_picture)
+
+        self.assertEqual(uploads.run_pending(), 1)
+        user.refresh_from_db()
+        self.assertTrue(user.profile_picture.startswith("https://uploads.invalid/"))
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        data = client.get(f"/uploads/{upload['job_id']}/").json()
+        self.assertEqual(data["status"], UploadJob.DONE)
+        self.assertEqual(data["url"], user.profile_picture)
+
+    def test_failed_uploads_are_retried_then_given_up(self):
+        self.signup(image_file())
+        job = UploadJob.objects.get()
+
+        class Broken:
+            def save(self, path):
+                raise ConnectionError("cloud is down")
+
+        for attempt in range(1, 4):
+            with override_settings(UPLOAD_MAX_ATTEMPTS=3):
+                UploadJob.objects.filter(job_id=job.job_id).update(run_after=job.created_at)
+                uploads.process_job(uploads.claim_job(), Broken())
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+        self.assertEqual(job.status, UploadJob.FAILED)
+        self.assertEqual(job.error, "cloud is down")
+
+    def test_images_are_validated_resized_and_stripped(self):
+        response = self.signup(SimpleUploadedFile("me.png", b"not really a png"))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.exists())
+
+        exif = Image.Exif()
+        exif[0x010F] = "PhoneMaker"
+        with override_settings(IMAGE_MAX_WIDTH=32, IMAGE_MAX_HEIGHT=32):
+            self.signup(image_file(size=(640, 480), exif=exif.tobytes()))
+            job = UploadJob.objects.get()
+            uploads.prepare(job)
+        with Image.open(job.path) as prepared:
+            self.assertEqual(prepared.size, (32, 24))
+            self.assertNotIn("exif", prepared.info)
+
+    def test_same_image_reuses_the_uploaded_url(self):
+        self.signup(image_file(), email="first@example.com")
+        uploads.run_pending()
+        first = User.objects.get(email="first@example.com")
+
+        response = self.signup(image_file(), email="second@example.com")
+        upload = response.json()["profile_picture_upload"]
+        self.assertEqual(upload["status"], UploadJob.DONE)
+        self.assertEqual(response.json()["profile_picture"], first.profile_picture)
+        self.assertEqual(User.objects.get(email="second@example.com").profile_picture, first.profile_picture)
+        self.assertEqual(uploads.run_pending(), 0)
+
+    def test_local_storage_serves_ranges(self):
+        with override_settings(MEDIA_STORAGE="local", MEDIA_ROOT=temp_dir(self)):
+            self.signup(image_file())
+            uploads.run_pending()
+            url = User.objects.get().profile_picture
+            self.assertTrue(url.startswith("/media/"))
+
+            client = APIClient()
+            whole = client.get(url)
+            self.assertEqual(whole.status_code, 200)
+            body = b"".join(whole.streaming_content)
+            self.assertEqual(whole["Content-Type"], "image/jpeg")
+
+            part = client.get(url, HTTP_RANGE="bytes=10-19")
+            self.assertEqual(part.status_code, 206)
+            self.assertEqual(part["Content-Range"], f"bytes 10-19/{len(body)}")
+            self.assertEqual(b"".join(part.streaming_content), body[10:20])
+
+            tail = client.get(url, HTTP_RANGE="bytes=-5")
+            self.assertEqual(b"".join(tail.streaming_content), body[-5:])
+            self.assertEqual(client.get(url, HTTP_RANGE=f"bytes={len(body)}-").status_code, 416)
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=whole["ETag"]).status_code, 304)
+            self.assertEqual(client.get("/media/../settings.py").status_code, 404)
+
+    def test_ranges_close_the_file_and_ignore_malformed_ranges(self):
+        root = temp_dir(self)
+        path = os.path.join(root, "abc.txt")
+        with open(path, "wb") as f:
+            f.write(b"0123456789")
+
+        opened = []
+
+        def tracked_open(*args, **kwargs):
+            opened.append(open(*args, **kwargs))
+            return opened[-1]
+
+        factory = RequestFactory()
+        with mock.patch("api.storage.open", tracked_open, create=True):
+            # a HEAD request or a client that hangs up never reads the body
+            response = media_response(factory.head("/", HTTP_RANGE="bytes=2-5"), path)
+            self.assertEqual(response.status_code, 206)
+            response.close()
+            self.assertTrue(opened[-1].closed)
+
+            response = media_response(factory.get("/", HTTP_RANGE="bytes=5-3"), path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+            response.close()
+
+
+@override_settings(EMAIL_WORKERS=0)
+class OutboxTests(TestCase):
+    def setUp(self):
+        rate_limiter.clear()
+        self.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="Secret@123"
+        )
+
+    def request_reset(self):
+        return APIClient().post("/password-reset/", {"email": "reader@example.com"}, format="json")
+
+    def test_reset_is_queued_once_and_sent_by_the_worker(self):
+        for _ in range(3):
+            self.assertEqual(self.request_reset().status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+        # only the recipient and site are stored, not the body or a token
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.user, self.user)
+        self.assertEqual(set(email.context), {"domain"})
+
+        self.assertEqual(outbox.run_pending(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["reader@example.com"])
+        self.assertIn("/password-reset-confirm/", mail.outbox[0].body)
+        self.assertEqual(OutgoingEmail.objects.get().status, OutgoingEmail.SENT)
+
+        # still inside the dedup window after sending (the per-account
+        # rate limit would refuse the request first)
+        rate_limiter.clear()
+        self.request_reset()
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+    def test_failed_sends_are_retried_then_given_up(self):
+        self.request_reset()
+        email = OutgoingEmail.objects.get()
+
+        with override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=1,
+            EMAIL_MAX_ATTEMPTS=2,
+        ):
+            for attempt in range(1, 3):
+                OutgoingEmail.objects.filter(pk=email.pk).update(run_after=email.created_at)
+                self.assertEqual(outbox.run_pending(), 1)
+                email.refresh_from_db()
+                self.assertEqual(email.attempts, attempt)
+        self.assertEqual(email.status, OutgoingEmail.FAILED)
+        self.assertNotEqual(email.last_error, "")
+
+        # a failed mail doesn't block a new request
+        self.request_reset()
+        self.assertEqual(OutgoingEmail.objects.filter(status=OutgoingEmail.QUEUED).count(), 1)
+
+    def test_old_sent_and_failed_mail_is_pruned(self):
+        self.request_reset()
+        outbox.run_pending()
+        queued = OutgoingEmail.objects.create(
+            kind=OutgoingEmail.PASSWORD_RESET, dedup_key="other", user=self.user,
+            to_email="reader@example.com", subject="Password Reset Request",
+        )
+        old = timezone.now() - timedelta(days=8)
+        OutgoingEmail.objects.update(updated_at=old)
+
+        self.assertEqual(outbox.prune(timedelta(days=7)), 1)
+        self.assertEqual(list(OutgoingEmail.objects.all()), [queued])
+
+
+@override_settings(EMAIL_WORKERS=0)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        rate_limiter.clear()
+        self.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="Secret@123"
+        )
+
+    def login(self, client, password="wrong", email="reader@example.com"):
+        return client.post("/login/", {"email": email, "password": password}, format="json")
+
+    def test_login_is_limited_per_account_and_per_ip(self):
+        limits = {
+            "login": {"ip": "5/60", "account": "2/60"},
+            "signup": {},
+            "password_reset": {},
+        }
+        with override_settings(RATE_LIMITS=limits):
+            client = APIClient()
+            self.assertEqual(self.login(client).status_code, 401)
+            self.assertEqual(self.login(client).status_code, 401)
+            response = self.login(client, password="Secret@123")
+            self.assertEqual(response.status_code, 429)
+            self.assertGreater(int(response["Retry-After"]), 0)
+
+            # other accounts from the same IP, until the IP limit (the
+            # refused request above still counted for the IP)
+            self.assertEqual(self.login(client, email="other@example.com").status_code, 401)
+            self.assertEqual(self.login(client, email="third@example.com").status_code, 401)
+            self.assertEqual(self.login(client, email="fourth@example.com").status_code, 429)
+
+            # another client IP still gets through
+            other = APIClient(REMOTE_ADDR="10.0.0.2")
+            self.assertEqual(self.login(other, email="other@example.com").status_code, 401)
+
+    def test_password_reset_is_limited_before_mail_is_queued(self):
+        responses = [
+            APIClient().post("/password-reset/", {"email": "reader@example.com"}).status_code
+            for _ in range(5)
+        ]
+        self.assertEqual(responses, [200, 200, 200, 429, 429])
+
+    # request limits off, only the failed login counter is tested
+    @override_settings(RATE_LIMITS={"login": {}, "signup": {}, "password_reset": {}})
+    def test_failed_logins_send_a_reset_mail_without_writing_per_attempt(self):
+        client = APIClient()
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(4):
+                self.assertEqual(self.login(client).status_code, 401)
+        writes = [q for q in queries.captured_queries if not q["sql"].startswith("SELECT")]
+        self.assertEqual(writes, [])
+
+        self.assertEqual(self.login(client).status_code, 403)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+        # a successful login starts the count again
+        self.assertEqual(self.login(client, password="Secret@123").status_code, 200)
+        for _ in range(4):
+            self.assertEqual(self.login(client).status_code, 401)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+        # and the next reset mail is still within the dedup window
+        self.assertEqual(self.login(client).status_code, 403)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+    def test_database_counters_are_atomic_adds(self):
+        limiter = RateLimiter(DatabaseCounters())
+        self.assertEqual([limiter.hit("key", 2, 3600) for _ in range(3)][:2], [0, 0])
+        self.assertGreater(limiter.hit("key", 2, 3600), 0)
+        self.assertEqual(limiter.record("other", 3600), 1)
+        limiter.reset("key", 3600)
+        self.assertEqual(limiter.hit("key", 2, 3600), 0)
@@ -0,0 +1,216 @@
+import hashlib
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .images import InvalidImage, check_image, prepare_image
+from .models import BlogPost, MediaAsset, UploadJob, User
+from .response_cache import bump
+from .storage import file_sha256, get_storage, link_or_copy
+from .workers import WorkerPool
+
+# off-request image uploads
+# write endpoints check the image header, spool the file to MEDIA_SPOOL_DIR and
+# queue an UploadJob; worker threads (or the upload_worker command) resize and
+# re-encode it (api/images.py), store it (api/storage.py, MEDIA_STORAGE) and
+# write the resulting URL to the post / user. Clients follow GET /uploads/<job_id>/.
+# A file uploaded before (same sha256) reuses its MediaAsset URL right away.
+
+
+def spool(file):
+    """Put an uploaded file in MEDIA_SPOOL_DIR, returns (path, sha256 hex digest)."""
+    os.makedirs(settings.MEDIA_SPOOL_DIR, exist_ok=True)
+    extension = os.path.splitext(getattr(file, "name", "") or "")[1].lower()
+    path = os.path.join(settings.MEDIA_SPOOL_DIR, uuid.uuid4().hex + extension)
+    if hasattr(file, "temporary_file_path"):
+        # large uploads are already on disk: link them in instead of copying
+        link_or_copy(file.temporary_file_path(), path)
+        return path, file_sha256(path)
+
+    digest = hashlib.sha256()
+    with open(path, "wb") as out:
+        for chunk in file.chunks():
+            digest.update(chunk)
+            out.write(chunk)
+    return path, digest.hexdigest()
+
+
+def discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def enqueue_upload(user, kind, target_id, file):
+    """Queue `file` for upload; raises InvalidImage if it isn't an accepted image."""
+    check_image(file)
+    path, content_hash = spool(file)
+    asset = MediaAsset.objects.filter(content_hash=content_hash).first()
+    with transaction.atomic():
+        # an upload still waiting for the same post/user is out of date now
+        stale = UploadJob.objects.filter(kind=kind, target_id=target_id, status=UploadJob.QUEUED)
+        stale_paths = list(stale.values_list("path", flat=True))
+        stale.update(status=UploadJob.SUPERSEDED)
+        job = UploadJob.objects.create(
+            user=user, kind=kind, target_id=target_id, path=path, content_hash=content_hash
+        )
+        if asset is not None:
+            # seen this file before: no processing, no upload
+            apply_upload(job, asset.url)
+            job.status, job.url = UploadJob.DONE, asset.url
+
+    for stale_path in stale_paths:
+        discard(stale_path)
+    if asset is None and settings.UPLOAD_WORKERS > 0:
+        upload_pool.start()
+        transaction.on_commit(upload_pool.wake)
+    return job
+
+
+def job_status(job):
+    return {
+        "job_id": job.job_id,
+        "kind": job.kind,
+        "target_id": job.target_id,
+        "status": job.status,
+        "url": job.url,
+        "error": job.error,
+        "attempts": job.attempts,
+    }
+
+
+def claim_job():
+    """Atomically take the next ready job, or None."""
+    now = timezone.now()
+    candidates = (
+        UploadJob.objects.filter(status=UploadJob.QUEUED, run_after__lte=now)
+        .order_by("run_after", "job_id")
+        .values_list("job_id", flat=True)[:5]
+    )
+    for job_id in candidates:
+        # the conditional update only succeeds for one worker
+        claimed = UploadJob.objects.filter(job_id=job_id, status=UploadJob.QUEUED).update(
+            status=UploadJob.RUNNING,
+            attempts=F("attempts") + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return UploadJob.objects.get(job_id=job_id)
+    return None
+
+
+def apply_upload(job, url):
+    with transaction.atomic():
+        # a newer upload for the same post/user wins, whichever finishes first
+        newer = UploadJob.objects.filter(
+            kind=job.kind, target_id=job.target_id, job_id__gt=job.job_id
+        ).exclude(status=UploadJob.FAILED).exists()
+        if not newer:
+            if job.kind == UploadJob.POST_IMAGE:
+                BlogPost.objects.filter(post_id=job.target_id).update(
+                    image_url=url, updated_at=timezone.now()
+                )
+                bump("blogs", f"post:{job.target_id}")
+            else:
+                user = User.objects.filter(user_id=job.target_id).first()
+                if user is not None:
+                    user.profile_picture = url
+                    # save() also drops the user from the authentication cache
+                    user.save(update_fields=["profile_picture", "updated_at"])
+                bump("users")
+        UploadJob.objects.filter(job_id=job.job_id).update(
+            status=UploadJob.DONE if not newer else UploadJob.SUPERSEDED,
+            url=url,
+            error="",
+            updated_at=timezone.now(),
+        )
+        if job.content_hash:
+            MediaAsset.objects.get_or_create(content_hash=job.content_hash, defaults={"url": url})
+    discard(job.path)
+
+
+def retry_or_give_up(job, error):
+    if job.attempts >= settings.UPLOAD_MAX_ATTEMPTS:
+        UploadJob.objects.filter(job_id=job.job_id).update(
+            status=UploadJob.FAILED, error=error, updated_at=timezone.now()
+        )
+        discard(job.path)
+        return
+
+    backoff = timedelta(seconds=2 ** job.attempts)
+    UploadJob.objects.filter(job_id=job.job_id).update(
+        status=UploadJob.QUEUED,
+        run_after=timezone.now() + backoff,
+        error=error,
+        updated_at=timezone.now(),
+    )
+
+
+def prepare(job):
+    """Resize/re-encode the spooled original once; retries reuse the prepared copy."""
+    if job.prepared:
+        return
+    try:
+        path = prepare_image(job.path)
+    except Exception as e:
+        discard(job.path)
+        raise InvalidImage(f"Image could not be processed: {str(e)}")
+    discard(job.path)
+    UploadJob.objects.filter(job_id=job.job_id).update(path=path, prepared=True)
+    job.path, job.prepared = path, True
+
+
+def process_job(job, storage=None):
+    try:
+        prepare(job)
+    except InvalidImage as e:
+        # retrying won't fix a file the decoder can't read
+        UploadJob.objects.filter(job_id=job.job_id).update(
+            status=UploadJob.FAILED, error=str(e), updated_at=timezone.now()
+        )
+        return
+
+    try:
+        url = (storage or get_storage()).save(job.path)
+    except Exception as e:
+        print(f"Image upload error: {str(e)}")
+        retry_or_give_up(job, str(e))
+        return
+    apply_upload(job, url)
+
+
+def run_pending(limit=None):
+    """Upload ready jobs until the queue is empty (or `limit` jobs). Returns the count."""
+    storage = get_storage()
+    done = 0
+    while limit is None or done < limit:
+        job = claim_job()
+        if job is None:
+            break
+        process_job(job, storage)
+        done += 1
+    return done
+
+
+def requeue_stale(older_than):
+    """Put jobs left RUNNING by a crashed worker back in the queue."""
+    cutoff = timezone.now() - older_than
+    return UploadJob.objects.filter(status=UploadJob.RUNNING, updated_at__lt=cutoff).update(
+        status=UploadJob.QUEUED
+    )
+
+
+upload_pool = WorkerPool(
+    "upload",
+    size=settings.UPLOAD_WORKERS,
+    poll_interval=settings.UPLOAD_POLL_INTERVAL,
+    # one job at a time so the other workers get a turn
+    run_pending=lambda: run_pending(limit=1),
+    recover_stale=lambda: requeue_stale(timedelta(seconds=settings.UPLOAD_STALE_AFTER)),
+)
@@ -3,34 +3,45 @@ from django.contrib.auth import views as auth_views
 
 # . means call/import all the things inside the views.py
 from . import views
+from .rate_limit import rate_limited
+from .route_policy import authenticated, public
 
 # all the api calls are handled here luike signup then go to views.signup
 # if login then call views.login_api function from views
-
+# every route declares who may call it, TokenMiddleware enforces it (api/route_policy.py)
+# rate_limited() routes are limited per IP and email by RateLimitMiddleware (api/rate_limit.py)
 urlpatterns = [
-    path("signup/", views.signup_api, name="signup_api"),
-    path("login/", views.login_api, name="login_api"),
-     path("password-reset/", views.request_password_reset, name="password_reset"),
-    path(
+    public(rate_limited("signup", path("signup/", views.signup_api, name="signup_api"))),
+    public(rate_limited("login", path("login/", views.login_api, name="login_api"))),
+    public(rate_limited(
+        "password_reset",
+        path("password-reset/", views.request_password_reset, name="password_reset"),
+    )),
+    public(path(
         "password-reset-confirm/<uidb64>/<token>/",
         views.password_reset_confirm,
         name="password_reset_confirm",
-    ),
-    path("me/", views.me_api, name="me_api"),
-    path("change-password/", views.change_pass_api, name="change_password_api"), 
-    path("blogs-create/", views.blog_list_create, name="blog_create"),
-    path("blogs-update/<int:blog_id>/", views.update_blog, name="blog_update"),
-    path("blogs-list/", views.blog_list, name="blog_list"),
-    path("blogs-list/get-all-user/", views.get_all_user, name="get_all_user"),
-    path("blogs-list/users/<int:user_id>/", views.get_specific_user, name="get_specific_user"),
-    path("blogs-list/<int:user_id>/user-posts/", views.get_all_blogs_by_user, name="get_all_blogs_by_user"),
-    path("blogs-list/top-liked-posts/", views.top_liked_blog_list, name="top_liked_blog_list"),
-    path("blogs-list/most-commented-posts/", views.most_commented_blog_list, name="most_commented_blog_list"),
-    path("blogs-list/<int:post_id>/", views.blog_detail, name="blog_detail"),
-    path("blogs/<int:post_id>/like/", views.like_post, name="like_post"),
-    path("blogs/<int:post_id>/comment/", views.comment_post, name="comment_post"),
-    path("comments/<int:comment_id>/update/", views.update_comment, name="update_comment"),
-    path("comments/<int:comment_id>/delete/", views.delete_comment, name="delete_comment"),
-    path("tags/add/", views.add_tag, name="add_tag"),
-    path("list-tags/", views.list_tags, name="list_tag"),
-]
\ No newline at end of file
+    )),
+    authenticated(path("me/", views.me_api, name="me_api")),
+    authenticated(path("change-password/", views.change_pass_api, name="change_password_api")),
+    authenticated(path("blogs-create/", views.blog_list_create, name="blog_create")),
+    authenticated(path("blogs-update/<int:blog_id>/", views.update_blog, name="blog_update")),
+    public(path("blogs-list/", views.blog_list, name="blog_list")),
+    public(path("blogs-search/", views.blog_search, name="blog_search")),
+    public(path("blogs-list/tag-facets/", views.tag_facets, name="tag_facets")),
+    public(path("blogs-list/get-all-user/", views.get_all_user, name="get_all_user")),
+    public(path("blogs-list/users/<int:user_id>/", views.get_specific_user, name="get_specific_user")),
+    public(path("blogs-list/<int:user_id>/user-posts/", views.get_all_blogs_by_user, name="get_all_blogs_by_user")),
+    public(path("blogs-list/top-liked-posts/", views.top_liked_blog_list, name="top_liked_blog_list")),
+    public(path("blogs-list/most-commented-posts/", views.most_commented_blog_list, name="most_commented_blog_list")),
+    public(path("blogs-list/<int:post_id>/", views.blog_detail, name="blog_detail")),
+    authenticated(path("blogs/<int:post_id>/like/", views.like_post, name="like_post")),
+    authenticated(path("blogs/<int:post_id>/comment/", views.comment_post, name="comment_post")),
+    authenticated(path("comments/<int:comment_id>/update/", views.update_comment, name="update_comment")),
+    authenticated(path("comments/<int:comment_id>/delete/", views.delete_comment, name="delete_comment")),
+    authenticated(path("tags/add/", views.add_tag, name="add_tag")),
+    public(path("list-tags/", views.list_tags, name="list_tag")),
+    authenticated(path("moderation/stats/", views.moderation_stats, name="moderation_stats")),
+    authenticated(path("uploads/<int:job_id>/", views.upload_status, name="upload_status")),
+    public(path("media/<path:name>", views.media_file, name="media_file")),
+]
@@ -8,7 +8,7 @@ import cloudinary.uploader
 from rest_framework import status
 from rest_framework.response import Response
 from django.utils import timezone
-from datetime import datetime
+from datetime import datetime, timedelta
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.core.mail import EmailMessage
@@ -32,6 +32,7 @@ from django.shortcuts import get_object_or_404
 import google.generativeai as genai
 from django.conf import settings
 from functools import wraps
+from .response_cache import bump, cached_response
 
 
 User = get_user_model()
@@ -84,6 +85,8 @@ from django.shortcuts import get_object_or_404
 import google.generativeai as genai
 from django.conf import settings
 from functools import wraps
+from .moderation import moderate_content, moderation_client, verdict_cache
+from .prefilter import prefilter, prefilter_verdict
 
 
 User = get_user_model()
@@ -94,64 +97,7 @@ from django.conf import settings
 
 def get_available_models():
     """List all available models to find the correct name."""
-    try:
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        models = genai.list_models()
-        return [model.name for model in models]
-    except Exception as e:
-        print(f"Error listing models: {str(e)}")
-        return []
-
-def moderate_content(text):
-    """
-    Use Gemini to check content for appropriateness.
-    Returns (is_appropriate, reason) tuple.
-    """
-    try:
-        # Configure the Gemini API
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        
-        # Get available models
-        available_models = get_available_models()
-        print(f"Available models: {available_models}")
-        
-        # Find an appropriate model name
-        model_name = "gemini-1.5-flash"
-            
-        print(f"Using model: {model_name}")
-        
-        # Create a model instance with the found model name
-        model = genai.GenerativeModel(model_name)
-        
-        # Rest of your code remains the same
-        prompt = f"""
-        Analyze the following content for a blog platform and determine if it's appropriate.
-        Respond with either "APPROPRIATE" or "INAPPROPRIATE" followed by a brief reason.
-        Only respond with "INAPPROPRIATE" if the content contains:
-        - Hate speech or discriminatory content
-        - Explicit sexual content
-        - Promotion of violence or illegal activities
-        - Personal attacks or harassment
-        - Spam or deceptive content
-        
-        Content to analyze:
-        {text}
-        """
-        
-        # Generate response
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Parse response
-        if response_text.startswith("INAPPROPRIATE"):
-            reason = response_text.replace("INAPPROPRIATE", "").strip()
-            return False, reason
-        else:
-            return True, ""
-    except Exception as e:
-        # Log the error but allow content through if moderation fails
-        print(f"Content moderation error: {str(e)}")
-        return True, ""
+    return moderation_client.list_models()
 
 def content_moderation_required(view_func):
     """
@@ -1013,15 +959,27 @@ def content_moderation_required(view_func):
             # Skip moderation if no content
             if not text_to_moderate.strip():
                 return view_func(request, *args, **kwargs)
-            
-            # Moderate content
-            is_appropriate, reason = moderate_content(text_to_moderate)
+
+            if settings.MODERATION_ASYNC:
+                # Async mode: only the local pre-filter runs in the request,
+                # anything it can't decide is saved as pending_review and
+                # queued for a background worker
+                verdict = prefilter_verdict(text_to_moderate)
+                if verdict is None:
+                    request.pending_moderation = text_to_moderate
+                    return view_func(request, *args, **kwargs)
+                is_appropriate, reason = verdict
+            else:
+                # Moderate content
+                is_appropriate, reason = moderate_content(text_to_moderate)
             
             if not is_appropriate:
                 return Response(
                     {"error": f"Content moderation failed: {reason}"},
                     status=400
                 )
+            # the text was judged here, an edited post can be published again
+            request.moderation_passed = True
         
         # Content passed moderation or no content to moderate
         return view_func(request, *args, **kwargs)
@@ -1075,27 +1033,34 @@ def signup_api(request):
             except ValueError as e:
                 return JsonResponse({"error": str(e)}, status=400)
 
-            # Upload profile picture to Cloudinary if provided
-            profile_picture_url = None
+            # Only the header is read here, the picture is processed in the background
             if profile_picture:
-                upload_result = cloudinary.uploader.upload(profile_picture)
-                profile_picture_url = upload_result.get("secure_url")
-           
+                try:
+                    check_image(profile_picture)
+                except InvalidImage as e:
+                    return JsonResponse({"error": str(e)}, status=400)
+
             # Create user
             user = User.objects.create_user(
                 username=username,
                 email=email,
                 password=password,
                 name=name,
-                profile_picture=profile_picture_url,
             )
             user.is_active = True
             user.save()
+            bump("users")
+
+            # Profile picture is uploaded in the background, see api/uploads.py
+            upload = None
+            if profile_picture:
+                upload = enqueue_upload(user, UploadJob.PROFILE_PICTURE, user.user_id, profile_picture)
 
             return JsonResponse(
                 {
                     "success": "User created successfully",
-                    "profile_picture": profile_picture_url,
+                    "profile_picture": upload.url if upload else None,
+                    "profile_picture_upload": job_status(upload) if upload else None,
                 },
                 status=201,
             )
@@ -1115,6 +1080,22 @@ def signup_api(request):
     else:
         return JsonResponse({"error": "Method not allowed."}, status=405)
 
+def wants_session(request):
+    # browsable API / admin style clients ask for one or already have one
+    return (
+        str(request.data.get("session", "")).lower() in ("1", "true")
+        or settings.SESSION_COOKIE_NAME in request.COOKIES
+    )
+
+
+def touch_last_login(user):
+    now = timezone.now()
+    if user.last_login and now - user.last_login < timedelta(seconds=settings.LAST_LOGIN_UPDATE_INTERVAL):
+        return
+    # update() skips User.save(): last_login doesn't need a user cache eviction
+    User.objects.filter(pk=user.pk).update(last_login=now)
+
+
 @csrf_exempt
 @api_view(["POST"])
 def login_api(request):
@@ -1125,34 +1106,18 @@ def login_api(request):
         # Authenticate the user
         user = authenticate(username=username, password=password)
         if user is not None:
-            # Reset failed login attempts on successful login
-            FailedLoginAttempt.objects.filter(user=user).delete()
-            login(request, user)
-
-            # Check if the existing token is valid
-            if user.access_token:
-                try:
-                    # Decode the token to check its validity
-                    access_token = AccessToken(user.access_token)
-                    if access_token["exp"] > datetime.now().timestamp():
-                        return Response(
-                            {
-                                "success": "Login successful.",
-                                "access_token": user.access_token,
-                            }
-                        )
-                except Exception as e:
-                    # Token is invalid, so generate a new one
-                    pass
+            # SQLite has one writer, so a login only writes what changed:
+            # a session only for clients that use one, last_login at most
+            # once per interval; failures are counted by the rate limiter
+            rate_limiter.reset(counter_key("login", "failures", username), settings.LOGIN_FAILURE_WINDOW)
+            if wants_session(request):
+                login(request, user)
+            else:
+                touch_last_login(user)
 
-            # If token is not valid or not present, generate a new one
+            # Tokens are signed and self-contained, nothing is stored for them
             try:
-                refresh = RefreshToken.for_user(user)
-                access_token = refresh.access_token
-
-                # Save the access token to the user's record
-                user.access_token = str(access_token)
-                user.save()
+                access_token = AccessToken.for_user(user)
 
                 return Response(
                     {
@@ -1167,17 +1132,14 @@ def login_api(request):
                 )
 
         else:
-            # Handle failed login attempts
+            # Handle failed login attempts: an atomic counter, no row per attempt
             user = User.objects.filter(email=username).first()
             if user:
-                failed_attempt, created = FailedLoginAttempt.objects.get_or_create(
-                    user=user
+                failures = rate_limiter.record(
+                    counter_key("login", "failures", username), settings.LOGIN_FAILURE_WINDOW
                 )
-                failed_attempt.attempt_count += 1
-                failed_attempt.timestamp = timezone.now()
-                failed_attempt.save()
-
-                if failed_attempt.attempt_count >= 5:
+                if failures >= settings.LOGIN_FAILURES_BEFORE_RESET:
+                    # the outbox sends one mail per dedup window, not one per attempt
                     send_password_reset_email(request, user)
                     return Response(
                         {
@@ -1212,21 +1174,16 @@ def me_api(request):
 
 
 def send_password_reset_email(request, user):
-    token = default_token_generator.make_token(user)
-    uid = urlsafe_base64_encode(force_bytes(user.pk))
-    mail_subject = "Password Reset Request"
-    message = render_to_string(
-        "password_reset_email.html",
-        {
-            "user": user,
-            "domain": get_current_site(request).domain,
-            "uid": uid,
-            "token": token,
-        },
+    # sent by the outbox workers, which render the mail and its token;
+    # repeated requests within EMAIL_DEDUP_WINDOW don't queue another mail
+    queue_email(
+        OutgoingEmail.PASSWORD_RESET,
+        f"password_reset:{user.pk}",
+        user,
+        user.email,
+        "Password Reset Request",
+        {"domain": get_current_site(request).domain},
     )
-    to_email = user.email
-    email = EmailMessage(mail_subject, message, to=[to_email])
-    email.send()
     
 @api_view(["POST"])
 def logout_api(request):
@@ -1421,17 +1378,16 @@ def password_reset_confirm(request, uidb64, token):
 
 
 # Blog apis
+@cached_response("tags", "blogs")
 @api_view(["GET"])
 def list_tags(request):
-    tags = Tag.objects.all().order_by('name')
-    data = [
-        {
-            "tag_id": tag.tag_id,
-            "name": tag.name
-        }
-        for tag in tags
-    ]
-    return Response(data, status=status.HTTP_200_OK)
+    # Served from the in-process tag registry, no query unless a tag was added
+    tags = tag_registry.all()
+    # ?counts=1 adds how many published posts carry each tag
+    if request.GET.get("counts") in ("1", "true", "True"):
+        counts = tag_counts()
+        tags = [dict(tag, post_count=counts.get(tag["tag_id"], 0)) for tag in tags]
+    return Response(tags, status=status.HTTP_200_OK)
 
 @api_view(["POST"])
 @permission_classes([IsAdminUser])
@@ -1440,14 +1396,37 @@ def add_tag(request):
     if not name:
         return Response({"error": "Tag name is required."}, status=400)
 
+    # saving a tag bumps "tags" (api/tags.py)
     tag, created = Tag.objects.get_or_create(name=name)
     return Response({"message": "Tag created!", "tag_id": tag.tag_id}, status=201)
 
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def moderation_stats(request):
+    data = verdict_cache.stats()
+    data["prefilter"] = prefilter.stats()
+    return Response(data, status=status.HTTP_200_OK)
+
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-import cloudinary.uploader
-from .models import BlogPost, Tag
+from .models import BlogPost, OutgoingEmail, Tag, UploadJob
+from .pagination import paginate_blogs, decode_cursor, encode_cursor, get_page_size, InvalidCursor
+from .moderation_queue import enqueue_moderation, supersede_moderation
+from .leaderboard import leaderboard, WINDOWS
+from .listing import InvalidTagFilter, blog_row, filter_by_tags, tag_filter, with_row_relations
+from .conditional import listing_etag, post_conditional
+from .search import SearchIndexNotReady, post_changed, search_posts
+from .tags import list_field, tag_registry
+from .tag_counts import matching_tag_counts, post_status_changed, set_post_tags, tag_counts
+from .images import InvalidImage, check_image
+from .storage import LocalStorage, media_response
+from .uploads import enqueue_upload, job_status
+from .outbox import queue_email
+from .rate_limit import counter_key, rate_limiter
+from django.http import Http404
+from django.views.decorators.http import require_safe
+from django.views.decorators.http import condition
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -1458,7 +1437,6 @@ def blog_list_create(request):
             data = request.data
             title = data.get("title")
             content = data.get("content")
-            tag_ids = data.get("tags", [])
             image = request.FILES.get("image_url")  # Uploaded image file
 
             if not title or not content:
@@ -1467,35 +1445,60 @@ def blog_list_create(request):
                     status=400
                 )
 
-            # Upload image to Cloudinary if provided
-            image_url = None
+            # Tags by id (tags) and/or by name (tag_names), checked against the registry
+            tag_ids, unknown_tags = tag_registry.resolve(
+                list_field(data, "tags"), list_field(data, "tag_names")
+            )
+            if unknown_tags:
+                return Response(
+                    {"error": "Unknown tags.", "unknown_tags": unknown_tags},
+                    status=400
+                )
+
             if image:
                 try:
-                    upload_result = cloudinary.uploader.upload(image)
-                    image_url = upload_result.get("secure_url")
-                except Exception as e:
-                    return Response(
-                        {"error": f"Image upload failed: {str(e)}"}, 
-                        status=500
+                    check_image(image)
+                except InvalidImage as e:
+                    return Response({"error": str(e)}, status=400)
+
+            # Posts waiting for async moderation are not listed until published
+            pending_text = getattr(request, "pending_moderation", None)
+
+            # The post, its tags and its moderation job are saved together
+            try:
+                with transaction.atomic():
+                    blog = BlogPost.objects.create(
+                        user=request.user,
+                        title=title,
+                        content=content,
+                        status=BlogPost.PENDING_REVIEW if pending_text else BlogPost.PUBLISHED,
                     )
 
-            # Create BlogPost
-            blog = BlogPost.objects.create(
-                user=request.user,
-                title=title,
-                content=content,
-                image_url=image_url  # Store Cloudinary image URL
-            )
+                    # Attach selected tags
+                    if tag_ids:
+                        set_post_tags(blog, tag_ids, counted=blog.status == BlogPost.PUBLISHED)
 
-            # Attach selected tags
-            tags = Tag.objects.filter(tag_id__in=tag_ids)
-            blog.tags.set(tags)
+                    if pending_text:
+                        enqueue_moderation(blog, pending_text)
+            except IntegrityError:
+                # a tag was deleted after the registry check
+                return Response({"error": "Unknown tags."}, status=400)
+            bump("blogs", "users")
+            post_changed(blog.post_id)
+
+            # Image is uploaded in the background and set on the post when done
+            upload = None
+            if image:
+                upload = enqueue_upload(request.user, UploadJob.POST_IMAGE, blog.post_id, image)
 
             return Response(
                 {
                     "message": "Blog created successfully!",
                     "post_id": blog.post_id,
-                    "image_url": image_url,  # Return uploaded image URL
+                    # already set when the same image was uploaded before
+                    "image_url": upload.url if upload else None,
+                    "image_upload": job_status(upload) if upload else None,
+                    "status": blog.status,
                 },
                 status=201,
             )
@@ -1511,63 +1514,170 @@ def blog_list_create(request):
         status=405
     )
     
-from django.db.models import Count
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Prefetch, Sum
+from django.db.models.functions import Coalesce
+
+def published_blogs(request):
+    # ?tags=1,2,3&mode=any|all (or ?tag_id=), each post listed once
+    blogs = BlogPost.objects.filter(status=BlogPost.PUBLISHED)
+    tag_ids, mode = tag_filter(request.GET)
+    if tag_ids:
+        blogs = filter_by_tags(blogs, tag_ids, mode)
+    return blogs
 
+
+@cached_response("blogs")
+@condition(etag_func=listing_etag(published_blogs))
 @api_view(["GET"])
 def blog_list(request):
-    tag_id = request.GET.get("tag_id")
+    # Like/comment counts are stored on the post, no aggregate needed
+    try:
+        blogs = with_row_relations(published_blogs(request))
+    except InvalidTagFilter as e:
+        return Response(e.response_data(), status=status.HTTP_400_BAD_REQUEST)
 
-    # Filter by tag if tag_id is provided
-    blogs = BlogPost.objects.all().order_by("-created_at")
-    if tag_id:
-        blogs = blogs.filter(tags__tag_id=tag_id)
+    try:
+        blogs, next_cursor = paginate_blogs(blogs, request)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Optimize data retrieval using `annotate` to avoid extra queries
-    blogs = blogs.annotate(
-        likes_count=Count("likes"),
-        comments_count=Count("comments")
-    ).prefetch_related("tags", "user")
+    data = [blog_row(blog) for blog in blogs]
+
+    return Response({"results": data, "next": next_cursor}, status=status.HTTP_200_OK)
+
+
+@cached_response("tags", "blogs")
+@api_view(["GET"])
+def tag_facets(request):
+    # Post counts per tag for what blog_list would show with the same
+    # ?tags=&mode= (or ?tag_id=); the filter's own tags are left out
+    try:
+        tag_ids, mode = tag_filter(request.GET)
+    except InvalidTagFilter as e:
+        return Response(e.response_data(), status=status.HTTP_400_BAD_REQUEST)
+
+    if len(tag_ids) > 1:
+        # No stored counts for a combination of tags: group the matching
+        # posts, only when they are few (the response is cached until a write)
+        posts = filter_by_tags(BlogPost.objects.filter(status=BlogPost.PUBLISHED), tag_ids, mode)
+        counted = matching_tag_counts(posts, settings.TAG_FACETS_MAX_POSTS)
+        if counted is None:
+            return Response(
+                {"error": "Too many posts match these tags to count facets, narrow the filter."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        total, counts = counted
+    elif tag_ids:
+        counts = tag_counts(tag_ids[0])
+        total = counts.get(tag_ids[0], 0)
+    else:
+        counts = tag_counts()
+        total = BlogPost.objects.filter(status=BlogPost.PUBLISHED).count()
 
+    facets = [
+        dict(tag, count=counts[tag["tag_id"]])
+        for tag in tag_registry.all()
+        if counts.get(tag["tag_id"]) and tag["tag_id"] not in tag_ids
+    ]
+    facets.sort(key=lambda facet: -facet["count"])
+    return Response({"total": total, "facets": facets}, status=status.HTTP_200_OK)
+
+
+@cached_response("blogs")
+@api_view(["GET"])
+def blog_search(request):
+    # Full text search: ?q= plus optional ?tag_id= / ?user_id=, BM25 ranked
+    q = request.GET.get("q", "").strip()
+    if not q:
+        return Response({"error": "q is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        tag_id = int(request.GET["tag_id"]) if request.GET.get("tag_id") else None
+        user_id = int(request.GET["user_id"]) if request.GET.get("user_id") else None
+    except ValueError:
+        return Response(
+            {"error": "tag_id and user_id must be integers."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        hits, next_cursor = search_posts(
+            q,
+            get_page_size(request),
+            tag_id=tag_id,
+            user_id=user_id,
+            cursor=request.GET.get("cursor"),
+        )
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except SearchIndexNotReady as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": "5"},
+        )
+
+    blogs = with_row_relations(
+        BlogPost.objects.filter(post_id__in=[hit["post_id"] for hit in hits])
+    )
+    blogs_by_id = {blog.post_id: blog for blog in blogs}
     data = [
-        {
-            "post_id": blog.post_id,
-            "title": blog.title,
-            "content": blog.content,
-            "user": blog.user.email,
-            "tags": list(blog.tags.values_list("name", flat=True)),  # Optimized way to get tag names
-            "likes": blog.likes_count,
-            "comments": blog.comments_count,
-            "created_at": blog.created_at,
-            "image_url": blog.image_url,
-        }
-        for blog in blogs
+        dict(
+            blog_row(blogs_by_id[hit["post_id"]]),
+            title_highlight=hit["title"],
+            snippet=hit["snippet"],
+            score=round(-hit["rank"], 4),
+        )
+        for hit in hits
+        if hit["post_id"] in blogs_by_id
     ]
 
-    return Response(data, status=status.HTTP_200_OK)
+    return Response({"results": data, "next": next_cursor}, status=status.HTTP_200_OK)
     
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def like_post(request, post_id):
-    blog = get_object_or_404(BlogPost, post_id=post_id)
-    like, created = Like.objects.get_or_create(post=blog, user=request.user)
+    # Posts waiting for moderation (or rejected) can't be liked
+    blog = get_object_or_404(BlogPost, post_id=post_id, status=BlogPost.PUBLISHED)
 
-    if not created:
-        like.delete()
-        return Response({"message": "Like removed!"}, status=200)
+    with transaction.atomic():
+        like, created = Like.objects.get_or_create(post=blog, user=request.user)
+
+        bump("blogs", "users", f"post:{blog.post_id}")
+
+        if not created:
+            like.delete()
+            BlogPost.objects.filter(post_id=blog.post_id).update(
+                likes_count=F("likes_count") - 1, updated_at=timezone.now()
+            )
+            leaderboard.record(blog.post_id, "likes", -1, like.created_at)
+            return Response({"message": "Like removed!"}, status=200)
+
+        BlogPost.objects.filter(post_id=blog.post_id).update(
+            likes_count=F("likes_count") + 1, updated_at=timezone.now()
+        )
+        leaderboard.record(blog.post_id, "likes", 1, like.created_at)
 
     return Response({"message": "Post liked!"}, status=200)
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def comment_post(request, post_id):
-    blog = get_object_or_404(BlogPost, post_id=post_id)
+    blog = get_object_or_404(BlogPost, post_id=post_id, status=BlogPost.PUBLISHED)
     text = request.data.get("text")
 
     if not text:
         return Response({"error": "Comment text is required."}, status=400)
 
-    comment = Comment.objects.create(post=blog, user=request.user, text=text)
+    with transaction.atomic():
+        comment = Comment.objects.create(post=blog, user=request.user, text=text)
+        BlogPost.objects.filter(post_id=blog.post_id).update(
+            comments_count=F("comments_count") + 1, updated_at=timezone.now()
+        )
+        leaderboard.record(blog.post_id, "comments", 1, comment.created_at)
+        bump("blogs", f"post:{blog.post_id}")
     return Response({"message": "Comment added!", "comment_id": comment.comment_id}, status=201)
 
 @api_view(["PUT"])
@@ -1580,6 +1690,9 @@ def update_comment(request, comment_id):
 
     comment.text = request.data.get("text", comment.text)
     comment.save()
+    # the post's ETag/Last-Modified come from its updated_at
+    BlogPost.objects.filter(post_id=comment.post_id).update(updated_at=timezone.now())
+    bump(f"post:{comment.post_id}")
     return Response({"message": "Comment updated!"}, status=200)
 
 @api_view(["DELETE"])
@@ -1590,12 +1703,76 @@ def delete_comment(request, comment_id):
     if request.user != comment.user:
         return Response({"error": "You can only delete your own comments."}, status=403)
 
-    comment.delete()
+    with transaction.atomic():
+        comment.delete()
+        BlogPost.objects.filter(post_id=comment.post_id).update(
+            comments_count=F("comments_count") - 1, updated_at=timezone.now()
+        )
+        leaderboard.record(comment.post_id, "comments", -1, comment.created_at)
+        bump("blogs", f"post:{comment.post_id}")
     return Response({"message": "Comment deleted!"}, status=200)
 
+@cached_response("post:{post_id}")
+@post_conditional
 @api_view(["GET"])
 def blog_detail(request, post_id):
-    blog = get_object_or_404(BlogPost, post_id=post_id)
+    # Likes are embedded newest first, all of them unless ?likes_limit= is given
+    likes = Like.objects.select_related("user").only(
+        "like_id", "post_id", "user__user_id", "user__email", "user__username"
+    ).order_by("-like_id")
+    if "likes_limit" in request.GET:
+        likes = likes[:get_page_size(request, "likes_limit")]
+
+    # Comments are embedded oldest first; ?comments_cursor= / ?comments_limit= page them
+    comments = Comment.objects.select_related("user").only(
+        "comment_id", "post_id", "text", "created_at",
+        "user__user_id", "user__email", "user__username",
+    ).order_by("created_at", "comment_id")
+    page_comments = "comments_cursor" in request.GET or "comments_limit" in request.GET
+    if page_comments:
+        comments_limit = get_page_size(
+            request, "comments_limit", settings.BLOG_DETAIL_COMMENTS_PAGE_SIZE
+        )
+        cursor = request.GET.get("comments_cursor")
+        if cursor:
+            try:
+                created_at, comment_id = decode_cursor(cursor)
+            except InvalidCursor as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            comments = comments.filter(
+                Q(created_at__gt=created_at)
+                | Q(created_at=created_at, comment_id__gt=comment_id)
+            )
+        # one extra row tells whether there is a next page
+        comments = comments[:comments_limit + 1]
+
+    # One query for the post and its author, one each for tags, likes and comments
+    blog = get_object_or_404(
+        BlogPost.objects.select_related("user")
+        .only(
+            "post_id", "title", "content", "created_at", "status",
+            "likes_count", "comments_count",
+            "user__user_id", "user__email", "user__username",
+        )
+        .prefetch_related(
+            Prefetch("tags", queryset=Tag.objects.only("tag_id", "name")),
+            Prefetch("likes", queryset=likes, to_attr="embedded_likes"),
+            Prefetch("comments", queryset=comments, to_attr="embedded_comments"),
+        ),
+        post_id=post_id,
+    )
+
+    # Unpublished posts are only visible to their author
+    if blog.status != BlogPost.PUBLISHED and request.user.pk != blog.user_id:
+        return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    embedded_comments = blog.embedded_comments
+    comments_next = None
+    if page_comments and len(embedded_comments) > comments_limit:
+        embedded_comments = embedded_comments[:comments_limit]
+        last = embedded_comments[-1]
+        comments_next = encode_cursor(last.created_at, last.comment_id)
+
     data = {
         "post_id": blog.post_id,
         "title": blog.title,
@@ -1603,84 +1780,76 @@ def blog_detail(request, post_id):
         "user": blog.user.email,
         "username": blog.user.username,
         "tags": [tag.name for tag in blog.tags.all()],
-        "likes": blog.likes.count(),
+        "likeCount": blog.likes_count,
         "likes":[
                     {"user": like.user.email,"username":like.user.username}
-                    for like in blog.likes.all()
+                    for like in blog.embedded_likes
                 ],
-        "commentCount": blog.comments.count(),
+        "commentCount": blog.comments_count,
         "comments": [
                     {"comment_id":comment.comment_id,"user": comment.user.email,"username":comment.user.username, "text": comment.text}
-                    for comment in blog.comments.all()
+                    for comment in embedded_comments
                 ],
+        "comments_next": comments_next,
         "created_at": blog.created_at,
+        "status": blog.status,
     }
     return Response(data, status=status.HTTP_200_OK)
 
 
-@api_view(["GET"])
-def top_liked_blog_list(request):
-    # Fetch top 10 most liked blogs, optimized with annotation
-    blogs = (
-        BlogPost.objects.annotate(
-            likes_count=Count("likes"),
-            comments_count=Count("comments")
+def leaderboard_response(request, metric):
+    window = request.GET.get("window", "all")
+    if window not in WINDOWS:
+        return Response(
+            {"error": f"window must be one of: {', '.join(WINDOWS)}."},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-        .prefetch_related("tags", "user")
-        .order_by("-likes_count")[:10]  # Sort by most likes and limit to 10
-    )
 
-    data = [
-        {
-            "post_id": blog.post_id,
-            "title": blog.title,
-            "content": blog.content,
-            "user": blog.user.email,
-            "tags": list(blog.tags.values_list("name", flat=True)),
-            "likes": blog.likes_count,
-            "comments": blog.comments_count,
-            "created_at": blog.created_at,
-            "image_url": blog.image_url,
-        }
-        for blog in blogs
+    try:
+        limit = int(request.GET.get("limit", settings.LEADERBOARD_SIZE))
+    except ValueError:
+        limit = settings.LEADERBOARD_SIZE
+    limit = max(1, limit)
+
+    # Ranking comes from the in-memory leaderboard, only the K posts are loaded
+    ranking = leaderboard.top(metric, window, limit)
+    # a post unpublished in another process is still ranked there until its refresh
+    blogs = with_row_relations(
+        BlogPost.objects.filter(
+            post_id__in=[post_id for post_id, score in ranking], status=BlogPost.PUBLISHED
+        )
+    )
+    blogs_by_id = {blog.post_id: blog for blog in blogs}
+    ranked = [
+        (blogs_by_id[post_id], score)
+        for post_id, score in ranking
+        if post_id in blogs_by_id
     ]
 
+    data = [dict(blog_row(blog), score=score) for blog, score in ranked]
+
     return Response(data, status=status.HTTP_200_OK)
+
+
+@cached_response("blogs")
+@api_view(["GET"])
+def top_liked_blog_list(request):
+    # Top K most liked blogs (?window=all|7d|24h)
+    return leaderboard_response(request, "likes")
    
 
+@cached_response("blogs")
 @api_view(["GET"])
 def most_commented_blog_list(request):
-    blogs = (
-        BlogPost.objects.annotate(
-            likes_count=Count("likes"),
-            comments_count=Count("comments")
-        )
-        .prefetch_related("tags", "user")
-        .order_by("-comments_count")[:10]  # Sort by most comments and limit to 10
-    )
-
-    data = [
-        {
-            "post_id": blog.post_id,
-            "title": blog.title,
-            "content": blog.content,
-            "user": blog.user.email,
-            "tags": list(blog.tags.values_list("name", flat=True)),
-            "likes": blog.likes_count,
-            "comments": blog.comments_count,
-            "created_at": blog.created_at,
-            "image_url": blog.image_url,
-        }
-        for blog in blogs
-    ]
-
-    return Response(data, status=status.HTTP_200_OK)
+    # Top K most commented blogs (?window=all|7d|24h)
+    return leaderboard_response(request, "comments")
 
+@cached_response("users")
 @api_view(["GET"])
 def get_all_user(request):
     # Get all users with annotation for total likes and post count
     users = User.objects.annotate(
-        total_likes=Count('blog_posts__likes'),
+        total_likes=Coalesce(Sum('blog_posts__likes_count'), 0),
         posts_count=Count('blog_posts')
     ).order_by('-total_likes')
     
@@ -1706,7 +1875,7 @@ def get_all_user(request):
 def get_specific_user(request, user_id):
     # Filter users based on user_id if provided, else get all users
     users = User.objects.annotate(
-        total_likes=Count('blog_posts__likes'),
+        total_likes=Coalesce(Sum('blog_posts__likes_count'), 0),
         posts_count=Count('blog_posts')
     )
 
@@ -1734,6 +1903,11 @@ def get_specific_user(request, user_id):
     return Response(data if user_id is None else data[0], status=status.HTTP_200_OK)
 
 
+def user_published_blogs(request, user_id):
+    return BlogPost.objects.filter(user_id=user_id, status=BlogPost.PUBLISHED)
+
+
+@condition(etag_func=listing_etag(user_published_blogs))
 @api_view(["GET"])
 def get_all_blogs_by_user(request,user_id):
     if not user_id:
@@ -1746,34 +1920,17 @@ def get_all_blogs_by_user(request,user_id):
     user = get_object_or_404(User, user_id=user_id)
     
     # Fetch all blogs by this user with optimized queries
-    blogs = (
-        BlogPost.objects.filter(user=user)
-        .annotate(
-            likes_count=Count("likes"),
-            comments_count=Count("comments")
-        )
-        .prefetch_related("tags")
-        .order_by("-created_at")
-    )
+    blogs = with_row_relations(user_published_blogs(request, user.user_id))
+
+    try:
+        blogs, next_cursor = paginate_blogs(blogs, request)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
     # Format the response data
-    data = [
-        {
-            "post_id": blog.post_id,
-            "title": blog.title,
-            "content": blog.content,
-            "user": user.email,
-            "username": user.username,
-            "tags": list(blog.tags.values_list("name", flat=True)),
-            "likes": blog.likes_count,
-            "comments": blog.comments_count,
-            "created_at": blog.created_at,
-            "image_url": blog.image_url,
-        }
-        for blog in blogs
-    ]
+    data = [blog_row(blog) for blog in blogs]
     
-    return Response(data, status=status.HTTP_200_OK)
+    return Response({"results": data, "next": next_cursor}, status=status.HTTP_200_OK)
 
 @api_view(["PUT"])
 @permission_classes([IsAuthenticated])
@@ -1794,45 +1951,103 @@ def update_blog(request, blog_id):
         data = request.data
         title = data.get("title")
         content = data.get("content")
-        tag_ids = data.get("tags", [])
         image = request.FILES.get("image_url")  # New image file, if provided
+
+        tag_ids, unknown_tags = tag_registry.resolve(
+            list_field(data, "tags"), list_field(data, "tag_names")
+        )
+        if unknown_tags:
+            return Response(
+                {"error": "Unknown tags.", "unknown_tags": unknown_tags},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if image:
+            try:
+                check_image(image)
+            except InvalidImage as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         # Update fields if provided
         if title:
             blog.title = title
         if content:
             blog.content = content
+
+        # Edited posts go back to review when moderation runs async, and are
+        # published (over any older verdict) when the text was judged here
+        was_published = blog.status == BlogPost.PUBLISHED
+        pending_text = getattr(request, "pending_moderation", None)
+        moderation_passed = getattr(request, "moderation_passed", False)
+        if pending_text:
+            blog.status = BlogPost.PENDING_REVIEW
+        elif moderation_passed:
+            blog.status = BlogPost.PUBLISHED
+            blog.moderation_reason = ""
             
-        # Handle image update if a new image is provided
+        try:
+            with transaction.atomic():
+                # Update tags if provided
+                if tag_ids:
+                    set_post_tags(blog, tag_ids, counted=was_published)
+
+                # Save the updated blog post
+                blog.save()
+                post_status_changed(blog.post_id, was_published, blog.status == BlogPost.PUBLISHED)
+                if was_published != (blog.status == BlogPost.PUBLISHED):
+                    leaderboard.status_changed(blog.post_id)
+
+                if pending_text:
+                    enqueue_moderation(blog, pending_text)
+                elif moderation_passed:
+                    # a queued job would judge the old text
+                    supersede_moderation(blog)
+        except IntegrityError:
+            # a tag was deleted after the registry check
+            return Response(
+                {"error": "Unknown tags."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        bump("blogs", f"post:{blog.post_id}")
+        post_changed(blog.post_id)
+
+        # A new image replaces the current one once its background upload is done
+        upload = None
         if image:
-            try:
-                upload_result = cloudinary.uploader.upload(image)
-                blog.image_url = upload_result.get("secure_url")
-            except Exception as e:
-                return Response(
-                    {"error": f"Image upload failed: {str(e)}"}, 
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-                
-        # Update tags if provided
-        if tag_ids:
-            tags = Tag.objects.filter(tag_id__in=tag_ids)
-            blog.tags.set(tags)
-            
-        # Save the updated blog post
-        blog.save()
+            upload = enqueue_upload(request.user, UploadJob.POST_IMAGE, blog.post_id, image)
         
         return Response({
             "message": "Blog post updated successfully!",
             "post_id": blog.post_id,
             "title": blog.title,
             "content": blog.content,
-            "image_url": blog.image_url,
-            "tags": list(blog.tags.values_list("name", flat=True))
+            "image_url": upload.url if upload and upload.url else blog.image_url,
+            "image_upload": job_status(upload) if upload else None,
+            "tags": list(blog.tags.values_list("name", flat=True)),
+            "status": blog.status,
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
         return Response(
             {"error": f"An error occurred: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def upload_status(request, job_id):
+    # Background image uploads started by this user (signup, blog create/update)
+    job = UploadJob.objects.filter(job_id=job_id, user=request.user).first()
+    if job is None:
+        return Response({"error": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(job_status(job), status=status.HTTP_200_OK)
+
+
+@require_safe
+def media_file(request, name):
+    # Images stored with MEDIA_STORAGE=local, Range requests included
+    if settings.MEDIA_STORAGE != "local":
+        raise Http404
+    path = LocalStorage(settings.MEDIA_ROOT, settings.MEDIA_URL).path(name)
+    if path is None:
+        raise Http404
+    return media_response(request, path)
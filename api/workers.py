@@ -0,0 +1,92 @@
+import threading
+from time import monotonic
+
+from django.db import close_old_connections, connection
+
+# in-process daemon threads draining a job table
+# used by the moderation queue (api/moderation_queue.py), the upload queue
+# (api/uploads.py) and the email outbox (api/outbox.py)
+
+
+class WorkerPool:
+    """
+    `size` threads calling run_pending() (returns how many jobs it did) until
+    it finds nothing, then recover_stale() and sleep up to `poll_interval`
+    seconds or until wake().
+
+    With `batch_max_wait` set, a worker woken up waits up to that many
+    seconds for `batch_size` wake() calls before running, so a burst of
+    jobs is handled in one batch.
+    """
+
+    def __init__(self, name, size, poll_interval, run_pending, recover_stale, batch_size=1, batch_max_wait=0):
+        self.name = name
+        self.size = size
+        self.poll_interval = poll_interval
+        self.run_pending = run_pending
+        self.recover_stale = recover_stale
+        self.batch_size = batch_size
+        self.batch_max_wait = batch_max_wait
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        # jobs enqueued in this process since the workers last gathered a batch
+        self._arrived = 0
+        self._arrivals = threading.Condition()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.size):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def wake(self):
+        with self._arrivals:
+            self._arrived += 1
+            self._arrivals.notify_all()
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        with self._arrivals:
+            self._arrivals.notify_all()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join()
+
+    def _gather_batch(self):
+        deadline = monotonic() + self.batch_max_wait
+        with self._arrivals:
+            while self._arrived < self.batch_size and not self._stopping.is_set():
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                self._arrivals.wait(remaining)
+            self._arrived = 0
+
+    def _run(self):
+        while not self._stopping.is_set():
+            close_old_connections()
+            try:
+                processed = self.run_pending()
+            except Exception as e:
+                print(f"{self.name.capitalize()} worker error: {str(e)}")
+                processed = 0
+
+            if not processed:
+                try:
+                    self.recover_stale()
+                except Exception as e:
+                    print(f"{self.name.capitalize()} worker error: {str(e)}")
+                woken = self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                if woken and self.batch_max_wait > 0:
+                    self._gather_batch()
+        connection.close()
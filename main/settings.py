@@ -17,6 +17,9 @@ import os
 load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
+# files the app writes at runtime (search snapshot, caches, uploads), kept out
+# of the source tree
+VAR_DIR = Path(os.getenv("VAR_DIR", BASE_DIR / "var"))
 
 
 # Quick-start development settings - unsuitable for production
@@ -60,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.RateLimitMiddleware',
     'api.middleware.TokenMiddleware',
 ]
 CORS_ALLOW_ALL_ORIGINS = True
@@ -101,6 +105,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # background workers write too: take the write lock up front and wait
+        # for it instead of failing with "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -160,7 +170,7 @@ AUTH_USER_MODEL = 'api.User'
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "api.authentication.SharedJWTAuthentication",
     ),
 }
 from datetime import timedelta
@@ -182,4 +192,169 @@ SIMPLE_JWT = {
     "USER_ID_CLAIM": os.getenv("JWT_USER_ID_CLAIM"),
     "AUTH_TOKEN_CLASSES": (os.getenv("JWT_AUTH_TOKEN_CLASSES"),),
     "TOKEN_TYPE_CLAIM": os.getenv("JWT_TOKEN_TYPE_CLAIM"),
-}
\ No newline at end of file
+}
+
+# blog listing pagination (cursor based)
+BLOG_PAGE_SIZE = int(os.getenv("BLOG_PAGE_SIZE", 20))
+BLOG_MAX_PAGE_SIZE = int(os.getenv("BLOG_MAX_PAGE_SIZE", 100))
+# comments embedded in blog_detail when ?comments_cursor= / ?comments_limit= is used
+BLOG_DETAIL_COMMENTS_PAGE_SIZE = int(os.getenv("BLOG_DETAIL_COMMENTS_PAGE_SIZE", 20))
+
+# content moderation
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+# seconds between model discovery calls (genai.list_models), 0 disables the check
+GEMINI_MODEL_DISCOVERY_INTERVAL = int(os.getenv("GEMINI_MODEL_DISCOVERY_INTERVAL", 3600))
+# verdict cache: in-process LRU size, DB row cap and TTL in seconds
+MODERATION_CACHE_SIZE = int(os.getenv("MODERATION_CACHE_SIZE", 1024))
+MODERATION_CACHE_DB_MAX_ENTRIES = int(os.getenv("MODERATION_CACHE_DB_MAX_ENTRIES", 100000))
+MODERATION_CACHE_TTL = int(os.getenv("MODERATION_CACHE_TTL", 7 * 24 * 3600))
+# when on, posts are saved as pending_review and moderated by background workers
+MODERATION_ASYNC = os.getenv("MODERATION_ASYNC", "False") == "True"
+# in-process worker threads (0 = only the moderation_worker management command)
+MODERATION_WORKERS = int(os.getenv("MODERATION_WORKERS", 2))
+MODERATION_POLL_INTERVAL = float(os.getenv("MODERATION_POLL_INTERVAL", 1.0))
+MODERATION_MAX_ATTEMPTS = int(os.getenv("MODERATION_MAX_ATTEMPTS", 5))
+# seconds after which a job left running by a dead worker is queued again
+MODERATION_STALE_AFTER = int(os.getenv("MODERATION_STALE_AFTER", 300))
+# batched moderation: texts per model call and how long a worker waits to fill a batch
+MODERATION_BATCH_SIZE = int(os.getenv("MODERATION_BATCH_SIZE", 10))
+MODERATION_BATCH_MAX_WAIT = float(os.getenv("MODERATION_BATCH_MAX_WAIT", 0.5))
+# local pre-filter in front of the moderation model (api/prefilter.py)
+MODERATION_PREFILTER = os.getenv("MODERATION_PREFILTER", "True") == "True"
+MODERATION_PREFILTER_REJECT_SCORE = float(os.getenv("MODERATION_PREFILTER_REJECT_SCORE", 0.8))
+MODERATION_PREFILTER_ACCEPT_SCORE = float(os.getenv("MODERATION_PREFILTER_ACCEPT_SCORE", 0.2))
+# links per word at which the link part of the spam score saturates
+MODERATION_PREFILTER_MAX_LINK_DENSITY = float(os.getenv("MODERATION_PREFILTER_MAX_LINK_DENSITY", 0.1))
+# comma separated additions to the built-in term lists
+MODERATION_PREFILTER_EXTRA_BLOCKED = os.getenv("MODERATION_PREFILTER_EXTRA_BLOCKED", "")
+MODERATION_PREFILTER_EXTRA_SENSITIVE = os.getenv("MODERATION_PREFILTER_EXTRA_SENSITIVE", "")
+
+# top liked / most commented leaderboards (K posts, rebuilt at most every N seconds)
+# `manage.py refresh_leaderboards` saves them for cold starts every N seconds
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", 10))
+LEADERBOARD_REFRESH_INTERVAL = int(os.getenv("LEADERBOARD_REFRESH_INTERVAL", 300))
+
+# response cache for anonymous reads of the public endpoints (api/response_cache.py)
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "True") == "True"
+# file (RESPONSE_CACHE_LOCATION is a directory), redis (RESPONSE_CACHE_LOCATION
+# is a redis:// URL, any Redis compatible server) or locmem. The version stamps
+# live here too, so the web processes and the worker commands (moderation,
+# uploads) must share it: locmem is per process and only fits a single
+# process running its workers as threads.
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "file")
+RESPONSE_CACHE_LOCATION = os.getenv("RESPONSE_CACHE_LOCATION", "")
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 300))
+# seconds a concurrent miss waits for another process to fill the same entry
+RESPONSE_CACHE_LOCK_TIMEOUT = float(os.getenv("RESPONSE_CACHE_LOCK_TIMEOUT", 5))
+RESPONSE_CACHE_ALIAS = "responses"
+
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+}
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    RESPONSE_CACHE_ALIAS: {
+        "BACKEND": CACHE_BACKENDS[RESPONSE_CACHE_BACKEND],
+        "LOCATION": RESPONSE_CACHE_LOCATION or {
+            "locmem": "responses",
+            "file": str(VAR_DIR / "response_cache"),
+            "redis": "redis://127.0.0.1:6379/1",
+        }[RESPONSE_CACHE_BACKEND],
+    },
+}
+if RESPONSE_CACHE_BACKEND != "redis":
+    CACHES[RESPONSE_CACHE_ALIAS]["OPTIONS"] = {
+        "MAX_ENTRIES": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10000)),
+    }
+
+# full text search: "fts5", "memory" (pure-Python inverted index, for SQLite
+# builds without FTS5) or "auto" (fts5 when migration 0008 could create it)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+# snapshot the memory index is loaded from at startup ("" = always rebuild)
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", str(VAR_DIR / "search_index.bin"))
+# seconds between catch-ups with posts changed by other processes
+SEARCH_INDEX_SYNC_INTERVAL = float(os.getenv("SEARCH_INDEX_SYNC_INTERVAL", 5))
+
+# ?tags= filters that read at most this many posts from blog_post_tags start
+# there and sort; larger ones walk the listing index (api/listing.py)
+TAG_FILTER_SORT_LIMIT = int(os.getenv("TAG_FILTER_SORT_LIMIT", 5000))
+# tag facets for several tags are grouped per request (single tags read the
+# stored counts), only when at most this many posts match; more answer 400
+TAG_FACETS_MAX_POSTS = int(os.getenv("TAG_FACETS_MAX_POSTS", 5000))
+
+# authenticated users are kept in process for this many seconds (0 disables)
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 30))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+
+# token-only logins (no session) record last_login at most this often, in seconds
+LAST_LOGIN_UPDATE_INTERVAL = int(os.getenv("LAST_LOGIN_UPDATE_INTERVAL", 3600))
+
+# where uploaded images are stored (api/storage.py): "cloudinary", "local"
+# (files under MEDIA_ROOT, this app serves them at /media/; MEDIA_URL may point
+# to another server for the same directory instead) or "fake" (tests)
+MEDIA_STORAGE = os.getenv("MEDIA_STORAGE", "cloudinary")
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", str(VAR_DIR / "media"))
+MEDIA_URL = os.getenv("MEDIA_URL", "/media/")
+# uploaded files wait here until a worker has sent them
+MEDIA_SPOOL_DIR = os.getenv("MEDIA_SPOOL_DIR", str(VAR_DIR / "upload_spool"))
+# in-process upload threads (0 = only the upload_worker management command)
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 2))
+UPLOAD_POLL_INTERVAL = float(os.getenv("UPLOAD_POLL_INTERVAL", 1.0))
+# failed uploads are retried with exponential backoff, then the job is marked failed
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", 5))
+# seconds after which a job left running by a dead worker is queued again
+UPLOAD_STALE_AFTER = int(os.getenv("UPLOAD_STALE_AFTER", 300))
+# uploaded images are resized to fit these bounds and re-encoded (api/images.py)
+IMAGE_MAX_WIDTH = int(os.getenv("IMAGE_MAX_WIDTH", 1600))
+IMAGE_MAX_HEIGHT = int(os.getenv("IMAGE_MAX_HEIGHT", 1600))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", 85))
+# images with more pixels than this are refused before decoding
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 50_000_000))
+
+# outgoing mail is queued (api/outbox.py) and sent by worker threads
+# (0 = only the outbox_worker management command)
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", 1))
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", 1.0))
+# mails sent over one SMTP connection
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 50))
+# failed sends are retried with exponential backoff, then the mail is marked failed
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+# seconds after which a mail left sending by a dead worker is queued again
+EMAIL_STALE_AFTER = int(os.getenv("EMAIL_STALE_AFTER", 300))
+# a mail with the same dedup key (e.g. one password reset per user) is not
+# queued again within this many seconds
+EMAIL_DEDUP_WINDOW = int(os.getenv("EMAIL_DEDUP_WINDOW", 300))
+# sent and failed mails are deleted after this many seconds (keep it longer
+# than the dedup window)
+EMAIL_RETENTION = int(os.getenv("EMAIL_RETENTION", 7 * 24 * 3600))
+
+# requests allowed per client IP / per submitted email, as "count/seconds"
+# ("" turns a limit off); routes opt in with rate_limited() (api/rate_limit.py)
+RATE_LIMITS = {
+    "login": {
+        "ip": os.getenv("RATE_LIMIT_LOGIN_IP", "30/60"),
+        "account": os.getenv("RATE_LIMIT_LOGIN_ACCOUNT", "10/300"),
+    },
+    "signup": {
+        "ip": os.getenv("RATE_LIMIT_SIGNUP_IP", "10/3600"),
+    },
+    "password_reset": {
+        "ip": os.getenv("RATE_LIMIT_PASSWORD_RESET_IP", "10/3600"),
+        "account": os.getenv("RATE_LIMIT_PASSWORD_RESET_ACCOUNT", "3/3600"),
+    },
+}
+# where the counters live: "memory" (per process), "database" (the SQLite
+# file, shared by all processes) or "cache" (RATE_LIMIT_CACHE, e.g. Redis)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_CACHE = os.getenv("RATE_LIMIT_CACHE", RESPONSE_CACHE_ALIAS)
+# keys the memory backend keeps, least recently used go first
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+# reverse proxies in front of the app; the client IP is then read from X-Forwarded-For
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", 0))
+# this many failed logins for an account within the window send it a password reset mail
+LOGIN_FAILURES_BEFORE_RESET = int(os.getenv("LOGIN_FAILURES_BEFORE_RESET", 5))
+LOGIN_FAILURE_WINDOW = int(os.getenv("LOGIN_FAILURE_WINDOW", 900))
@@ -2,11 +2,14 @@
 from django.contrib import admin
 from django.urls import path,include
 
+from api.route_policy import public
+
 urlpatterns = [
     
     # if https://127.0.0.0.1:8000/admin === opens admin page
     # django has inbuilt admin page
-    path('admin/', admin.site.urls),
+    # admin has its own login (session based)
+    public(path('admin/', admin.site.urls)),
     
     #if no url extension means https://127.0.0.0.1:8000/
     # Goes inside api (django-app) urls
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
 
 application = get_wsgi_application()
+
+# load or build the in-process search index before the first search (api/search.py)
+from api.search import warm_up  # noqa: E402
+
+warm_up()